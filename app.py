@@ -1,59 +1,61 @@
 # app.py
-import os, io, json, base64, math, sqlite3
+import os, io, json, base64, sqlite3, unicodedata
+from urllib.parse import quote
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, send_file, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, session, jsonify
 from functools import wraps
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
-from reportlab.pdfbase.pdfmetrics import stringWidth
-from reportlab.lib.utils import ImageReader
 from PIL import Image
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 
-# Database path
-DATABASE = "inair_reportes.db"
-
-
 # Import database functions
 from database import (
-    init_db, get_all_users, get_user_by_username, create_user, delete_user,
-    get_all_reports, get_report_by_folio, save_report, search_reports,
+    init_db, release_db, get_all_users, get_user_by_username, create_user, delete_user,
+    get_report_by_folio, save_report, get_reports_page, REPORTS_PAGE_SIZE,
     get_next_folio, get_dashboard_stats,
     get_all_clients, get_client_by_id, create_client, update_client, delete_client,
     add_client_equipment, get_client_equipment, get_equipment_by_id,
     update_client_equipment, delete_client_equipment,
     get_equipment_types_by_client, get_models_by_client_and_type,
+    # Maintenance calendar functions
+    get_calendar_equipment_by_client, get_calendar_equipment, get_calendar_equipment_by_id,
+    create_calendar_equipment, update_calendar_equipment, deactivate_calendar_equipment,
+    get_equipment_kits, get_kits_by_equipment, replace_equipment_kits,
+    get_equipment_service_history, get_month_report_folios,
+    get_parts_catalog, create_catalog_part, delete_catalog_part, get_equipment_custom_parts,
+    CALENDAR_EQUIPMENT_FIELDS,
     # Draft report functions
     save_draft_report, get_draft_by_folio, get_all_drafts, delete_draft,
-    mark_draft_as_sent, update_draft_pdf
+    mark_draft_as_sent, update_draft_pdf, update_draft_form_data, get_draft_pdf_cache_key,
+    apply_draft_patch, store_draft_blob, attach_draft_image, BlobRefError,
+    # Resumable upload functions
+    create_draft_upload, get_draft_upload, advance_draft_upload, finish_draft_upload,
+    get_draft_meta, get_draft_form_data, get_draft_image, get_draft_pdf, open_draft_pdf,
+    DRAFT_IMAGE_COLUMNS,
+    # PDF queue functions
+    enqueue_pdf_job, get_pdf_job
 )
+from catalogos import LISTA_EQUIPOS, DG_LABELS, OF_LABELS, E3, E1
+from pdf_renderer import parse_report, spool_report_pdf, report_cache_key, PHOTO_W, PHOTO_H
+from archivos import persist_report_files
+from blobs import (
+    load_data_url, load_bytes, mime_of, is_ref, ref_hash, make_ref, decode as decode_image,
+    write_partial, partial_digest, discard_partial
+)
+from imagenes import ingest_photo, thumbnail
 
-# ===== Helpers para unidades y tipos de equipo =====
-def _is_oilfree(tipo_equipo: str) -> bool:
-    """True si el tipo de equipo contiene 'libre de aceite'."""
-    return "libre de aceite" in (tipo_equipo or "").lower()
-
-def _is_secador(tipo_equipo: str) -> bool:
-    """True si el tipo de equipo es un secador."""
-    return "secador" in (tipo_equipo or "").lower()
+# PDF_QUEUE=1: /generar_pdf solo encola y los workers de pdf_queue.py renderizan
+PDF_QUEUE = os.environ.get("PDF_QUEUE") == "1"
 
-def _join_val_unit(val: str, unit: str) -> str:
-    """
-    Une valor y unidad como 'valor (unidad)'. Usa N/A si faltan.
-    Si tu HTML no envía unidades, esto seguirá mostrando algo válido.
-    """
-    v = (val or "").strip() or "N/A"
-    u = (unit or "").strip() or "N/A"
-    return f"{v} ({u})"
+# Subidas por pedazos (/api/uploads): tamaño máximo de la foto y de cada pedazo
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(30 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 256 * 1024
+UPLOAD_MAX_CHUNK_BYTES = 4 * 1024 * 1024
 
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(APP_ROOT, "data")
-UPLOAD_DIR = os.path.join(APP_ROOT, "static", "uploads")
-FIRMAS_DIR = os.path.join(APP_ROOT, "static", "firmas")
 GENERADOS_DIR = os.path.join(APP_ROOT, "static")
 
 app = Flask(__name__)
@@ -62,6 +64,11 @@ app.secret_key = "inair_secret_key_change_me"
 # Initialize database
 init_db()
 
+@app.teardown_appcontext
+def _release_db(exc):
+    """The thread keeps its connection (database.get_db); only drop a transaction a route left open."""
+    release_db()
+
 # ------------------ Role-based access control ------------------
 def require_role(role):
     """Decorator to require specific role for route access"""
@@ -105,91 +112,6 @@ def generar_siguiente_folio(prefijo):
     guardar_folios(folios)
     return f"{prefijo}-{folios[prefijo]:04d}"
 
-# ------------------ catálogos ------------------
-LISTA_EQUIPOS = [
-    "Compresor tornillo lubricado capacidad variable",
-    "Compresor tornillo lubricado velocidad variable",
-    "Compresor tornillo libre de aceite velocidad fija",
-    "Compresor tornillo libre de aceite velocidad variable",
-    "Compresor booster pistón 1 etapa",
-    "Compresor booster pistón 2 etapas",
-    "Compresor booster pistón 3 etapa",
-    "Compresor booster pistón 4 etapa",
-    "Compresor booster pistón 5 etapa",
-    "Compresor tornillo lubricado velocidad fija",
-    "Compresor pistón 3 etapas",
-    "Compresor tornillo lubricado velocidad fija x bandas",
-    "Compresor tornillo lubricado velocidad fija 2 etapas",
-    "Compresor tornillo lubricado velocidad variable 2 etapas",
-    "Compresor pistón 2 etapas",
-    "Compresor reciprocante",
-    "Secador refrigerativo cíclico",
-    "Secador refrigerativo no cíclico",
-    "Secador regenerativo",
-]
-
-ACTIVIDADES_SENTENCE = [
-    "Cambio de filtro de aire","Cambio de filtro de aceite","Cambio de elemento separador",
-    "Cambio de filtro panel control","Recuperar nivel de aceite","Cambio de aceite",
-    "Cambio de mangueras","Cambio válvula de desfogue","Cambio válvula check descarga",
-    "Cambio kit válvula mpcv","Cambio kit, válvula admisión","Cambio válvula paro de aceite",
-    "Cambio kit, val. termocontrol","Cambio de bandas","Reapretar conexiones mecánicas",
-    "Reapretar conexiones eléctricas","Limpieza línea de barrido","Limpieza trampa de condensados",
-    "Limpieza a enfriadores aire/aceite","Revisar funcionamiento de válvulas",
-    "Limpieza a platinos de contactores","Lubricación rodamiento de motor",
-    "Servicio a motor eléctrico","Limpieza general del equipo",
-    "Toma de muestra de aceite para análisis",
-]
-
-# --- Lecturas de compresor (web + pdf) ---
-DG_LABELS = [
-    "Horas totales","Horas de carga","Presión objetivo/descarga","Presión de carga",
-    "Presión descarga del paquete","Temperatura ambiente","Temp. descarga del paquete",
-    "Temp. descarga del aire-end","Temp. inyección de refrigerante","Caída de presión separador"
-]
-OF_LABELS = [
-    "Temp. entrada aire 1ra etapa","Temp. descarga aire 1ra etapa","Presión descarga 1ra etapa",
-    "Temp. entrada 2da etapa","Temp. descarga 2da etapa","Presión descarga 2da etapa",
-    "Temperatura del aceite","Presión de aceite","Vacío de entrada","(otro)"
-]
-
-# --- Lecturas de SECADOR (solo PDF; en el HTML ya tienes estos campos) ---
-SEC_LABELS = [
-    "Temperatura de aire de entrada",
-    "Temperatura de aire de salida",
-    "Temperatura del calentador",
-    "Temperatura ambiente",
-    "Punto de rocío",
-    "Tiempo de ciclo",
-    "Horas totales",
-    "Condiciones de prefiltro",
-    "Condiciones de pos filtro",
-]
-
-# --- Datos eléctricos estándar (compresores) ---
-E3 = [
-    ("Voltaje comp. en carga","v_carga"),
-    ("Voltaje comp. en descarga","v_descarga"),
-    ("Voltaje a tierra","v_tierra"),
-    ("Corriente comp. en carga","i_carga"),
-    ("Corriente comp. en descarga","i_descarga"),
-    ("Corriente total del paquete","i_total"),
-]
-E1 = [
-    ("Corriente de placa","i_placa"),
-    ("Voltaje del bus DC","v_busdc"),
-    ("RPM del motor (VFD)","rpm_vfd"),
-    ("Temp. IGBT U=","t_igbt_u"),("Temp. IGBT V=","t_igbt_v"),("Temp. IGBT W=","t_igbt_w"),
-    ("Temp. rectificador","t_rect"),
-]
-
-# --- Datos eléctricos especiales para SECADOR (solo 2 filas) ---
-SEC_E3 = [
-    ("Corriente comp. en carga", "i_carga"),
-    ("Voltaje comp. en carga", "v_carga"),  # esta usa L1-2 / L2-3 / L3-1
-]
-SEC_E1 = []  # sin filas individuales para secador
-
 # ------------------ rutas ------------------
 @app.route("/")
 def home():
@@ -262,809 +184,163 @@ def nuevo_folio():
     return redirect(url_for("formulario"))
 
 
-# ------------------ util texto/medidas ------------------
-def _text_or_na(v):
-    v = (v or "").strip()
-    return v if v else "N/A"
-
-def _join_val_unit(value, unit):
-    """Join a value with its unit. Returns 'N/A' if value is empty."""
-    value = (value or "").strip()
-    unit = (unit or "").strip()
-    if not value or value == "N/A":
-        return "N/A"
-    if unit:
-        return f"{value} {unit}"
-    return value
-
-
-def _wrap_text_force(text, max_w, font="Helvetica", size=9):
-    if not text: return [""] if text == "" else []
-    words = text.split(" ")
-    lines, line = [], ""
-    def w(s): return stringWidth(s, font, size)
-    for word in words:
-        cand = (line + " " + word).strip()
-        if w(cand) <= max_w:
-            line = cand
+# ------------------ generación PDF ------------------
+def _report_from_request():
+    """Parsea el POST del formulario a un dict de reporte (ver pdf_renderer.parse_report)."""
+    report = parse_report(request.form, request.files)
+    report["folio"] = request.form.get("folio") or session.get("folio_actual")
+    return report
+
+def _fotos_data(report):
+    """Bytes de las fotos del reporte por slot, para guardarlas en el borrador."""
+    return {f"foto{f['slot']}": f["data"] for f in report["fotos"]}
+
+def _ingest_photos(values):
+    """Versión de impresión + miniatura, en el pool de imagenes, de las fotos que llegaron (bytes, data URL o referencia)."""
+    for value in values:
+        if not value:
+            continue
+        if isinstance(value, bytes):
+            ingest_photo(lambda data=value: data, PHOTO_W, PHOTO_H)
         else:
-            if line: lines.append(line); line = ""
-            buf = ""
-            for ch in word:
-                if w(buf + ch) <= max_w:
-                    buf += ch
-                else:
-                    lines.append(buf); buf = ch
-            line = buf
-    if line: lines.append(line)
-    return lines
-
-# ------------------ dibujo piezas comunes ------------------
-def _draw_header_and_footer(c, folio, fecha, tecnico, localidad):
-    try:
-        logo_path = os.path.join(APP_ROOT, "static", "img", "logo_inair.png")
-        if os.path.exists(logo_path):
-            c.drawImage(ImageReader(logo_path), 1.5*cm, 27.6*cm, width=4.2*cm, height=1.6*cm,
-                        preserveAspectRatio=True, anchor='sw')
-    except Exception:
-        pass
-    c.setFont("Helvetica-Bold", 14); c.drawString(7.5*cm, 28.1*cm, "REPORTE TÉCNICO")
-    c.setFont("Helvetica", 9)
-    c.drawRightString(16.5*cm, 28.2*cm, "Folio:")
-    c.setFillColorRGB(0.82,0,0); c.setFont("Helvetica-Bold", 10)
-    c.drawRightString(19.0*cm, 28.2*cm, folio)
-    c.setFillColorRGB(0,0,0); c.setFont("Helvetica", 9)
-    c.drawRightString(19.0*cm, 27.7*cm, f"Fecha: {fecha}")
-    c.drawRightString(19.0*cm, 27.2*cm, f"Técnico: {tecnico}")
-    c.drawString(1.5*cm, 27.2*cm, f"Localidad: {localidad}")
-    c.setStrokeColorRGB(0.82,0.82,0.82); c.line(1.5*cm, 26.9*cm, 19.5*cm, 26.9*cm)
-    c.setStrokeColorRGB(0,0,0)
-
-    # Pie con fondo suave
-    base_y = 1.35*cm
-    rect_h = 1.9*cm
-    c.setFillColorRGB(0.95, 0.96, 0.99)
-    c.roundRect(1.5*cm, base_y-0.2*cm, 18.0*cm, rect_h, 6, fill=1, stroke=0)
-    c.setStrokeColorRGB(0.75,0.75,0.8); c.roundRect(1.5*cm, base_y-0.2*cm, 18.0*cm, rect_h, 6, fill=0, stroke=1)
-    c.setFillColorRGB(0,0,0)
-
-    col_w = 8.8*cm; gap = 0.4*cm
-    x1 = 1.7*cm; x2 = 1.7*cm + col_w + gap
-    def draw_col(x, title, lines):
-        c.setFont("Helvetica-Bold", 8)
-        c.drawString(x, base_y + rect_h - 0.55*cm, title)
-        c.setFont("Helvetica", 7.6)
-        maxw = col_w - 0.2*cm
-        yy = base_y + rect_h - 1.0*cm
-        for ln in lines:
-            for piece in _wrap_text_force(ln, maxw, "Helvetica", 7.6):
-                c.drawString(x, yy, piece); yy -= 0.34*cm
-    draw_col(x1, "INGENIERIA EN AIRE SA DE CV        RFC: IAI1605258G6",
-             ["Avenida Alfonso Vidal y Planas #445, Interior S/N, Colonia Nueva Tijuana,",
-              "Tijuana, Baja California, México, CP: 22435, Lada 664 Tel(s) 250-0022"])
-    draw_col(x2, "INGENIERIA EN AIRE SA DE CV        RFC: IAI1605258G6",
-             ["Avenida del Carmen #3863, Fracc. Residencias, Mexicali, Baja California, México,",
-              "CP: 21280, Lada 686 Tel(s) 962-9932"])
-
-def _draw_section(c, title, y, box_h):
-    c.setStrokeColorRGB(0.7,0.7,0.7); c.setLineWidth(1)
-    c.roundRect(1.5*cm, y-box_h, 18.0*cm, box_h, 6, stroke=1, fill=0)
-    c.setFillColorRGB(0.95,0.95,0.98); c.rect(1.5*cm, y-18, 18.0*cm, 18, fill=1, stroke=0)
-    c.setFillColorRGB(0,0,0); c.setFont("Helvetica-Bold", 10); c.drawString(1.7*cm, y-13, title)
-    return y-22
-
-def _ensure_space(c, y, need, folio, fecha, tecnico, localidad):
-    _, height = A4
-    if y - need < 2.3*cm:
-        c.showPage()
-        _draw_header_and_footer(c, folio, fecha, tecnico, localidad)
-        return height - 3.2*cm
-    return y
-
-def _row_box_multi(c, y, total_w, cols, line_h, inner_x):
-    widths = [total_w * col["ratio"] for col in cols]
-    for w, col in zip(widths, cols):
-        lab = col["label"] + ": "
-        lab_w = stringWidth(lab, "Helvetica-Bold", 9)
-        avail = max(10, w - 8 - lab_w)
-        parts = _wrap_text_force(col["value"], avail, "Helvetica", 9)
-        col["_parts"], col["_lab_w"] = parts, lab_w
-    max_lines = max(len(col["_parts"]) for col in cols)
-    rect_h = max_lines*line_h + 0.40*cm
-    c.setStrokeColorRGB(0.85,0.85,0.85)
-    c.rect(inner_x-0.3*cm, y-rect_h+0.2*cm, total_w, rect_h, fill=0, stroke=1)
-    c.setStrokeColorRGB(0,0,0)
-    x = inner_x
-    for w, col in zip(widths, cols):
-        c.setFont("Helvetica-Bold", 9); c.drawString(x, y-0.3*cm, col["label"] + ": ")
-        c.setFont("Helvetica", 9)
-        yy = y-0.3*cm
-        for i, ln in enumerate(col["_parts"]):
-            if i == 0: c.drawString(x + col["_lab_w"], yy, ln)
-            else:      c.drawString(x, yy - i*line_h, ln)
-        x += w
-    return y - rect_h
-
-def _save_signature_png(data_url, filename):
-    if not data_url or not data_url.startswith("data:image"): return None
-    header, b64 = data_url.split(",", 1)
-    raw = base64.b64decode(b64)
-    os.makedirs(FIRMAS_DIR, exist_ok=True)
-    path = os.path.join(FIRMAS_DIR, filename)
-    try:
-        img = Image.open(io.BytesIO(raw)).convert("RGBA")
-        bg = Image.new("RGBA", img.size, (255,255,255,255))
-        bg.alpha_composite(img)
-        bg.convert("RGB").save(path, format="PNG")
-    except Exception:
-        with open(path, "wb") as f: f.write(raw)
-    return path
+            ingest_photo(lambda value=value: load_bytes(value), PHOTO_W, PHOTO_H)
+
+def _form_data_from_request():
+    form_data = {}
+    for key in request.form:
+        form_data[key] = request.form.get(key)
+    return form_data
+
+def _save_report_metadata(report):
+    """Save report metadata to database for service history"""
+    save_report(
+        folio=report["folio"],
+        fecha=report["fecha"],
+        cliente=report["cliente"],
+        tipo_equipo=report["tipo_equipo"],
+        modelo=report["modelo"],
+        serie=report["serie"],
+        marca=report["marca"],
+        potencia=report["potencia"],
+        tipo_servicio=report["tipo_servicio"],
+        descripcion_servicio=report["descripcion_servicio"],
+        tecnico=report["tecnico"],
+        localidad=report["localidad"]
+    )
+
+def _save_draft_from_request(report, pdf_preview=None, pdf_cache_key=None):
+    """Guarda el borrador completo (form, fotos, firmas y opcionalmente el PDF) del POST actual."""
+    fotos = _fotos_data(report)
+    save_draft_report(
+        folio=report["folio"],
+        form_data=_form_data_from_request(),
+        foto1=fotos.get("foto1"),
+        foto2=fotos.get("foto2"),
+        foto3=fotos.get("foto3"),
+        foto4=fotos.get("foto4"),
+        firma_tecnico=report["firma_tecnico"],
+        firma_cliente=report["firma_cliente"],
+        pdf_preview=pdf_preview,
+        pdf_cache_key=pdf_cache_key
+    )
+    _ingest_photos(fotos.values())
+
+def _pdf_cache_hit(report):
+    """
+    True si el PDF guardado del folio ya corresponde a este reporte; en ese
+    caso solo se actualiza form_data y no se re-renderiza ni se reescribe el BLOB.
+    Regresa (hit, cache_key).
+    """
+    cache_key = report_cache_key(report)
+    if get_draft_pdf_cache_key(report["folio"]) == cache_key:
+        update_draft_form_data(report["folio"], _form_data_from_request())
+        return True, cache_key
+    return False, cache_key
 
-# ------------------ generación PDF ------------------
 @app.route("/generar_pdf", methods=["POST"])
 def generar_pdf():
     if "user" not in session:
         return redirect(url_for("login"))
 
-    width, height = A4
-    folio = request.form.get("folio") or session.get("folio_actual")
-    fecha = _text_or_na(request.form.get("fecha"))
-    tecnico = _text_or_na(request.form.get("tecnico"))
-    localidad = _text_or_na(request.form.get("localidad"))
-
-    tipo_servicio = _text_or_na(request.form.get("tipo_servicio"))
-    desc_servicio = _text_or_na(request.form.get("descripcion_servicio"))
-
-    cliente = _text_or_na(request.form.get("cliente"))
-    contacto = _text_or_na(request.form.get("contacto"))
-    direccion = _text_or_na(request.form.get("direccion"))
-    telefono = _text_or_na(request.form.get("telefono"))
-    email = _text_or_na(request.form.get("email"))
-
-    tipo_equipo = _text_or_na(request.form.get("tipo_equipo"))
-    modelo = _text_or_na(request.form.get("modelo"))
-    serie = _text_or_na(request.form.get("serie"))
-    marca_sel = request.form.get("marca") or ""
-    # Acepta "Otros" en cualquier capitalización
-    if marca_sel.strip().lower() == "otros":
-        marca = _text_or_na(request.form.get("otra_marca"))
-    else:
-        marca = _text_or_na(marca_sel)
-    if marca and marca != "N/A":
-        marca = marca.title()
-
-    # Potencia: HP normal / CFM para secador
-    potencia_num = (request.form.get("potencia", "") or "").strip()
-    if potencia_num:
-        if _is_secador(tipo_equipo):
-            potencia = f"{potencia_num} CFM"
-        else:
-            potencia = f"{potencia_num} HP"
-    else:
-        potencia = "N/A"
+    if PDF_QUEUE:
+        folio, job_id = _encolar_pdf()
+        return redirect(url_for("vista_previa", folio=folio, job=job_id))
 
-    observaciones = _text_or_na(request.form.get("observaciones"))
+    report = _report_from_request()
+    folio = report["folio"]
 
-    # fotos
-    fotos = []
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    for i in range(1,5):
-        ffile = request.files.get(f"foto{i}")
-        desc = _text_or_na(request.form.get(f"foto{i}_desc"))
-        path = os.path.join(UPLOAD_DIR, f"{folio}_foto{i}.png")
-        
-        if ffile and ffile.filename:
-            # New file uploaded
-            ffile.save(path)
-            fotos.append((path, desc))
-        else:
-            # Check for auto-saved base64 data (foto#_data)
-            foto_data = request.form.get(f"foto{i}_data")
-            if not foto_data:
-                # Fallback: check old field name
-                foto_data = request.form.get(f"foto{i}_existing")
-            
-            if foto_data:
-                try:
-                    # Remove header if present (data:image/png;base64,...)
-                    if "," in foto_data:
-                        foto_data = foto_data.split(",")[1]
-                    
-                    with open(path, "wb") as f:
-                        f.write(base64.b64decode(foto_data))
-                    fotos.append((path, desc))
-                except Exception as e:
-                    print(f"Error decoding existing photo {i}: {e}")
-
-    # firmas
-    firma_tecnico_nombre = _text_or_na(request.form.get("firma_tecnico_nombre"))
-    firma_cliente_nombre = _text_or_na(request.form.get("firma_cliente_nombre"))
-    firma_tecnico_path = _save_signature_png(request.form.get("firma_tecnico_data"), f"{folio}_firma_tecnico.png")
-    firma_cliente_path = _save_signature_png(request.form.get("firma_cliente_data"), f"{folio}_firma_cliente.png")
-
-    # actividades (para compresor estándar; en secador tú ya estás imprimiendo otras actividades)
-    analisis_ruido_marcado = request.form.get("act_analisis_ruido") == "1" or bool(request.form.get("act_analisis_ruido"))
-    actividades = []
-    for idx, nombre in enumerate(ACTIVIDADES_SENTENCE, start=1):
-        # Check if checkbox is marked: value should be "1" or "on"
-        val = request.form.get(f"act_{idx}")
-        marcado = val == "1" or val == "on"
-        actividades.append((nombre, "Realizado" if marcado else "N/A"))
-    actividades.append(("Análisis de ruidos en rodamientos (R30)", "Realizado" if analisis_ruido_marcado else "N/A"))
-    act_otras = _text_or_na(request.form.get("act_otras"))
-
-    # ruido R30/SPM
-    ruido_tipo = _text_or_na(request.form.get("ruido_tipo")) if analisis_ruido_marcado else "N/A"
-    ruido_resultado = _text_or_na(request.form.get("ruido_resultado")) if analisis_ruido_marcado else "N/A"
-    ruido_obs = _text_or_na(request.form.get("ruido_observaciones")) if analisis_ruido_marcado else "N/A"
-
-    spm_vals = {}
-    if analisis_ruido_marcado and ruido_tipo == "SPM":
-        rows = [("carga_dbm","CARGA dBm"),("carga_dbc","CARGA dBc"),("carga_dbi","CARGA dBi"),
-                ("descarga_dbm","DESCARGA dbm"),("descarga_dbc","DESCARGA dBc"),("descarga_dbi","DESCARGA dBi")]
-        cols = ["mbrg","bg","lpmi_mri","lpm2_mr2","hpm1","hpm2","hpf1","hpf2","lpf1","lpf2"]
-        for rk,_ in rows:
-            for ck in cols:
-                spm_vals[f"{rk}_{ck}"] = _text_or_na(request.form.get(f"{rk}_{ck}"))
-
-    # Lecturas (compresor; para secador usaremos otros campos)
-    dg_vals = []
-    for i in range(len(DG_LABELS)):
-        val = request.form.get(f"dg_{i+1}", "")
-        unit = request.form.get(f"dg_{i+1}_unit", "")
-        dg_vals.append(_join_val_unit(val, unit))
-
-    # Oil-free
-    of_vals = []
-    for i in range(len(OF_LABELS)):
-        val = request.form.get(f"of_{i+1}", "")
-        unit = request.form.get(f"of_{i+1}_unit", "")
-        of_vals.append(_join_val_unit(val, unit))
-
-    # --- Datos eléctricos: E3 (trifásicos) y E1 (individuales) ---
-    e3_vals = {}
-    for _, key in E3:
-        fases = ("l12", "l23", "l31") if key in ("v_carga", "v_descarga") else ("l1", "l2", "l3")
-        for ph in fases:
-            e3_vals[f"{key}_{ph}"] = _text_or_na(request.form.get(f"{key}_{ph}"))
-
-    e1_vals = { key: _text_or_na(request.form.get(key)) for _, key in E1 }
-
-    # Bandera: ¿estamos en Preventivo + Secador?
-    ts = (tipo_servicio or "").lower()
-    es_secador_preventivo = (_is_secador(tipo_equipo) and ts == "preventivo")
-
-    # === PDF ===
-    buf = io.BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    _draw_header_and_footer(c, folio, fecha, tecnico, localidad)
-    y = height - 3.2*cm
-    inner_x = 1.8*cm
-    inner_w = 17.6*cm
-    line_h = 0.52*cm
-
-    # DATOS DEL CLIENTE
-    need = 18 + (1*line_h) + 0.8*cm
-    y = _ensure_space(c, y, need, folio, fecha, tecnico, localidad)
-    yc = _draw_section(c, "Datos del cliente", y, need + (2*line_h))
-    yc = _row_box_multi(c, yc, inner_w, [{"label":"Cliente","value":cliente,"ratio":1.0}], line_h, inner_x)
-    cols = [
-        {"label":"Contacto","value":contacto,"ratio":0.45},
-        {"label":"Teléfono","value":telefono,"ratio":0.22},
-        {"label":"Email","value":email,"ratio":0.33},
-    ]
-    yc = _row_box_multi(c, yc, inner_w, cols, line_h, inner_x)
-    yc = _row_box_multi(c, yc, inner_w, [{"label":"Dirección","value":direccion,"ratio":1.0}], line_h, inner_x)
-    y = yc - 0.2*cm
-
-    # SERVICIO (si el tipo es Bitácora, aseguramos la descripción)
-    if ts in ("bitácora", "bitacora"):
-        desc_servicio = "Bitácora"
-
-    cols = [{"label":"Tipo","value":tipo_servicio,"ratio":0.30},{"label":"Descripción","value":desc_servicio,"ratio":0.70}]
-    max_lines = 0
-    for col in cols:
-        w = inner_w*col["ratio"]; lab_w = stringWidth(col["label"]+": ", "Helvetica-Bold", 9)
-        avail = max(10, w - lab_w - 8)
-        parts = _wrap_text_force(col["value"], avail, "Helvetica", 9)
-        max_lines = max(max_lines, len(parts))
-    need_serv = 18 + max_lines*line_h + 0.8*cm
-    y = _ensure_space(c, y, need_serv, folio, fecha, tecnico, localidad)
-    ys = _draw_section(c, "Servicio", y, need_serv)
-    ys = _row_box_multi(c, ys, inner_w, cols, line_h, inner_x)
-    y = ys - 0.2*cm
-
-    # EQUIPO
-    need_eq = 18 + 1*line_h + 0.8*cm
-    y = _ensure_space(c, y, need_eq + 2*line_h, folio, fecha, tecnico, localidad)
-    ye = _draw_section(c, "Datos del equipo", y, need_eq + 2*line_h)
-    ye = _row_box_multi(c, ye, inner_w, [{"label":"Tipo","value":tipo_equipo,"ratio":1.0}], line_h, inner_x)
-    cols = [
-        {"label":"Modelo","value":modelo,"ratio":0.25},
-        {"label":"Serie","value":serie,"ratio":0.25},
-        {"label":"Marca","value":marca,"ratio":0.25},
-        {"label":"Potencia","value":potencia,"ratio":0.25},
-    ]
-    ye = _row_box_multi(c, ye, inner_w, cols, line_h, inner_x)
-    y = ye - 0.2*cm
-
-    # ===== Flujo por tipo de servicio =====
-    if ts == "preventivo":
-        # OJO: aquí sigues viendo la tabla de actividades estándar solo para compresores.
-        # Para secadores tú ya tienes el bloque de actividades específico en el formulario
-        # y podríamos hacer una tabla aparte si lo necesitas después.
-        
-        # Filter out activities where estado is "N/A" (not performed)
-        filtered_actividades = [(act, est) for act, est in actividades if est and est.strip() and est.strip() != "N/A"]
-        
-        if not filtered_actividades:
-            # Skip this section if no activities were performed
-            pass
-        else:
-            rows = filtered_actividades[:]
-            n = len(rows); left_rows = math.ceil(n/2); right_rows = n - left_rows
-            row_h = 0.52*cm; gutter = 0.6*cm; col_w_act = 5.9*cm; col_w_estado = 2.0*cm
-            need_h = 18 + (1 + max(left_rows, right_rows))*row_h + 1.2*cm
-            otras_text = "" if act_otras == "N/A" else act_otras
-            if otras_text:
-                lab = "OTRAS ACTIVIDADES: "; labw = stringWidth(lab, "Helvetica-Bold", 9)
-                otras_lines = _wrap_text_force(otras_text, inner_w-0.6*cm-labw-6, "Helvetica", 9)
-                need_h += (len(otras_lines)*line_h + 0.8*cm + 16)
-            y = _ensure_space(c, y, need_h, folio, fecha, tecnico, localidad)
-            ya = _draw_section(c, "Actividades de mantenimiento preventivo", y, need_h)
-            left_x = inner_x; right_x = left_x + (col_w_act + col_w_estado) + gutter
-            c.setFont("Helvetica-Bold", 8.4)
-            for base_x in (left_x, right_x):
-                c.rect(base_x, ya-row_h, col_w_act, row_h, fill=0, stroke=1)
-                c.rect(base_x+col_w_act, ya-row_h, col_w_estado, row_h, fill=0, stroke=1)
-                c.drawString(base_x+3, ya-row_h+3, "Actividad")
-                c.drawString(base_x+col_w_act+3, ya-row_h+3, "Estado")
-            c.setFont("Helvetica", 7.8)
-            yline_l = ya - row_h
-            for i in range(left_rows):
-                # Check space before each row (except first)
-                if i > 0:
-                    temp_y = yline_l
-                    temp_y = _ensure_space(c, temp_y, row_h + 0.1*cm, folio, fecha, tecnico, localidad)
-                    if temp_y > yline_l:
-                        yline_l = temp_y
-                
-                act, est = rows[i]
-                c.rect(left_x, yline_l-row_h, col_w_act, row_h, fill=0, stroke=1)
-                c.rect(left_x+col_w_act, yline_l-row_h, col_w_estado, row_h, fill=0, stroke=1)
-                maxw = col_w_act - 6; txt = act
-                while stringWidth(txt, "Helvetica", 7.8) > maxw and len(txt) > 3:
-                    txt = txt[:-4] + "…"
-                c.drawString(left_x+3, yline_l-row_h+3, txt)
-                c.drawString(left_x+col_w_act+3, yline_l-row_h+3, est)
-                yline_l -= row_h
-            yline_r = ya - row_h
-            for j in range(right_rows):
-                # Check space before each row (except first)
-                if j > 0:
-                    temp_y = yline_r
-                    temp_y = _ensure_space(c, temp_y, row_h + 0.1*cm, folio, fecha, tecnico, localidad)
-                    if temp_y > yline_r:
-                        yline_r = temp_y
-                
-                act, est = rows[left_rows + j]
-                c.rect(right_x, yline_r-row_h, col_w_act, row_h, fill=0, stroke=1)
-                c.rect(right_x+col_w_act, yline_r-row_h, col_w_estado, row_h, fill=0, stroke=1)
-                maxw = col_w_act - 6; txt = act
-                while stringWidth(txt, "Helvetica", 7.8) > maxw and len(txt) > 3:
-                    txt = txt[:-4] + "…"
-                c.drawString(right_x+3, yline_r-row_h+3, txt)
-                c.drawString(right_x+col_w_act+3, yline_r-row_h+3, est)
-                yline_r -= row_h
-            y_after = min(yline_l, yline_r) - 0.3*cm
-            if otras_text:
-                c.setFont("Helvetica-Bold", 9); lab = "OTRAS ACTIVIDADES: "
-                labw = stringWidth(lab, "Helvetica-Bold", 9)
-                parts = _wrap_text_force(otras_text, inner_w-0.6*cm-labw-6, "Helvetica", 9)
-                rect_h = len(parts)*line_h + 0.8*cm
-                c.setStrokeColorRGB(0.85,0.85,0.85)
-                c.rect(inner_x-0.3*cm, y_after-rect_h+0.2*cm, inner_w, rect_h, fill=0, stroke=1)
-                c.setStrokeColorRGB(0,0,0)
-                yy = y_after - 0.3*cm; c.drawString(inner_x, yy, lab)
-                c.setFont("Helvetica", 9)
-                for i, ln in enumerate(parts):
-                    c.drawString(inner_x + labw + 6, yy - i*line_h, ln)
-                y = y_after - rect_h - 0.2*cm
-            else:
-                y = y_after
-
-        # análisis de ruido
-        if analisis_ruido_marcado:
-            if ruido_tipo == "SPM":
-                need_spm = 7.6*cm
-                y = _ensure_space(c, y, need_spm, folio, fecha, tecnico, localidad)
-                yr = _draw_section(c, "Análisis de ruido", y, need_spm)
-                headers = ["", "MBRG","BG","LPMI-MRI","LPM2-MR2","HPM1","HPM2","HPF1","HPF2","LPF1","LPF2"]
-                row_defs = [("CARGA dBm","carga_dbm"),("CARGA dBc","carga_dbc"),("CARGA dBi","carga_dbi"),
-                            ("DESCARGA dbm","descarga_dbm"),("DESCARGA dBc","descarga_dbc"),("DESCARGA dBi","descarga_dbi")]
-                
-                # Filter out rows where all values are N/A or empty
-                cols = ["mbrg","bg","lpmi_mri","lpm2_mr2","hpm1","hpm2","hpf1","hpf2","lpf1","lpf2"]
-                filtered_row_defs = []
-                for lbl, key in row_defs:
-                    row_vals = [spm_vals.get(f"{key}_{col}", "N/A") for col in cols]
-                    # Keep row if at least one value is not N/A and not empty
-                    if any(v and v.strip() and v.strip() != "N/A" for v in row_vals):
-                        filtered_row_defs.append((lbl, key))
-                
-                if filtered_row_defs:
-                    # Only draw table if there are rows with data
-                    left_x2 = inner_x; colw0 = 3.4*cm; colw = 1.45*cm; rh = 0.68*cm
-                    c.setFont("Helvetica-Bold", 8); c.setStrokeColorRGB(0.7,0.7,0.7)
-                    c.rect(left_x2, yr-rh, colw0 + 10*colw, rh, fill=0, stroke=1)
-                    c.drawString(left_x2+2, yr-rh+3, "ANÁLISIS DE RUIDO EN RODAMIENTOS (SPM)")
-                    yline = yr - rh; x = left_x2 + colw0
-                    c.setFont("Helvetica-Bold", 7.2)
-                    for h in headers[1:]:
-                        c.rect(x, yline-rh, colw, rh, fill=0, stroke=1); c.drawString(x+2, yline-rh+3, h); x += colw
-                    yy2 = yline - rh; c.setFont("Helvetica", 7.0)
-                    for idx, (lbl, key) in enumerate(filtered_row_defs):
-                        # Check space before each row (except first, already checked for header)
-                        if idx > 0:
-                            temp_y = yy2
-                            temp_y = _ensure_space(c, temp_y, rh + 0.1*cm, folio, fecha, tecnico, localidad)
-                            if temp_y > yy2:
-                                yy2 = temp_y
-                        
-                        c.rect(left_x2, yy2-rh, colw0, rh, fill=0, stroke=1)
-                        c.setFont("Helvetica-Bold", 8); c.drawString(left_x2+2, yy2-rh+3, lbl)
-                        x = left_x2 + colw0; c.setFont("Helvetica", 7.0)
-                        for col in cols:
-                            val = spm_vals.get(f"{key}_{col}", "N/A")
-                            c.rect(x, yy2-rh, colw, rh, fill=0, stroke=1); c.drawString(x+2, yy2-rh+3, val[:8]); x += colw
-                        yy2 -= rh
-                    c.setStrokeColorRGB(0,0,0); y = yy2 - 0.3*cm
-            else:
-                need_r30 = 2.6*cm
-                y = _ensure_space(c, y, need_r30, folio, fecha, tecnico, localidad)
-                yr = _draw_section(c, "Análisis de ruido", y, need_r30)
-                c.setFont("Helvetica-Bold", 9); c.drawString(inner_x, yr-0.7*cm, "Tipo:")
-                c.setFont("Helvetica", 9); c.drawString(inner_x + stringWidth("Tipo:", "Helvetica-Bold", 9) + 6, yr-0.7*cm, ruido_tipo)
-                c.setFont("Helvetica-Bold", 9); c.drawString(inner_x, yr-1.3*cm, "Resultado:")
-                c.setFont("Helvetica", 9); c.drawString(inner_x + stringWidth("Resultado:", "Helvetica-Bold", 9) + 6, yr-1.3*cm, ruido_resultado)
-                c.setFont("Helvetica-Bold", 9); c.drawString(inner_x, yr-1.9*cm, "Observaciones:")
-                c.setFont("Helvetica", 9); c.drawString(inner_x + stringWidth("Observaciones:", "Helvetica-Bold", 9) + 6, yr-1.9*cm, ruido_obs)
-                y = yr - 2.2*cm
-
-    elif ts in ("correctivo", "diagnóstico", "diagnostico", "revisión", "revision"):
-        blocks = [
-            ("Diagnóstico del problema", _text_or_na(request.form.get("diag_problema"))),
-            ("Causa raíz", _text_or_na(request.form.get("causa_raiz"))),
-            ("Actividades realizadas", _text_or_na(request.form.get("actividades_realizadas"))),
-            ("Refacciones utilizadas", _text_or_na(request.form.get("refacciones"))),
-            ("Condiciones en que se encontró el equipo", _text_or_na(request.form.get("cond_encontro"))),
-            ("Condiciones en que se entrega el equipo", _text_or_na(request.form.get("cond_entrega"))),
-        ]
-        for title, content in blocks:
-            lines = _wrap_text_force(content, inner_w-0.6*cm)
-            need = 18 + len(lines)*line_h + 0.8*cm
-            y = _ensure_space(c, y, need, folio, fecha, tecnico, localidad)
-            yb = _draw_section(c, title, y, need)
-            c.setFont("Helvetica", 9)
-            yy = yb - 0.5*cm
-            for i, ln in enumerate(lines):
-                c.drawString(inner_x, yy - i*line_h, ln)
-            y = yy - len(lines)*line_h - 0.4*cm
-
-    elif ts in ("bitácora", "bitacora"):
-        # Bitácora: no pintamos preventivo/correctivo aquí
-        pass
-
-    # ===== LECTURAS DEL EQUIPO =====
-    def draw_kv_table(title, labels, values):
-        nonlocal y
-        # Filter out rows where value is empty or "N/A"
-        filtered_rows = [(lab, val) for lab, val in zip(labels, values) if val and val.strip() and val.strip() != "N/A"]
-        
-        if not filtered_rows:
-            return  # Don't draw the table if no data
-        
-        row_h = 0.52*cm
-        need = 18 + len(filtered_rows)*row_h + 0.7*cm
-        y = _ensure_space(c, y, need, folio, fecha, tecnico, localidad)
-        yt = _draw_section(c, title, y, need)
-        c.setFont("Helvetica-Bold", 8.7)
-        lab_w = 10.8*cm
-        val_w = inner_w - lab_w
-        yline = yt - 0.25*cm
-        c.setFont("Helvetica", 8.7)
-        for i,(lab,val) in enumerate(filtered_rows):
-            # Check space before drawing each row (except first, already checked)
-            if i > 0:
-                # Check if we need to move to a new page
-                temp_y = yline
-                temp_y = _ensure_space(c, temp_y, row_h + 0.15*cm, folio, fecha, tecnico, localidad)
-                # If new page was created, update yline to new page position
-                if temp_y > yline:
-                    yline = temp_y
-            
-            c.setStrokeColorRGB(0.85,0.85,0.85)
-            c.rect(inner_x-0.3*cm, yline-row_h, lab_w+val_w, row_h, fill=0, stroke=1)
-            c.setStrokeColorRGB(0,0,0)
-            c.setFont("Helvetica", 8.6)
-            c.drawString(inner_x, yline-row_h+3, lab)
-            c.setFont("Helvetica-Bold", 8.6)
-            c.drawString(inner_x + lab_w, yline-row_h+3, val)
-            yline -= row_h
-        y = yline - 0.2*cm
-
-    if es_secador_preventivo:
-        # Leemos campos específicos del SECADOR (los nombres deben coincidir con tu HTML)
-        sec_vals = []
-        for i in range(1, 7+1):  # 1..7 con unidad
-            val = request.form.get(f"sec_{i}", "")
-            unit = request.form.get(f"sec_{i}_unit", "")
-            sec_vals.append(_join_val_unit(val, unit))
-        sec_pref = _text_or_na(request.form.get("sec_prefiltro"))
-        sec_pos = _text_or_na(request.form.get("sec_posfiltro"))
-        sec_vals.append(sec_pref)
-        sec_vals.append(sec_pos)
-
-        draw_kv_table("Lecturas del equipo (Secador)", SEC_LABELS, sec_vals)
-    else:
-        draw_kv_table("Lecturas del equipo", DG_LABELS, dg_vals)
-        if _is_oilfree(tipo_equipo):
-            draw_kv_table("Compresor (oil free)", OF_LABELS, of_vals)
-
-    # ===== DATOS ELÉCTRICOS =====
-    def draw_electric(e3_vals_map, e1_vals_map, e3_rows, e1_rows):
-        nonlocal y
-        row_h = 0.52*cm
-        
-        # Filter e3_rows: keep only rows where at least one phase has data
-        filtered_e3 = []
-        for titulo, key in e3_rows:
-            # Get units for each phase
-            unit_l1 = request.form.get(f"{key}_unit", "").strip()
-            unit_l2 = request.form.get(f"{key}_unit_l2", "").strip()
-            unit_l3 = request.form.get(f"{key}_unit_l3", "").strip()
-            
-            fases = ("l12","l23","l31") if key in ("v_carga", "v_descarga") else ("l1","l2","l3")
-            vals_raw = [e3_vals_map.get(f"{key}_{ph}", "N/A") for ph in fases]
-            units = [unit_l1, unit_l2, unit_l3]
-            
-            # Check if at least one value is not empty and not "N/A"
-            if any(v and v.strip() and v.strip() != "N/A" for v in vals_raw):
-                # Join each value with its unit
-                vals_with_units = [_join_val_unit(v, u) for v, u in zip(vals_raw, units)]
-                filtered_e3.append((titulo, vals_with_units))
-        
-        # Filter e1_rows: keep only rows with data
-        filtered_e1 = []
-        for titulo, key in e1_rows:
-            unit = request.form.get(f"{key}_unit", "").strip()
-            val_raw = e1_vals_map.get(key, "N/A")
-            if val_raw and val_raw.strip() and val_raw.strip() != "N/A":
-                val_with_unit = _join_val_unit(val_raw, unit)
-                filtered_e1.append((titulo, val_with_unit))
-        
-        if not filtered_e3 and not filtered_e1:
-            return  # Don't draw section if no data
-        
-        need = 18 + (len(filtered_e3)+len(filtered_e1))*row_h + 0.9*cm
-        y = _ensure_space(c, y, need, folio, fecha, tecnico, localidad)
-        ye = _draw_section(c, "Datos eléctricos", y, need)
-
-        c.setFont("Helvetica-Bold", 8.7)
-        x0 = inner_x-0.3*cm; lab_w = 7.6*cm; cell = 3.1*cm
-        yline = ye - 0.25*cm
-
-        # Encabezado
-        c.rect(x0, yline-row_h, lab_w+3*cell, row_h, fill=0, stroke=1)
-        c.drawString(x0+2, yline-row_h+3, "MEDICIÓN")
-        c.drawString(x0+lab_w+2,        yline-row_h+3, "L1 / L1-2")
-        c.drawString(x0+lab_w+cell+2,   yline-row_h+3, "L2 / L2-3")
-        c.drawString(x0+lab_w+2*cell+2, yline-row_h+3, "L3 / L3-1")
-        yline -= row_h
-
-        c.setFont("Helvetica", 8.6)
-
-        # Trifásicos
-        for idx, (titulo, vals) in enumerate(filtered_e3):
-            # Check space before each row (except first, already checked for header)
-            if idx > 0:
-                temp_y = yline
-                temp_y = _ensure_space(c, temp_y, row_h + 0.15*cm, folio, fecha, tecnico, localidad)
-                if temp_y > yline:
-                    yline = temp_y
-            
-            c.rect(x0, yline-row_h, lab_w, row_h, fill=0, stroke=1)
-            c.drawString(x0+2, yline-row_h+3, titulo)
-
-            for j, val in enumerate(vals):
-                c.rect(x0+lab_w+j*cell, yline-row_h, cell, row_h, fill=0, stroke=1)
-                c.drawString(x0+lab_w+j*cell+2, yline-row_h+3, val)
-            yline -= row_h
-
-        # Individuales
-        for idx, (titulo, val) in enumerate(filtered_e1):
-            # Check space before each individual row
-            temp_y = yline
-            temp_y = _ensure_space(c, temp_y, row_h + 0.15*cm, folio, fecha, tecnico, localidad)
-            if temp_y > yline:
-                yline = temp_y
-            
-            c.rect(x0, yline-row_h, lab_w+3*cell, row_h, fill=0, stroke=1)
-            c.drawString(x0+2, yline-row_h+3, titulo)
-            c.setFont("Helvetica-Bold", 8.6)
-            c.drawRightString(x0+lab_w+3*cell-4, yline-row_h+3, val)
-            c.setFont("Helvetica", 8.6)
-            yline -= row_h
-
-        y = yline - 0.2*cm
-
-    if es_secador_preventivo:
-        # Solo Corriente comp. en carga (L1,L2,L3) y Voltaje comp. en carga (L1-2,L2-3,L3-1)
-        draw_electric(e3_vals, e1_vals, SEC_E3, SEC_E1)
-    else:
-        draw_electric(e3_vals, e1_vals, E3, E1)
-
-    # OBSERVACIONES
-    obs_lines = _wrap_text_force(observaciones, inner_w-0.6*cm)
-    need_obs = 18 + len(obs_lines)*line_h + 0.9*cm
-    y = _ensure_space(c, y, need_obs, folio, fecha, tecnico, localidad)
-    yo = _draw_section(c, "Observaciones y recomendaciones", y, need_obs)
-    c.setFont("Helvetica", 9)
-    yy = yo - 0.55*cm
-    for i, ln in enumerate(obs_lines):
-        c.drawString(inner_x, yy - i*line_h, ln)
-    y = yy - len(obs_lines)*line_h - 0.4*cm
-
-    # FOTOS
-    def draw_fotos(items):
-        nonlocal y
-        if not items:
-            return
-
-        gutter_col = 0.9*cm
-        col_w = (inner_w - gutter_col) / 2.0
-        img_w = col_w
-        img_h = img_w * 0.70
-        caption_h = 1.10*cm
-        row_gap = 0.6*cm
-        per_row_h = img_h + caption_h + row_gap
-
-        idx = 0
-        foto_num = 1
-
-        def ellipsize(text, maxw):
-            s = (text or "N/A").strip() or "N/A"
-            while stringWidth(s, "Helvetica", 8.2) > maxw and len(s) > 3:
-                s = s[:-2] + "…"
-            return s
-
-        while idx < len(items):
-            disponible = y - 2.3*cm
-            max_rows_fit = int((disponible - (18 + 0.8*cm)) // per_row_h)
-            if max_rows_fit < 1:
-                c.showPage(); _draw_header_and_footer(c, folio, fecha, tecnico, localidad)
-                y = height - 3.2*cm
-                continue
-
-            rem_rows = math.ceil((len(items) - idx)/2)
-            rows = min(max_rows_fit, rem_rows)
-            need_here = 18 + rows*per_row_h + 0.8*cm
-            yf = _draw_section(c, "Evidencias fotográficas", y, need_here)
-
-            left_x = inner_x
-            right_x = inner_x + col_w + gutter_col
-            top = yf - 0.5*cm
-
-            def draw_one(path, desc, x, ytop, num):
-                c.rect(x, ytop - img_h, img_w, img_h, stroke=1, fill=0)
-                if path and os.path.exists(path):
-                    try:
-                        c.drawImage(ImageReader(path), x, ytop - img_h, width=img_w, height=img_h,
-                                    preserveAspectRatio=True, anchor='sw')
-                    except Exception:
-                        pass
-                c.setFont("Helvetica", 8.2)
-                maxw = img_w - 6
-                lines = _wrap_text_force(desc or "N/A", maxw, "Helvetica", 8.2)
-                line1 = ellipsize(lines[0] if lines else "N/A", maxw)
-                line2 = ellipsize(lines[1] if len(lines) > 1 else "", maxw)
-                base = ytop - img_h - 0.32*cm
-                c.drawString(x, base, f"Foto {num}: {line1}")
-                if line2:
-                    c.drawString(x, base - 0.34*cm, line2)
-
-            for r in range(rows):
-                if idx < len(items):
-                    p, d = items[idx]; idx += 1
-                    draw_one(p, d, left_x, top - r*per_row_h, foto_num); foto_num += 1
-                if idx < len(items):
-                    p, d = items[idx]; idx += 1
-                    draw_one(p, d, right_x, top - r*per_row_h, foto_num); foto_num += 1
-
-            y = yf - rows*per_row_h - 0.3*cm
-
-    # Si es Bitácora, limitamos a 2 fotos
-    if ts in ("bitácora", "bitacora"):
-        fotos = fotos[:2]
-    draw_fotos(fotos)
-
-    # FIRMAS
-    need_firmas = 4.2*cm
-    y = _ensure_space(c, y, need_firmas, folio, fecha, tecnico, localidad)
-    yfm = _draw_section(c, "Firmas", y, need_firmas)
-    c.setFont("Helvetica", 9)
-    c.drawString(2.0*cm, yfm-1.0*cm, f"Técnico: {firma_tecnico_nombre}")
-    c.line(2.0*cm, yfm-2.7*cm, 9.2*cm, yfm-2.7*cm)
-    if firma_tecnico_path and os.path.exists(firma_tecnico_path):
-        c.drawImage(ImageReader(firma_tecnico_path), 2.0*cm, yfm-2.6*cm, width=7.2*cm, height=1.6*cm,
-                    preserveAspectRatio=True, anchor='sw')
-    c.drawString(10.2*cm, yfm-1.0*cm, f"Cliente: {firma_cliente_nombre}")
-    c.line(10.2*cm, yfm-2.7*cm, 17.2*cm, yfm-2.7*cm)
-    if firma_cliente_path and os.path.exists(firma_cliente_path):
-        c.drawImage(ImageReader(firma_cliente_path), 10.2*cm, yfm-2.6*cm, width=7.2*cm, height=1.6*cm,
-                    preserveAspectRatio=True, anchor='sw')
-
-    # --- cerrar el PDF y guardar en borrador ---
-    c.showPage(); c.save(); buf.seek(0)
-    pdf_bytes = buf.read()
-    nombre_pdf = f"REPORTE_{tipo_servicio.upper()}_{cliente.replace(' ', '_')}.pdf"
-
-    # Save report metadata to database for service history
-    save_report(
-        folio=folio,
-        fecha=fecha,
-        cliente=cliente,
-        tipo_equipo=tipo_equipo,
-        modelo=modelo,
-        serie=serie,
-        marca=marca,
-        potencia=potencia,
-        tipo_servicio=tipo_servicio,
-        descripcion_servicio=desc_servicio,
-        tecnico=tecnico,
-        localidad=localidad
-    )
+    hit, cache_key = _pdf_cache_hit(report)
+    if not hit:
+        # Copia en disco de fotos y firmas, en segundo plano desde los mismos bytes
+        persist_report_files(report)
+        # Guardar borrador completo con PDF (se copia del archivo temporal al BLOB por pedazos)
+        with spool_report_pdf(report) as pdf_file:
+            _save_draft_from_request(report, pdf_file, cache_key)
 
-    # Convertir fotos a base64 para guardar en borrador
-    # Convertir fotos a base64 para guardar en borrador
-    fotos_base64 = {}
-    for i in range(1, 5):
-        foto_file = request.files.get(f"foto{i}")
-        existing_b64 = request.form.get(f"foto{i}_existing")
-        
-        if foto_file and foto_file.filename:
-            # Re-read the file (it was already saved to disk above)
-            foto_file.seek(0)
-            foto_bytes = foto_file.read()
-            fotos_base64[f"foto{i}"] = base64.b64encode(foto_bytes).decode('utf-8')
-        elif existing_b64:
-            # Use existing base64 data
-            if "," in existing_b64:
-                existing_b64 = existing_b64.split(",")[1]
-            fotos_base64[f"foto{i}"] = existing_b64
-    
-    # Preparar form_data para guardar en borrador
-    form_data = {}
-    for key in request.form:
-        form_data[key] = request.form.get(key)
-    
-    # Guardar borrador completo con PDF
-    save_draft_report(
-        folio=folio,
-        form_data=form_data,
-        foto1=fotos_base64.get("foto1"),
-        foto2=fotos_base64.get("foto2"),
-        foto3=fotos_base64.get("foto3"),
-        foto4=fotos_base64.get("foto4"),
-        firma_tecnico=request.form.get("firma_tecnico_data"),
-        firma_cliente=request.form.get("firma_cliente_data"),
-        pdf_preview=pdf_bytes
-    )
+    _save_report_metadata(report)
 
     # Redirigir a vista previa en lugar de descargar
     return redirect(url_for("vista_previa", folio=folio))
 
 
+def _encolar_pdf():
+    """
+    Guarda el borrador del POST actual (sin PDF) y encola su render.
+    Regresa (folio, job_id); job_id es None si el PDF guardado sigue vigente.
+    """
+    report = _report_from_request()
+    folio = report["folio"]
+
+    hit, _ = _pdf_cache_hit(report)
+    if hit:
+        _save_report_metadata(report)
+        return folio, None
+
+    _save_draft_from_request(report)
+    return folio, enqueue_pdf_job(folio)
+
+@app.route("/api/pdf_jobs", methods=["POST"])
+def api_pdf_jobs_create():
+    """Queue a PDF render for the posted form and return the job id right away"""
+    if "user" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    folio, job_id = _encolar_pdf()
+    if job_id is None:
+        # Nothing changed since the last render: the stored PDF is current
+        return jsonify({
+            "job_id": None,
+            "folio": folio,
+            "status": "done",
+            "pdf_url": url_for("api_pdf_preview", folio=folio),
+            "preview_url": url_for("vista_previa", folio=folio)
+        })
+    return jsonify({
+        "job_id": job_id,
+        "folio": folio,
+        "status": "pending",
+        "status_url": url_for("api_pdf_job", job_id=job_id),
+        "preview_url": url_for("vista_previa", folio=folio, job=job_id)
+    }), 202
+
+@app.route("/api/pdf_jobs/<int:job_id>")
+def api_pdf_job(job_id):
+    """Status of a queued PDF render (pending, running, done, error)"""
+    if "user" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
+    
+    job = get_pdf_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    
+    return jsonify({
+        "job_id": job["id"],
+        "folio": job["folio"],
+        "status": job["status"],
+        "error": job["error"],
+        "pdf_url": url_for("api_pdf_preview", folio=job["folio"]) if job["status"] == "done" else None
+    })
+
 # === API: crear un nuevo folio y dejarlo en la sesión ===
 @app.route("/api/nuevo_folio", methods=["POST"])
 def api_nuevo_folio():
@@ -1077,7 +353,14 @@ def api_nuevo_folio():
 
 @app.route("/api/autosave_draft", methods=["POST"])
 def api_autosave_draft():
-    """Auto-save draft report (called every few seconds from JavaScript)"""
+    """
+    Auto-save draft report (called every few seconds from JavaScript).
+    
+    Patch mode: {folio, base_version, changes} with only the fields that
+    changed since base_version; images go as blob references from
+    /api/draft_images. A stale base_version gets 409 with the current version.
+    Without "changes" the whole form is saved (old clients).
+    """
     if "user" not in session:
         return jsonify({"error": "Not authenticated"}), 401
     
@@ -1087,6 +370,8 @@ def api_autosave_draft():
             return jsonify({"error": "No data"}), 400
         
         folio = data.get("folio")
+        if "changes" in data:
+            return _autosave_patch(folio, data)
         form_data = data.get("form_data", {})
         
         # Extract photos and signatures from form_data (they're stored there by serializeForm)
@@ -1111,52 +396,188 @@ def api_autosave_draft():
             firma_tecnico=firma_tecnico,
             firma_cliente=firma_cliente
         )
+        _ingest_photos([foto1, foto2, foto3, foto4])
         
         return jsonify({"success": True, "message": "Draft saved"})
     
+    except BlobRefError as e:
+        return _blob_ref_error(e)
     except Exception as e:
         print(f"Error saving draft: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/guardar_borrador", methods=["POST"])
-def guardar_borrador():
-    """Generate PDF preview and redirect to preview page"""
+@app.errorhandler(BlobRefError)
+def _blob_ref_error(e):
+    """
+    An image field carries a "blob:" reference the store never handed out
+    (forged, malformed or already collected): rejected, never stored. The
+    client uploads the image again and retries.
+    """
+    return jsonify({"error": "invalid_blob", "message": str(e)}), 400
+
+def _autosave_patch(folio, data):
+    """Patch mode of /api/autosave_draft (see apply_draft_patch)"""
+    base_version = data.get("base_version")
+    changes = data.get("changes")
+    if not folio:
+        return jsonify({"error": "Missing folio"}), 400
+    if type(base_version) is not int or not isinstance(changes, dict):
+        return jsonify({"error": "base_version (int) and changes (object) required"}), 400
+    changes = {k: v for k, v in changes.items() if not k.startswith("__")}
+    
+    applied, version = apply_draft_patch(folio, base_version, changes)
+    if not applied:
+        return jsonify({"error": "stale_version", "version": version}), 409
+    # Photos uploaded with /api/draft_images are already ingested
+    _ingest_photos(v for k, v in changes.items()
+                   if k.startswith("foto") and isinstance(v, str) and v.startswith("data:"))
+    return jsonify({"success": True, "version": version})
+
+@app.route("/api/draft_images", methods=["POST"])
+def api_draft_images():
+    """
+    Upload one draft image (multipart field "image", or JSON {"data": data URL})
+    and return its blob reference for /api/autosave_draft patches.
+    The upload's filename ("foto1_data", ...) tells photos from signatures.
+    """
     if "user" not in session:
-        return redirect(url_for("login"))
+        return jsonify({"error": "Not authenticated"}), 401
     
-    # This route will reuse the existing PDF generation logic from generar_pdf
-    # but instead of downloading, it saves to database and redirects to preview
+    if "image" in request.files:
+        name = request.files["image"].filename or ""
+        data = request.files["image"].read()
+    else:
+        payload = request.get_json(silent=True) or {}
+        name = payload.get("field") or ""
+        data = decode_image(payload.get("data"))
+    if not data:
+        return jsonify({"error": "No image"}), 400
+    ref = store_draft_blob(data)
+    if name.startswith("foto"):
+        _ingest_photos([data])
+    return jsonify({"ref": ref})
+
+# ---------- Resumable photo uploads ----------
+# POST /api/uploads {folio, slot, size, sha256} -> {upload_id, offset, chunk_size}
+# PUT  /api/uploads/<id>?offset=N  (raw bytes)  -> {offset}; 409 + {offset} if N is not where the server is
+# GET  /api/uploads/<id>                        -> {offset, size, status}, to resume
+# POST /api/uploads/<id>/finalize {sha256}     -> {ref, version}; the photo is attached to folio/slot
+
+def _upload_json(upload):
+    return {
+        "upload_id": upload["id"],
+        "folio": upload["folio"],
+        "slot": upload["slot"],
+        "size": upload["size"],
+        "offset": upload["received"],
+        "status": upload["status"],
+        "chunk_size": UPLOAD_CHUNK_BYTES
+    }
+
+@app.route("/api/uploads", methods=["POST"])
+def api_uploads_create():
+    """Start (or resume) a chunked upload of a photo for a folio's slot"""
+    if "user" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    folio = request.form.get("folio") or session.get("folio_actual")
+    data = request.get_json(silent=True) or {}
+    folio = data.get("folio")
+    slot = data.get("slot")
+    size = data.get("size")
+    sha256 = str(data.get("sha256") or "").lower()
+    if not folio or slot not in ("foto1", "foto2", "foto3", "foto4"):
+        return jsonify({"error": "folio and slot (foto1..foto4) required"}), 400
+    if type(size) is not int or not 0 < size <= UPLOAD_MAX_BYTES:
+        return jsonify({"error": f"size must be 1..{UPLOAD_MAX_BYTES} bytes"}), 400
+    if len(sha256) != 64 or any(ch not in "0123456789abcdef" for ch in sha256):
+        return jsonify({"error": "sha256 (hex) required"}), 400
+    
+    return jsonify(_upload_json(create_draft_upload(folio, slot, size, sha256)))
+
+@app.route("/api/uploads/<upload_id>", methods=["GET"])
+def api_uploads_status(upload_id):
+    """Where a chunked upload stands, to resume it"""
+    if "user" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    # First, save all form data to draft (similar to autosave but with files)
-    form_data = {}
-    for key in request.form:
-        form_data[key] = request.form.get(key)
+    upload = get_draft_upload(upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(_upload_json(upload))
+
+@app.route("/api/uploads/<upload_id>", methods=["PUT"])
+def api_uploads_chunk(upload_id):
+    """Write one chunk at ?offset=N; the offset must be where the server is"""
+    if "user" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    # Handle photo uploads - convert to Base64
-    fotos_base64 = {}
-    for i in range(1, 5):
-        foto_file = request.files.get(f"foto{i}")
-        if foto_file and foto_file.filename:
-            foto_bytes = foto_file.read()
-            fotos_base64[f"foto{i}_data"] = base64.b64encode(foto_bytes).decode('utf-8')
+    upload = get_draft_upload(upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    if upload["status"] != "open":
+        return jsonify({"error": f"Upload is {upload['status']}"}), 409
+    
+    offset = request.args.get("offset", type=int)
+    if offset != upload["received"]:
+        return jsonify({"error": "offset_mismatch", "offset": upload["received"]}), 409
+    if (request.content_length or 0) > UPLOAD_MAX_CHUNK_BYTES:
+        return jsonify({"error": f"Chunks up to {UPLOAD_MAX_CHUNK_BYTES} bytes"}), 413
+    chunk = request.get_data(cache=False)
+    if not chunk or offset + len(chunk) > upload["size"]:
+        return jsonify({"error": "Chunk empty or past the declared size"}), 400
+    
+    write_partial(upload_id, offset, chunk)
+    if not advance_draft_upload(upload_id, offset, offset + len(chunk)):
+        # Another request for the same offset won the race
+        upload = get_draft_upload(upload_id)
+        return jsonify({"error": "offset_mismatch", "offset": upload["received"]}), 409
+    return jsonify({"offset": offset + len(chunk)})
+
+@app.route("/api/uploads/<upload_id>/finalize", methods=["POST"])
+def api_uploads_finalize(upload_id):
+    """Check the assembled file against its checksum and attach it to the folio's slot"""
+    if "user" not in session:
+        return jsonify({"error": "Not authenticated"}), 401
     
-    # Generate PDF (reuse existing logic but capture to bytes)
-    pdf_bytes = _generate_pdf_bytes(request.form, request.files)
+    upload = get_draft_upload(upload_id)
+    if not upload:
+        return jsonify({"error": "Upload not found"}), 404
+    if upload["status"] != "open":
+        return jsonify({"error": f"Upload is {upload['status']}"}), 409
+    if upload["received"] != upload["size"]:
+        return jsonify({"error": "incomplete", "offset": upload["received"]}), 409
+    
+    sha256 = str((request.get_json(silent=True) or {}).get("sha256") or upload["sha256"]).lower()
+    digest, size = partial_digest(upload_id)
+    if digest != sha256 or digest != upload["sha256"] or size != upload["size"]:
+        # Corrupt: start over
+        finish_draft_upload(upload_id, "failed")
+        discard_partial(upload_id)
+        return jsonify({"error": "checksum_mismatch"}), 422
+    
+    ref = make_ref(digest)
+    try:
+        version = attach_draft_image(upload["folio"], f"{upload['slot']}_data", ref, upload_id=upload_id)
+    except LookupError:
+        # Finalized by a concurrent request
+        return jsonify({"error": "Upload is not open"}), 409
+    _ingest_photos([ref])
+    return jsonify({"ref": ref, "version": version})
+
+@app.route("/guardar_borrador", methods=["POST"])
+def guardar_borrador():
+    """Generate PDF preview and redirect to preview page"""
+    if "user" not in session:
+        return redirect(url_for("login"))
     
-    # Save complete draft including PDF
-    save_draft_report(
-        folio=folio,
-        form_data=form_data,
-        foto1=fotos_base64.get("foto1_data"),
-        foto2=fotos_base64.get("foto2_data"),
-        foto3=fotos_base64.get("foto3_data"),
-        foto4=fotos_base64.get("foto4_data"),
-        firma_tecnico=request.form.get("firma_tecnico_data"),
-        firma_cliente=request.form.get("firma_cliente_data"),
-        pdf_preview=pdf_bytes
-    )
+    report = _report_from_request()
+    folio = report["folio"]
+    
+    hit, cache_key = _pdf_cache_hit(report)
+    if not hit:
+        # Save complete draft including PDF
+        with spool_report_pdf(report) as pdf_file:
+            _save_draft_from_request(report, pdf_file, cache_key)
     
     return redirect(url_for("vista_previa", folio=folio))
 
@@ -1166,27 +587,29 @@ def vista_previa(folio):
     if "user" not in session:
         return redirect(url_for("login"))
     
-    draft = get_draft_by_folio(folio)
-    if not draft:
+    # Only the client email is needed here
+    form_data = get_draft_form_data(folio)
+    if form_data is None:
         return "Borrador no encontrado", 404
+    client_email = form_data.get("email", "")
     
-    # Parse form_data to get client email
-    try:
-        form_data = json.loads(draft["form_data"]) if isinstance(draft["form_data"], str) else draft["form_data"]
-        client_email = form_data.get("email", "")
-    except:
-        client_email = ""
+    # ?job=<id> while the PDF is still being rendered by the queue
+    job = None
+    job_id = request.args.get("job", type=int)
+    if job_id:
+        job = get_pdf_job(job_id)
+        if job and (job["folio"] != folio or job["status"] == "done"):
+            job = None
     
     return render_template("vista_previa.html", 
                          folio=folio,
                          client_email=client_email,
-                         draft=draft)
+                         job=job)
 
 
-def _get_filename_from_draft(draft, folio):
-    """Generate filename: Tipo_Descripcion_Folio.pdf"""
+def _get_filename_from_draft(form_data, folio):
+    """Generate filename: Tipo_Descripcion_Folio.pdf (from the draft's form_data)"""
     try:
-        form_data = json.loads(draft["form_data"]) if isinstance(draft["form_data"], str) else draft["form_data"]
         tipo = form_data.get("tipo_servicio", "Servicio").strip().replace(" ", "_")
         desc = form_data.get("descripcion_servicio", "Descripcion").strip().replace(" ", "_")
         
@@ -1208,19 +631,32 @@ def api_pdf_preview(folio):
     if "user" not in session:
         return ("", 401)
     
-    draft = get_draft_by_folio(folio)
-    if not draft or not draft.get("pdf_preview"):
+    opened = open_draft_pdf(folio)
+    if opened is None:
         return "PDF no encontrado", 404
+    pdf_size, chunks = opened
     
     should_download = request.args.get('download') == 'true'
-    filename = _get_filename_from_draft(draft, folio)
-    
-    return send_file(
-        io.BytesIO(draft["pdf_preview"]),
-        mimetype="application/pdf",
-        as_attachment=should_download,
-        download_name=filename
-    )
+    filename = _get_filename_from_draft(get_draft_form_data(folio), folio)
+    
+    # Streamed from the BLOB in chunks: the whole PDF is never in memory.
+    # Size and chunks come from the same snapshot, so Content-Length matches the body.
+    response = Response(chunks, mimetype="application/pdf", direct_passthrough=True)
+    response.content_length = pdf_size
+    _set_content_disposition(response, filename, should_download)
+    return response
+
+def _set_content_disposition(response, filename, as_attachment):
+    """Content-Disposition like flask.send_file builds it (ASCII fallback + RFC 5987 filename*)"""
+    value = {"filename": filename}
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        value = {
+            "filename": unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii"),
+            "filename*": f"UTF-8''{quote(filename, safe='!#$&+-.^_`|~')}"
+        }
+    response.headers.set("Content-Disposition", "attachment" if as_attachment else "inline", **value)
 
 @app.route("/editar_reporte/<folio>")
 def editar_reporte(folio):
@@ -1259,15 +695,53 @@ def api_load_draft(folio):
     except:
         form_data = {}
     
-    return jsonify({
-        "form_data": form_data,
-        "foto1_data": draft.get("foto1_data"),
-        "foto2_data": draft.get("foto2_data"),
-        "foto3_data": draft.get("foto3_data"),
-        "foto4_data": draft.get("foto4_data"),
-        "firma_tecnico_data": draft.get("firma_tecnico_data"),
-        "firma_cliente_data": draft.get("firma_cliente_data")
-    })
+    # Photos travel as their stored reference (the form posts it back as is)
+    # plus a thumbnail URL to show; only the small signatures go as data URLs.
+    # applyDraft restores the images from form_data, so they go there too.
+    images, thumbnails = {}, {}
+    for key in DRAFT_IMAGE_COLUMNS:
+        value = draft.get(key)
+        if key.startswith("foto"):
+            images[key] = value
+            if value:
+                thumbnails[key] = url_for("api_draft_image", folio=folio, name=key[:-len("_data")],
+                                          size="thumb", v=ref_hash(value)[:16] if is_ref(value) else None)
+        else:
+            images[key] = load_data_url(value)
+        if images[key]:
+            form_data[key] = images[key]
+    
+    return jsonify({"form_data": form_data, "version": draft["version"], "thumbnails": thumbnails, **images})
+
+@app.route("/api/draft_image/<folio>/<name>")
+def api_draft_image(folio, name):
+    """Return one draft image (foto1..foto4, firma_tecnico, firma_cliente); ?size=thumb for its thumbnail"""
+    if "user" not in session:
+        return ("", 401)
+    
+    column = f"{name}_data"
+    if column not in DRAFT_IMAGE_COLUMNS:
+        return "Imagen no encontrada", 404
+    value = get_draft_image(folio, column)
+    data = load_bytes(value)
+    if not data:
+        return "Imagen no encontrada", 404
+    
+    as_thumb = request.args.get("size") == "thumb"
+    if as_thumb:
+        data = thumbnail(data) or data
+    
+    response = Response(data, mimetype=mime_of(data))
+    if response.mimetype == "image/svg+xml":
+        # Vector signatures: shown as an image, never run as a document
+        response.headers["Content-Security-Policy"] = "default-src 'none'; style-src 'unsafe-inline'; sandbox"
+    if is_ref(value):
+        # Content-addressed: the reference only changes when the image does
+        response.set_etag(ref_hash(value) + ("-thumb" if as_thumb else ""))
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+    return response
 
 @app.route("/enviar_reporte/<folio>", methods=["POST"])
 def enviar_reporte(folio):
@@ -1275,14 +749,14 @@ def enviar_reporte(folio):
     if "user" not in session:
         return redirect(url_for("login"))
     
-    # Get draft data
-    draft = get_draft_by_folio(folio)
-    if not draft or not draft.get("pdf_preview"):
+    # Only the metadata and form_data here; the PDF is read when attaching it
+    meta = get_draft_meta(folio)
+    form_data = get_draft_form_data(folio)
+    if not meta or not meta["pdf_size"]:
         return "Reporte no encontrado", 404
     
     # Get client email from form data
     try:
-        form_data = json.loads(draft["form_data"]) if isinstance(draft["form_data"], str) else draft["form_data"]
         client_email = form_data.get("email", "").strip()
         cliente_nombre = form_data.get("cliente", "Cliente")
         tipo_servicio = form_data.get("tipo_servicio", "servicio")
@@ -1324,9 +798,9 @@ InAIR - Servicio Técnico
         
         msg.attach(MIMEText(body, 'plain'))
         
-        # Attach PDF
-        pdf_bytes = draft["pdf_preview"]
-        filename = _get_filename_from_draft(draft, folio)
+        # Attach PDF (the MIME part needs it whole)
+        pdf_bytes = get_draft_pdf(folio)
+        filename = _get_filename_from_draft(form_data, folio)
         pdf_attachment = MIMEApplication(pdf_bytes, _subtype="pdf")
         pdf_attachment.add_header('Content-Disposition', 'attachment', 
                                  filename=filename)
@@ -1455,17 +929,28 @@ def admin_usuarios_eliminar(user_id):
 @require_role("admin")
 def admin_historial():
     """View service history with filters"""
-    search_term = request.args.get("search", "").strip()
-    tipo_servicio = request.args.get("tipo_servicio", "").strip()
-    fecha_inicio = request.args.get("fecha_inicio", "").strip()
-    fecha_fin = request.args.get("fecha_fin", "").strip()
-    
-    if search_term or tipo_servicio or fecha_inicio or fecha_fin:
-        reports = search_reports(search_term, tipo_servicio, fecha_inicio, fecha_fin)
-    else:
-        reports = get_all_reports()
+    # Solo la primera página; el resto lo pide la vista a /api/historial al hacer scroll
+    reports, next_cursor = get_reports_page(**_historial_filters())
     
-    return render_template("admin_historial.html", reports=reports)
+    return render_template("admin_historial.html", reports=reports, next_cursor=next_cursor)
+
+def _historial_filters():
+    """Filtros del historial tal como llegan en la URL"""
+    return {name: request.args.get(key, "").strip() for name, key in (
+        ("search_term", "search"), ("tipo_servicio", "tipo_servicio"),
+        ("fecha_inicio", "fecha_inicio"), ("fecha_fin", "fecha_fin"))}
+
+@app.route("/api/historial")
+@require_role("admin")
+def api_historial():
+    """Siguiente página del historial: {reports, next}; next es null en la última"""
+    limit = min(request.args.get("limit", REPORTS_PAGE_SIZE, type=int), 200)
+    try:
+        reports, next_cursor = get_reports_page(
+            **_historial_filters(), cursor=request.args.get("cursor") or None, limit=max(limit, 1))
+    except ValueError:
+        return jsonify({"error": "Cursor inválido"}), 400
+    return jsonify({"reports": reports, "next": next_cursor})
 
 @app.route("/admin/historial/<folio>")
 @require_role("admin")
@@ -1747,28 +1232,9 @@ def admin_calendario():
 def api_cliente_equipos(cliente_id):
     """Obtener equipos asignados a un cliente desde equipos_calendario + info del cliente"""
     try:
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        
-        # Get client info
-        c.execute("SELECT * FROM clients WHERE id = ?", (cliente_id,))
-        cliente = c.fetchone()
-        
-        # Get equipment
-        c.execute("""
-            SELECT id, serie, tipo_equipo, modelo, marca, potencia 
-            FROM equipos_calendario 
-            WHERE cliente_id = ? AND activo = 1
-            ORDER BY tipo_equipo, modelo, serie
-        """, (cliente_id,))
-        
-        equipos = [dict(row) for row in c.fetchall()]
-        conn.close()
-        
         return jsonify({
-            "cliente": dict(cliente) if cliente else None,
-            "equipos": equipos
+            "cliente": get_client_by_id(cliente_id),
+            "equipos": get_calendar_equipment_by_client(cliente_id)
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1779,68 +1245,30 @@ def api_cliente_equipos(cliente_id):
 def api_equipos_list():
     """Listar todos los equipos del calendario"""
     try:
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT 
-                e.*,
-                c.nombre as cliente_nombre
-            FROM equipos_calendario e
-            LEFT JOIN clients c ON e.cliente_id = c.id
-            WHERE e.activo = 1
-            ORDER BY e.id DESC
-        """)
-        
-        equipos = [dict(row) for row in c.fetchall()]
-        conn.close()
-        
-        return jsonify(equipos)
+        return jsonify(get_calendar_equipment())
     except Exception as e:
         print(f"ERROR API EQUIPOS: {e}")
         return jsonify({"error": str(e)}), 500
 
+def _calendar_equipment_fields(data):
+    """Campos de equipos_calendario tal como llegan del formulario de equipos"""
+    fields = {name: data.get(name) for name in CALENDAR_EQUIPMENT_FIELDS}
+    fields["cliente_id"] = int(data["cliente_id"]) if data.get("cliente_id") else None
+    fields["reiniciar_en_horas"] = int(data["reiniciar_en_horas"]) if data.get("reiniciar_en_horas") else None
+    fields["tipo_servicio_inicial"] = data.get("tipo_servicio_inicial", "2000 Horas")
+    fields["clasificacion"] = data.get("clasificacion", "General")
+    return fields
+
 @app.route("/api/equipos_create", methods=["POST"])
 @require_role("admin")
 def api_equipos_create():
     """Crear nuevo equipo en calendario"""
     data = request.json
     
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    
-    print(f"DEBUG CREATE EQUIPO: {data}") # Debug log
-    
     try:
-        c.execute("""
-            INSERT INTO equipos_calendario 
-            (cliente_id, serie, tipo_equipo, modelo, marca, potencia, 
-             frecuencia_meses, mes_inicio, anio_inicio, tipo_servicio_inicial, reiniciar_en_horas, notas, clasificacion)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            int(data.get("cliente_id")) if data.get("cliente_id") else None,
-            data.get("serie"),
-            data.get("tipo_equipo"),
-            data.get("modelo"),
-            data.get("marca"),
-            data.get("potencia"),
-            data.get("frecuencia_meses"),
-            data.get("mes_inicio"),
-            data.get("anio_inicio"),
-            data.get("tipo_servicio_inicial", "2000 Horas"),
-            int(data.get("reiniciar_en_horas")) if data.get("reiniciar_en_horas") else None,
-            data.get("notas"),
-            data.get("clasificacion", "General")
-        ))
-        
-        conn.commit()
-        equipo_id = c.lastrowid
-        conn.close()
-        
+        equipo_id = create_calendar_equipment(data.get("serie"), **_calendar_equipment_fields(data))
         return jsonify({"success": True, "id": equipo_id})
     except sqlite3.IntegrityError:
-        conn.close()
         return jsonify({"success": False, "error": "Serie ya existe"}), 400
 
 @app.route("/api/equipos_update/<int:equipo_id>", methods=["PUT"])
@@ -1849,50 +1277,14 @@ def api_equipos_update(equipo_id):
     """Actualizar equipo"""
     data = request.json
     
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    
-    print(f"DEBUG UPDATE EQUIPO {equipo_id}: {data}") # Debug log
-    
-    c.execute("""
-        UPDATE equipos_calendario 
-        SET cliente_id=?, tipo_equipo=?, modelo=?, marca=?, potencia=?,
-            frecuencia_meses=?, mes_inicio=?, anio_inicio=?, tipo_servicio_inicial=?, reiniciar_en_horas=?, notas=?, clasificacion=?
-        WHERE id=?
-    """, (
-        int(data.get("cliente_id")) if data.get("cliente_id") else None,
-        data.get("tipo_equipo"),
-        data.get("modelo"),
-        data.get("marca"),
-        data.get("potencia"),
-        data.get("frecuencia_meses"),
-        data.get("mes_inicio"),
-        data.get("anio_inicio"),
-        data.get("tipo_servicio_inicial", "2000 Horas"),
-        int(data.get("reiniciar_en_horas")) if data.get("reiniciar_en_horas") else None,
-        data.get("notas"),
-        data.get("clasificacion", "General"),
-        equipo_id
-    ))
-    
-    conn.commit()
-    conn.close()
-    
+    update_calendar_equipment(equipo_id, **_calendar_equipment_fields(data))
     return jsonify({"success": True})
 
 @app.route("/api/equipos/<int:equipo_id>/kits", methods=["GET"])
 @require_role("admin")
 def api_equipos_kits_get(equipo_id):
     """Obtener kits de refacciones para un equipo"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM equipos_kits WHERE equipo_id = ?", (equipo_id,))
-    kits = [dict(row) for row in c.fetchall()]
-    conn.close()
-    
-    return jsonify(kits)
+    return jsonify(get_equipment_kits(equipo_id))
 
 @app.route("/api/equipos/<int:equipo_id>/kits", methods=["POST"])
 @require_role("admin")
@@ -1900,24 +1292,11 @@ def api_equipos_kits_save(equipo_id):
     """Guardar kits de refacciones para un equipo"""
     data = request.json # Expects list of kits: [{tipo_servicio, refacciones_json}, ...]
     
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    
     try:
-        # Delete existing kits for this equipment to replace with new list
-        c.execute("DELETE FROM equipos_kits WHERE equipo_id = ?", (equipo_id,))
-        
-        for kit in data:
-            c.execute("""
-                INSERT INTO equipos_kits (equipo_id, tipo_servicio, refacciones_json)
-                VALUES (?, ?, ?)
-            """, (equipo_id, kit['tipo_servicio'], kit['refacciones_json']))
-        
-        conn.commit()
-        conn.close()
+        # Reemplaza la lista completa; si algo falla se conservan los kits anteriores
+        replace_equipment_kits(equipo_id, data)
         return jsonify({"success": True})
     except Exception as e:
-        conn.close()
         print(f"ERROR SAVING KITS: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -1925,57 +1304,26 @@ def api_equipos_kits_save(equipo_id):
 @require_role("admin")
 def api_equipos_delete(equipo_id):
     """Eliminar equipo (soft delete)"""
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    
-    c.execute("UPDATE equipos_calendario SET activo = 0 WHERE id = ?", (equipo_id,))
-    
-    conn.commit()
-    conn.close()
-    
+    deactivate_calendar_equipment(equipo_id)
     return jsonify({"success": True})
 
 @app.route("/api/equipos_historial/<int:equipo_id>", methods=["GET"])
 @require_role("admin")
 def api_equipos_historial(equipo_id):
     """Obtener historial de servicios del equipo"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    equipo = get_calendar_equipment_by_id(equipo_id)
     
-    # Obtener serie del equipo
-    c.execute("SELECT serie FROM equipos_calendario WHERE id = ?", (equipo_id,))
-    result = c.fetchone()
-    
-    if not result:
-        conn.close()
+    if not equipo:
         return jsonify([])
     
-    serie = result["serie"]
-    
-    # Buscar reportes que contengan esa serie
-    c.execute("""
-        SELECT folio, fecha_creation, form_data
-        FROM drafts
-        WHERE form_data LIKE ?
-        ORDER BY fecha_creation DESC
-    """, (f"%{serie}%",))
-    
-    reportes = []
-    for row in c.fetchall():
-        try:
-            form_data = json.loads(row["form_data"])
-            if form_data.get("serie") == serie:
-                reportes.append({
-                    "folio": row["folio"],
-                    "fecha": row["fecha_creation"],
-                    "tipo_servicio": form_data.get("tipo_servicio"),
-                    "descripcion": form_data.get("descripcion_servicio")
-                })
-        except:
-            pass
+    # Reportes terminados con esa serie
+    reportes = [{
+        "folio": r["folio"],
+        "fecha": r["fecha"],
+        "tipo_servicio": r["tipo_servicio"],
+        "descripcion": r["descripcion_servicio"]
+    } for r in get_equipment_service_history(equipo["serie"])]
     
-    conn.close()
     return jsonify(reportes)
 
 # ==================== FASE 4: CATÁLOGO DE REFACCIONES ====================
@@ -1984,15 +1332,7 @@ def api_equipos_historial(equipo_id):
 @require_role("admin")
 def api_refacciones_catalogo():
     """Listar catálogo de refacciones"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM refacciones_catalogo ORDER BY tipo_equipo, tipo_servicio")
-    refacciones = [dict(row) for row in c.fetchall()]
-    conn.close()
-    
-    return jsonify(refacciones)
+    return jsonify(get_parts_catalog())
 
 @app.route("/api/refacciones_catalogo/create", methods=["POST"])
 @require_role("admin")
@@ -2000,76 +1340,38 @@ def api_refacciones_catalogo_create():
     """Crear refacción en catálogo"""
     data = request.json
     
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    
     try:
-        c.execute("""
-            INSERT INTO refacciones_catalogo 
-            (tipo_equipo, tipo_servicio, nombre_refaccion, cantidad, unidad)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
+        create_catalog_part(
             data.get("tipo_equipo"),
             data.get("tipo_servicio"),
             data.get("nombre_refaccion"),
             data.get("cantidad"),
             data.get("unidad")
-        ))
-        
-        conn.commit()
-        conn.close()
+        )
         return jsonify({"success": True})
     except sqlite3.IntegrityError:
-        conn.close()
         return jsonify({"success": False, "error": "Refacción ya existe"}), 400
 
 @app.route("/api/refacciones_catalogo/<int:id>", methods=["DELETE"])
 @require_role("admin")
 def api_refacciones_catalogo_delete(id):
     """Eliminar refacción del catálogo"""
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    c.execute("DELETE FROM refacciones_catalogo WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+    delete_catalog_part(id)
     return jsonify({"success": True})
 
 @app.route("/api/equipos/<int:equipo_id>/refacciones", methods=["GET"])
 @require_role("admin")
 def api_equipos_refacciones(equipo_id):
     """Obtener refacciones de un equipo (catálogo + custom)"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Obtener tipo de equipo
-    c.execute("SELECT tipo_equipo FROM equipos_calendario WHERE id = ?", (equipo_id,))
-    result = c.fetchone()
+    equipo = get_calendar_equipment_by_id(equipo_id)
     
-    if not result:
-        conn.close()
+    if not equipo:
         return jsonify({"catalogo": [], "custom": []})
     
-    tipo_equipo = result["tipo_equipo"]
-    
-    # Catálogo general
-    c.execute("""
-        SELECT * FROM refacciones_catalogo 
-        WHERE tipo_equipo = ?
-        ORDER BY tipo_servicio, nombre_refaccion
-    """, (tipo_equipo,))
-    catalogo = [dict(row) for row in c.fetchall()]
-    
-    # Custom del equipo
-    c.execute("""
-        SELECT * FROM equipos_refacciones_custom 
-        WHERE equipo_id = ?
-        ORDER BY tipo_servicio, nombre_refaccion
-    """, (equipo_id,))
-    custom = [dict(row) for row in c.fetchall()]
-    
-    conn.close()
-    return jsonify({"catalogo": catalogo, "custom": custom})
+    return jsonify({
+        "catalogo": get_parts_catalog(equipo["tipo_equipo"]),
+        "custom": get_equipment_custom_parts(equipo_id)
+    })
 
 # ==================== FASE 5: CALENDARIO DE MANTENIMIENTO ====================
 
@@ -2077,39 +1379,13 @@ def api_equipos_refacciones(equipo_id):
 @require_role("admin")
 def api_calendario_mes(anio, mes):
     """Obtener equipos que requieren servicio en un mes específico"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
     equipos = []
     
-    # Fetch all kits to avoid N+1 queries
-    c.execute("SELECT * FROM equipos_kits")
-    all_kits = [dict(row) for row in c.fetchall()]
-    # Group kits by equipment_id
-    kits_by_equipo = {}
-    for k in all_kits:
-        if k['equipo_id'] not in kits_by_equipo:
-            kits_by_equipo[k['equipo_id']] = []
-        kits_by_equipo[k['equipo_id']].append(k)
-
-    for row in c.fetchall(): # This fetchall is empty because I already fetched above? No, different cursor execution.
-        # Wait, I need to re-execute the equipment query or fetch before kits query.
-        pass
-    
-    # Let's re-structure to be safe
-    c.execute("""
-        SELECT 
-            e.*,
-            c.nombre as cliente_nombre
-        FROM equipos_calendario e
-        LEFT JOIN clients c ON e.cliente_id = c.id
-        WHERE e.activo = 1
-    """)
-    rows = c.fetchall()
-    
-    for row in rows:
-        equipo = dict(row)
+    # Kits y reportes del mes en una consulta cada uno, no una por equipo
+    kits_by_equipo = get_kits_by_equipment()
+    folios_del_mes = get_month_report_folios(anio, mes)
+    
+    for equipo in get_calendar_equipment():
         # Calcular si le toca servicio este mes
         mes_inicio = equipo["mes_inicio"]
         anio_inicio = equipo["anio_inicio"]
@@ -2175,25 +1451,16 @@ def api_calendario_mes(anio, mes):
             equipo["refacciones_sugeridas"] = suggested_parts
             
             # Check if service was completed (report exists for this month/year)
-            c.execute("""
-                SELECT folio, fecha FROM reports 
-                WHERE serie = ? 
-                AND strftime('%Y', fecha) = ? 
-                AND strftime('%m', fecha) = ?
-                ORDER BY fecha DESC LIMIT 1
-            """, (equipo['serie'], str(anio), str(mes).zfill(2)))
-            
-            report_row = c.fetchone()
-            if report_row:
+            folio_servicio = folios_del_mes.get(equipo['serie'])
+            if folio_servicio:
                 equipo["estatus_servicio"] = "REALIZADO"
-                equipo["folio_servicio"] = report_row[0]  # For clickable link
+                equipo["folio_servicio"] = folio_servicio  # For clickable link
             else:
                 equipo["estatus_servicio"] = "PENDIENTE"
                 equipo["folio_servicio"] = None
             
             equipos.append(equipo)
     
-    conn.close()
     return jsonify(equipos)
 
 
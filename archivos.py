@@ -0,0 +1,341 @@
+# archivos.py
+# Copias en disco de las fotos y firmas de cada folio (static/uploads, static/firmas).
+#
+# Se escriben desde los mismos bytes que ya decodificó parse_report (no se
+# vuelve a leer ni decodificar nada) y, desde un request, en segundo plano
+# con persist_report_files: el PDF y el borrador no esperan al disco.
+#
+# Los archivos van repartidos por hash del folio, <dir>/ab/<folio>_foto1.png,
+# para que ningún directorio crezca sin límite; report_file_path da la ruta.
+# Una copia de antes que sigue en el directorio plano se mueve a su lugar la
+# próxima vez que se escribe su folio (find_report_file la encuentra); todas
+# de una vez, con:
+#
+#   python archivos.py --migrar                  # lotes de 500, pausa de 0.2 s
+#   python archivos.py --migrar --lote 100 --pausa 1
+#
+# Huérfanos (copias, blobs y subidas que ya nadie usa) y uso de disco:
+#
+#   python archivos.py --huerfanos               # solo lista (dry run)
+#   python archivos.py --huerfanos --aplicar --gracia-dias 14
+#   python archivos.py --uso
+import os, io, re, time, base64, hashlib, argparse, itertools
+from collections import defaultdict
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+import blobs
+from firmas import is_vector
+from compactar import PDF_ARCHIVE_DIR
+from database import (
+    DB_NAME, get_folio_file_index, get_technicians_by_prefix, get_draft_blob_hashes,
+    get_unreferenced_blobs, delete_unreferenced_blob, get_stale_draft_uploads,
+    get_draft_upload, finish_draft_upload
+)
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = os.path.join(APP_ROOT, "static", "uploads")
+FIRMAS_DIR = os.path.join(APP_ROOT, "static", "firmas")
+# Nada más nuevo que esto se considera huérfano (escrituras en curso, subidas a medias)
+GRACE_DAYS = int(os.environ.get("ORPHAN_GRACE_DAYS", "7"))
+
+# Nombres de las copias: <folio>_foto1.png, <folio>_firma_tecnico.svg, ...
+_FILE_RE = re.compile(r"^(?P<folio>.+)_(foto\d+|firma_tecnico|firma_cliente)\.(png|svg)$")
+
+def _shard(folio):
+    return hashlib.sha1(folio.encode("utf-8")).hexdigest()[:2]
+
+def report_file_path(base_dir, folio, name):
+    """Ruta de la copia `name` (p. ej. "foto1.png") de un folio dentro de base_dir."""
+    return os.path.join(base_dir, _shard(folio), f"{folio}_{name}")
+
+def find_report_file(base_dir, folio, name):
+    """Ruta de una copia existente: la repartida o, si aún no se migra, la del directorio plano. None si no hay."""
+    for path in (report_file_path(base_dir, folio, name), os.path.join(base_dir, f"{folio}_{name}")):
+        if os.path.exists(path):
+            return path
+    return None
+
+def _copy_path(base_dir, folio, name):
+    """
+    Ruta donde va la copia `name` de un folio. Si la copia sigue en el
+    directorio plano (sin migrar) se mueve primero a su lugar, para que se
+    compare y se reescriba ahí y no quede duplicada.
+    """
+    path = report_file_path(base_dir, folio, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    found = find_report_file(base_dir, folio, name)
+    if found and found != path:
+        os.replace(found, path)
+    return path
+
+# Un solo hilo: las copias de un folio se escriben en el orden en que llegaron
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archivos")
+
+def _write_if_changed(path, data):
+    """Escribe `data` en `path` salvo que el archivo ya tenga exactamente esos bytes."""
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return False
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+def save_signature_png(data, folio, name):
+    """
+    Copia de la firma `name` ("firma_tecnico" / "firma_cliente") de un folio,
+    desde bytes o un data URL. Las firmas en trazos (.svg) y las que ya son PNG
+    se escriben tal cual; solo otros formatos pasan por PIL para volverse PNG.
+    """
+    if not data:
+        return None
+    if isinstance(data, str):
+        if not data.startswith("data:image"): return None
+        header, b64 = data.split(",", 1)
+        data = base64.b64decode(b64)
+    vector = is_vector(data)
+    path = _copy_path(FIRMAS_DIR, folio, name + (".svg" if vector else ".png"))
+    if vector or blobs.mime_of(data) == "image/png":
+        _write_if_changed(path, data)
+        return path
+    try:
+        img = Image.open(io.BytesIO(data)).convert("RGBA")
+        bg = Image.new("RGBA", img.size, (255,255,255,255))
+        bg.alpha_composite(img)
+        bg.convert("RGB").save(path, format="PNG")
+    except Exception:
+        with open(path, "wb") as f: f.write(data)
+    return path
+
+def save_report_files(report):
+    """Escribe las fotos y las firmas del reporte (bytes de parse_report) del folio en disco."""
+    folio = report["folio"]
+    for foto in report["fotos"]:
+        _write_if_changed(_copy_path(UPLOAD_DIR, folio, f"foto{foto['slot']}.png"), foto["data"])
+    save_signature_png(report["firma_tecnico"], folio, "firma_tecnico")
+    save_signature_png(report["firma_cliente"], folio, "firma_cliente")
+
+def persist_report_files(report):
+    """save_report_files en segundo plano. Regresa el Future."""
+    return _writer.submit(save_report_files, report)
+
+# ------------------ migración al directorio repartido ------------------
+def migrate_flat_files(base_dir, batch=500, pause=0.2):
+    """
+    Mueve las copias del directorio plano base_dir a su subdirectorio por hash,
+    de `batch` en `batch` con una pausa entre lotes; la app sigue escribiendo
+    mientras tanto. Si la copia repartida ya existe es más nueva (se escribió
+    después de empezar) y la plana se borra; si la plana ya no está (un
+    guardado la movió con _copy_path) cuenta como descartada también.
+    Regresa (movidos, descartados).
+    """
+    moved = dropped = 0
+    while True:
+        with os.scandir(base_dir) as it:
+            found = (_FILE_RE.match(e.name) for e in it if e.is_file())
+            matches = list(itertools.islice(filter(None, found), batch))
+        if not matches:
+            return moved, dropped
+        for m in matches:
+            folio = m.group("folio")
+            src = os.path.join(base_dir, m.string)
+            dst = report_file_path(base_dir, folio, m.string[len(folio) + 1:])
+            try:
+                if os.path.exists(dst):
+                    os.remove(src)
+                    dropped += 1
+                    continue
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                os.replace(src, dst)
+            except FileNotFoundError:
+                dropped += 1
+                continue
+            moved += 1
+        time.sleep(pause)
+
+# ------------------ huérfanos ------------------
+def _copies():
+    """(ruta, match de _FILE_RE) de cada copia, repartida o aún en el directorio plano."""
+    for base_dir in (UPLOAD_DIR, FIRMAS_DIR):
+        for root, _, files in os.walk(base_dir):
+            for name in files:
+                m = _FILE_RE.match(name)
+                if m:
+                    yield os.path.join(root, name), m
+
+def find_orphan_copies():
+    """
+    Copias que ya no corresponden a nada: su folio no está en draft_reports ni
+    en reports; la foto o firma se quitó de un borrador sin enviar; o hay una
+    más nueva de la misma foto/firma (.png y .svg, plana y repartida). Los
+    borradores enviados conservan sus copias: compactar.py les quita las
+    imágenes a propósito.
+    """
+    drafts, reported = get_folio_file_index()
+    orphans, current = [], defaultdict(list)
+    for path, m in _copies():
+        folio, name = m.group("folio"), m.group(2)
+        draft = drafts.get(folio)
+        if draft is None:
+            if folio not in reported:
+                orphans.append(path)
+                continue
+        elif draft["status"] != "sent" and f"{name}_data" not in draft["images"]:
+            orphans.append(path)
+            continue
+        current[(folio, name)].append(path)
+    for paths in current.values():
+        orphans.extend(_by_mtime(paths)[:-1])
+    return orphans
+
+def _by_mtime(paths):
+    """Las rutas que aún existen, de la más vieja a la más nueva (un guardado pudo moverlas o borrarlas)."""
+    dated = []
+    for path in paths:
+        try:
+            dated.append((os.path.getmtime(path), path))
+        except FileNotFoundError:
+            pass
+    dated.sort(key=lambda item: item[0])
+    return [path for _, path in dated]
+
+def _blob_files():
+    """(hash, ruta) de los archivos del almacén de blobs (sin las subidas parciales)."""
+    for root, dirs, files in os.walk(blobs.BLOB_DIR):
+        if root == blobs.BLOB_DIR and "partial" in dirs:
+            dirs.remove("partial")
+        for name in files:
+            if not name.endswith(".tmp"):
+                yield name, os.path.join(root, name)
+
+def collect_orphans(grace_days=GRACE_DAYS, dry_run=True):
+    """
+    Busca (y si no es dry_run, borra) lo que ya nadie usa y tiene más de
+    grace_days días: copias de folios, blobs sin referencias, archivos del
+    almacén sin fila en draft_blobs y subidas por pedazos abandonadas.
+    Regresa [(tipo, ruta o id, bytes)].
+    """
+    cutoff = time.time() - grace_days * 86400
+    found = []
+
+    def old(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_size if st.st_mtime < cutoff else None
+
+    for path in find_orphan_copies():
+        size = old(path)
+        if size is not None:
+            found.append(("copia", path, size))
+            if not dry_run:
+                os.remove(path)
+
+    for blob in get_unreferenced_blobs(grace_days):
+        found.append(("blob", blob["hash"], blob["size"]))
+        if not dry_run:
+            delete_unreferenced_blob(blob["hash"])
+
+    known = get_draft_blob_hashes()
+    for digest, path in _blob_files():
+        size = old(path)
+        if digest not in known and size is not None:
+            found.append(("blob sin fila", path, size))
+            if not dry_run:
+                os.remove(path)
+
+    for upload in get_stale_draft_uploads(grace_days):
+        found.append(("subida", upload["id"], upload["received"]))
+        if not dry_run and finish_draft_upload(upload["id"], "expired"):
+            blobs.discard_partial(upload["id"])
+    partial_dir = os.path.join(blobs.BLOB_DIR, "partial")
+    for name in (os.listdir(partial_dir) if os.path.isdir(partial_dir) else []):
+        size = old(os.path.join(partial_dir, name))
+        upload = get_draft_upload(name)
+        if size is not None and (upload is None or upload["status"] != "open"):
+            found.append(("parcial", name, size))
+            if not dry_run:
+                blobs.discard_partial(name)
+    return found
+
+# ------------------ uso de disco ------------------
+def _tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+def storage_usage():
+    """
+    ({(técnico, "AAAA-MM"): [archivos, bytes]} de las copias de fotos y firmas,
+    con el técnico por el prefijo del folio y el mes del archivo, y
+    {almacén: bytes} de cada lugar donde la app guarda datos).
+    """
+    names = get_technicians_by_prefix()
+    usage = defaultdict(lambda: [0, 0])
+    for path, m in _copies():
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        prefix = m.group("folio").split("-", 1)[0]
+        month = datetime.fromtimestamp(st.st_mtime).strftime("%Y-%m")
+        row = usage[(names.get(prefix, prefix), month)]
+        row[0] += 1
+        row[1] += st.st_size
+    totals = {
+        "static/uploads": _tree_size(UPLOAD_DIR),
+        "static/firmas": _tree_size(FIRMAS_DIR),
+        "blobs de borradores": _tree_size(blobs.BLOB_DIR),
+        "PDFs archivados": _tree_size(PDF_ARCHIVE_DIR),
+        "base de datos": sum(os.path.getsize(p) for p in (DB_NAME, DB_NAME + "-wal") if os.path.exists(p)),
+    }
+    return dict(usage), totals
+
+def _mb(n):
+    return f"{n / (1024 * 1024):.1f} MB"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copias de fotos y firmas de los folios")
+    parser.add_argument("--migrar", action="store_true",
+                        help="mueve las copias del directorio plano a los subdirectorios por hash")
+    parser.add_argument("--lote", type=int, default=500, help="archivos por lote")
+    parser.add_argument("--pausa", type=float, default=0.2, help="segundos entre lotes")
+    parser.add_argument("--huerfanos", action="store_true", help="lista lo que ya nadie usa")
+    parser.add_argument("--aplicar", action="store_true", help="con --huerfanos: sí los borra")
+    parser.add_argument("--gracia-dias", type=int, default=GRACE_DAYS,
+                        help="solo cuenta como huérfano lo que tenga más de N días")
+    parser.add_argument("--uso", action="store_true", help="uso de disco por técnico y mes")
+    args = parser.parse_args()
+
+    if args.migrar:
+        for base_dir in (UPLOAD_DIR, FIRMAS_DIR):
+            if os.path.isdir(base_dir):
+                moved, dropped = migrate_flat_files(base_dir, max(1, args.lote), args.pausa)
+                print(f"{base_dir}: {moved} movidos, {dropped} descartados (ya había copia nueva)")
+    elif args.huerfanos:
+        found = collect_orphans(args.gracia_dias, dry_run=not args.aplicar)
+        for kind, what, size in found:
+            print(f"{kind:<14}{size:>12}  {what}")
+        verb = "Borrados" if args.aplicar else "Se borrarían (usa --aplicar)"
+        print(f"{verb}: {len(found)}, {_mb(sum(size for _, _, size in found))}")
+    elif args.uso:
+        usage, totals = storage_usage()
+        print(f"{'técnico':<24}{'mes':<9}{'archivos':>10}{'tamaño':>12}")
+        for (tecnico, month), (count, size) in sorted(usage.items()):
+            print(f"{tecnico:<24}{month:<9}{count:>10}{_mb(size):>12}")
+        print()
+        for name, size in totals.items():
+            print(f"{name:<24}{_mb(size):>12}")
+    else:
+        parser.print_help()
@@ -0,0 +1,218 @@
+# bench_pdf.py
+# Benchmark del render de PDF con reportes sintéticos por cada ruta del
+# renderer (preventivo compresor/oil free/SPM/secador, correctivo, bitácora,
+# 0-4 fotos, observaciones muy largas).
+#
+# Por caso mide: tiempo (mediana de --repeat), páginas, bytes del PDF y pico
+# de memoria (tracemalloc). Compara contra bench_pdf_baseline.json y sale con
+# código 1 si algún caso empeora más allá de las tolerancias.
+#
+#   python bench_pdf.py                  # compara contra la línea base
+#   python bench_pdf.py --update         # re-graba la línea base
+#   python bench_pdf.py --only correctivo --repeat 10
+#
+# Los tiempos dependen de la máquina: graba la línea base en la misma
+# máquina donde se va a comparar.
+import os, io, sys, json, time, base64, random, shutil, argparse, tempfile, statistics, tracemalloc
+from PIL import Image, ImageDraw
+from PyPDF2 import PdfReader
+
+import imagenes
+from pdf_renderer import parse_report, render_report_pdf, SPM_ROWS, SPM_COLS
+from catalogos import ACTIVIDADES_SENTENCE, DG_LABELS, OF_LABELS, E3, E1
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(APP_ROOT, "bench_pdf_baseline.json")
+
+# Tolerancias por métrica (fracción sobre la línea base)
+TOLERANCES = {"time_ms": 0.25, "peak_kb": 0.20, "bytes": 0.10}
+
+# ------------------ datos sintéticos ------------------
+def _data_url(data, mime):
+    return f"data:{mime};base64," + base64.b64encode(data).decode()
+
+def _photo(seed, w=1600, h=1200):
+    """Foto de celular sintética (JPEG con ruido), determinista por seed."""
+    rnd = random.Random(seed)
+    img = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+    noise = Image.frombytes("L", (w // 4, h // 4), rnd.randbytes((w // 4) * (h // 4))).resize((w, h))
+    img = Image.merge("RGB", (img.getchannel(0), noise, img.getchannel(2).rotate(90, expand=False)))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return _data_url(out.getvalue(), "image/jpeg")
+
+def _signature(seed):
+    rnd = random.Random(seed)
+    img = Image.new("RGBA", (600, 200), (0, 0, 0, 0))
+    d = ImageDraw.Draw(img)
+    pts = [(40 + i*26, 100 + rnd.randint(-40, 40)) for i in range(20)]
+    d.line(pts, fill=(0, 0, 0, 255), width=4)
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return _data_url(out.getvalue(), "image/png")
+
+def build_form(tipo_servicio="Preventivo", tipo_equipo="Compresor tornillo lubricado velocidad fija",
+               descripcion="2000 HORAS", fotos=0, ruido=None, obs_repeat=3):
+    """Form como lo manda formulario.html, con todos los campos de la ruta llenos."""
+    f = {
+        "folio": "BENCH-0001", "fecha": "2026-01-15", "tecnico": "Técnico de prueba", "localidad": "Tijuana",
+        "tipo_servicio": tipo_servicio, "descripcion_servicio": descripcion,
+        "cliente": "Cliente de prueba SA de CV", "contacto": "Contacto de prueba",
+        "direccion": "Av. Siempre Viva 742, Col. Centro, Tijuana, B.C.", "telefono": "6640000000",
+        "email": "contacto@example.com", "tipo_equipo": tipo_equipo,
+        "modelo": "GA37", "serie": "AII123456", "marca": "Atlas Copco", "potencia": "50",
+        "observaciones": "Equipo operando dentro de parámetros; se recomienda revisar fugas. " * obs_repeat,
+        "act_otras": "Ajuste de bandas y limpieza de tablero",
+        "firma_tecnico_nombre": "Técnico de prueba", "firma_cliente_nombre": "Contacto de prueba",
+        "firma_tecnico_data": _signature(1), "firma_cliente_data": _signature(2),
+        # correctivo / diagnóstico / revisión
+        "diag_problema": "El equipo presenta alta temperatura de descarga y paro por falla. " * 4,
+        "causa_raiz": "Enfriador obstruido", "actividades_realizadas": "Limpieza de enfriador y cambio de sensor. " * 6,
+        "refacciones": "Sensor de temperatura", "cond_encontro": "Fuera de servicio", "cond_entrega": "Operando",
+        # secador
+        "sec_prefiltro": "Bueno", "sec_posfiltro": "Bueno",
+    }
+    for i in range(1, len(ACTIVIDADES_SENTENCE) + 1):
+        if i % 2:
+            f[f"act_{i}"] = "1"
+    for i in range(1, len(DG_LABELS) + 1):
+        f[f"dg_{i}"] = str(i * 10); f[f"dg_{i}_unit"] = "psi"
+    for i in range(1, len(OF_LABELS) + 1):
+        f[f"of_{i}"] = str(i * 5); f[f"of_{i}_unit"] = "°C"
+    for i in range(1, 8):
+        f[f"sec_{i}"] = str(i * 3); f[f"sec_{i}_unit"] = "°C"
+    for _, key in E3:
+        for ph in ("l12", "l23", "l31", "l1", "l2", "l3"):
+            f[f"{key}_{ph}"] = "460"
+        f[f"{key}_unit"] = "V"
+    for _, key in E1:
+        f[key] = "12"; f[f"{key}_unit"] = "A"
+    if ruido:
+        f["act_analisis_ruido"] = "1"
+        f["ruido_tipo"] = ruido
+        f["ruido_resultado"] = "Dentro de rango"; f["ruido_observaciones"] = "Sin anomalías"
+        for _, rk in SPM_ROWS:
+            for ck in SPM_COLS:
+                f[f"{rk}_{ck}"] = "12.5"
+    for i in range(1, fotos + 1):
+        f[f"foto{i}_data"] = _photo(i)
+        f[f"foto{i}_desc"] = f"Evidencia {i}: vista general del equipo"
+    return f
+
+OILFREE = "Compresor tornillo libre de aceite velocidad fija"
+SECADOR = "Secador refrigerativo cíclico"
+
+CASES = {
+    "preventivo_compresor": dict(),
+    "preventivo_oilfree": dict(tipo_equipo=OILFREE),
+    "preventivo_spm": dict(ruido="SPM"),
+    "preventivo_r30": dict(ruido="R30"),
+    "preventivo_secador": dict(tipo_equipo=SECADOR),
+    "correctivo": dict(tipo_servicio="Correctivo", descripcion="Correctivo"),
+    "bitacora": dict(tipo_servicio="Bitácora", descripcion="Bitácora", fotos=2),
+    "fotos_0": dict(tipo_equipo=OILFREE, ruido="SPM", fotos=0),
+    "fotos_1": dict(tipo_equipo=OILFREE, ruido="SPM", fotos=1),
+    "fotos_2": dict(tipo_equipo=OILFREE, ruido="SPM", fotos=2),
+    "fotos_3": dict(tipo_equipo=OILFREE, ruido="SPM", fotos=3),
+    "fotos_4": dict(tipo_equipo=OILFREE, ruido="SPM", fotos=4),
+    "observaciones_largas": dict(obs_repeat=400),
+}
+
+# ------------------ medición ------------------
+def _cold_image_cache():
+    """Vacía la caché de fotos (memoria y disco) para medir el costo completo."""
+    imagenes._memory.clear()
+    shutil.rmtree(imagenes.PRINT_CACHE_DIR, ignore_errors=True)
+
+def _render(form):
+    report = parse_report(form)
+    report["folio"] = form["folio"]
+    return render_report_pdf(report)
+
+def run_case(form, repeat):
+    """Regresa {"time_ms", "pages", "bytes", "peak_kb"} de un caso."""
+    _cold_image_cache()
+    _render(form)  # calentamiento: fuentes, formas, caches de wrap
+
+    times = []
+    for _ in range(repeat):
+        _cold_image_cache()
+        t0 = time.perf_counter()
+        pdf = _render(form)
+        times.append((time.perf_counter() - t0) * 1000.0)
+
+    _cold_image_cache()
+    tracemalloc.start()
+    _render(form)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "time_ms": round(statistics.median(times), 1),
+        "pages": len(PdfReader(io.BytesIO(pdf)).pages),
+        "bytes": len(pdf),
+        "peak_kb": round(peak / 1024.0, 1),
+    }
+
+def compare(name, result, base, slack=1.0):
+    """Lista de regresiones de un caso contra su línea base."""
+    if not base:
+        return []
+    problems = []
+    if result["pages"] != base["pages"]:
+        problems.append(f"{name}: pages {base['pages']} -> {result['pages']}")
+    for key, tol in TOLERANCES.items():
+        limit = base[key] * (1 + tol * slack)
+        if result[key] > limit:
+            problems.append(f"{name}: {key} {base[key]} -> {result[key]} (limit {limit:.1f})")
+    return problems
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_baseline(results, path=BASELINE_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del render de PDF")
+    parser.add_argument("--repeat", type=int, default=5, help="renders medidos por caso (mediana)")
+    parser.add_argument("--only", action="append", choices=sorted(CASES), help="solo estos casos")
+    parser.add_argument("--update", action="store_true", help="graba los resultados como línea base")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--slack", type=float, default=1.0,
+                        help="multiplica las tolerancias (p. ej. 2 en máquinas ruidosas)")
+    args = parser.parse_args()
+
+    # La caché de fotos del benchmark no se mezcla con la de la app
+    imagenes.PRINT_CACHE_DIR = tempfile.mkdtemp(prefix="bench_pdf_")
+    names = args.only or list(CASES)
+    baseline = load_baseline(args.baseline)
+
+    results, problems = {}, []
+    print(f"{'caso':<24}{'ms':>10}{'págs':>6}{'bytes':>12}{'pico KB':>11}")
+    try:
+        for name in names:
+            r = results[name] = run_case(build_form(**CASES[name]), max(1, args.repeat))
+            print(f"{name:<24}{r['time_ms']:>10.1f}{r['pages']:>6}{r['bytes']:>12}{r['peak_kb']:>11.1f}")
+            problems += compare(name, r, baseline.get(name), args.slack)
+    finally:
+        shutil.rmtree(imagenes.PRINT_CACHE_DIR, ignore_errors=True)
+
+    if args.update:
+        save_baseline({**baseline, **results}, args.baseline)
+        print(f"Línea base guardada en {args.baseline}")
+        sys.exit(0)
+    if not baseline:
+        print("Sin línea base: corre con --update para grabarla")
+        sys.exit(0)
+    if problems:
+        print("\nRegresiones:")
+        for p in problems:
+            print("  - " + p)
+        sys.exit(1)
+    print("\nSin regresiones")
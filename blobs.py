@@ -0,0 +1,184 @@
+# blobs.py
+# Almacén en disco, por contenido, de las fotos y firmas de los borradores.
+#
+# Cada imagen se guarda una sola vez, decodificada (sin el 33% de base64), en
+# BLOB_DIR/ab/cd/<sha256>. Las columnas foto#_data / firma_*_data de
+# draft_reports guardan solo la referencia "blob:<sha256>"; los conteos de
+# referencias viven en la tabla draft_blobs (ver database.py).
+import os, re, base64, hashlib, threading
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+BLOB_DIR = os.environ.get("DRAFT_BLOB_DIR", os.path.join(APP_ROOT, "data", "blobs"))
+REF_PREFIX = "blob:"
+
+# Un digest es un sha256 en hex minúsculas y nada más: las referencias llegan
+# del navegador y el digest termina en una ruta del disco
+_DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+def is_digest(value):
+    return isinstance(value, str) and _DIGEST_RE.fullmatch(value) is not None
+
+def check_digest(digest):
+    if not is_digest(digest):
+        raise ValueError(f"Invalid blob digest: {digest!r}")
+    return digest
+
+def looks_like_ref(value):
+    """Empieza como referencia, sea válida o no (para rechazar las malformadas)."""
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+def is_ref(value):
+    return looks_like_ref(value) and is_digest(value[len(REF_PREFIX):])
+
+def ref_hash(value):
+    if not looks_like_ref(value):
+        raise ValueError(f"Not a blob reference: {value!r}")
+    return check_digest(value[len(REF_PREFIX):])
+
+def make_ref(digest):
+    return REF_PREFIX + check_digest(digest)
+
+def blob_path(digest):
+    check_digest(digest)
+    return os.path.join(BLOB_DIR, digest[:2], digest[2:4], digest)
+
+def decode(value):
+    """Bytes de un data URL, base64 'pelón' o bytes. None si no es una imagen en base64."""
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        return value
+    if "," in value:
+        value = value.split(",", 1)[1]
+    try:
+        return base64.b64decode(value, validate=True)
+    except Exception:
+        return None
+
+def digest_of(data):
+    return hashlib.sha256(data).hexdigest()
+
+def write_blob(digest, data):
+    """Escribe el blob si todavía no existe. Regresa True si lo escribió."""
+    path = blob_path(digest)
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # escribir y renombrar: nadie lee un blob a medias
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+def blob_size(digest):
+    """Tamaño del blob en bytes, o None si no existe."""
+    try:
+        return os.path.getsize(blob_path(digest))
+    except FileNotFoundError:
+        return None
+
+def read_blob(digest):
+    """Bytes del blob, o None si no existe."""
+    try:
+        with open(blob_path(digest), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def delete_blob(digest):
+    try:
+        os.remove(blob_path(digest))
+    except FileNotFoundError:
+        pass
+
+def set_aside_blob(digest):
+    """
+    Quita el blob de su lugar con un rename, sin borrarlo, para una
+    transacción que todavía puede deshacerse. Regresa la ruta apartada, o
+    None si no existía. put_back_blob lo regresa.
+    """
+    path = blob_path(digest)
+    aside = f"{path}.{os.getpid()}.{threading.get_ident()}.del"
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return None
+    return aside
+
+def put_back_blob(digest, aside):
+    os.replace(aside, blob_path(digest))
+
+# ------------------ subidas por pedazos ------------------
+# El archivo se arma en BLOB_DIR/partial/<id> (mismo disco que el almacén, así
+# que al terminar se mueve con un rename).
+def partial_path(upload_id):
+    return os.path.join(BLOB_DIR, "partial", upload_id)
+
+def write_partial(upload_id, offset, data):
+    """Escribe un pedazo en `offset` y corta lo que hubiera después (reintentos)."""
+    path = partial_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+
+def partial_digest(upload_id, chunk_size=1024 * 1024):
+    """(sha256, tamaño) del archivo parcial, leído por pedazos."""
+    h, size = hashlib.sha256(), 0
+    with open(partial_path(upload_id), "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+def adopt_partial(upload_id, digest):
+    """Mueve el archivo parcial al almacén como el blob `digest` (o lo borra si ya existía)."""
+    path = blob_path(digest)
+    if os.path.exists(path):
+        discard_partial(upload_id)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(partial_path(upload_id), path)
+
+def discard_partial(upload_id):
+    try:
+        os.remove(partial_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+def mime_of(data):
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data.startswith(b"GIF8"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.lstrip()[:4] == b"<svg":
+        return "image/svg+xml"
+    return "application/octet-stream"
+
+def load_bytes(value):
+    """Bytes de una columna de imagen: referencia al almacén o Base64 de antes del almacén."""
+    if is_ref(value):
+        return read_blob(ref_hash(value))
+    return decode(value)
+
+def load_data_url(value):
+    """
+    Valor de una columna de imagen listo para el navegador: las referencias se
+    leen del disco y regresan como data URL; cualquier otro valor (borradores
+    guardados antes del almacén) regresa tal cual.
+    """
+    if not is_ref(value):
+        return value
+    data = read_blob(ref_hash(value))
+    if data is None:
+        return None
+    return f"data:{mime_of(data)};base64," + base64.b64encode(data).decode("ascii")
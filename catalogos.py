@@ -0,0 +1,86 @@
+# catalogos.py
+# Catálogos compartidos entre el formulario web y el renderer de PDF.
+
+LISTA_EQUIPOS = [
+    "Compresor tornillo lubricado capacidad variable",
+    "Compresor tornillo lubricado velocidad variable",
+    "Compresor tornillo libre de aceite velocidad fija",
+    "Compresor tornillo libre de aceite velocidad variable",
+    "Compresor booster pistón 1 etapa",
+    "Compresor booster pistón 2 etapas",
+    "Compresor booster pistón 3 etapa",
+    "Compresor booster pistón 4 etapa",
+    "Compresor booster pistón 5 etapa",
+    "Compresor tornillo lubricado velocidad fija",
+    "Compresor pistón 3 etapas",
+    "Compresor tornillo lubricado velocidad fija x bandas",
+    "Compresor tornillo lubricado velocidad fija 2 etapas",
+    "Compresor tornillo lubricado velocidad variable 2 etapas",
+    "Compresor pistón 2 etapas",
+    "Compresor reciprocante",
+    "Secador refrigerativo cíclico",
+    "Secador refrigerativo no cíclico",
+    "Secador regenerativo",
+]
+
+ACTIVIDADES_SENTENCE = [
+    "Cambio de filtro de aire","Cambio de filtro de aceite","Cambio de elemento separador",
+    "Cambio de filtro panel control","Recuperar nivel de aceite","Cambio de aceite",
+    "Cambio de mangueras","Cambio válvula de desfogue","Cambio válvula check descarga",
+    "Cambio kit válvula mpcv","Cambio kit, válvula admisión","Cambio válvula paro de aceite",
+    "Cambio kit, val. termocontrol","Cambio de bandas","Reapretar conexiones mecánicas",
+    "Reapretar conexiones eléctricas","Limpieza línea de barrido","Limpieza trampa de condensados",
+    "Limpieza a enfriadores aire/aceite","Revisar funcionamiento de válvulas",
+    "Limpieza a platinos de contactores","Lubricación rodamiento de motor",
+    "Servicio a motor eléctrico","Limpieza general del equipo",
+    "Toma de muestra de aceite para análisis",
+]
+
+# --- Lecturas de compresor (web + pdf) ---
+DG_LABELS = [
+    "Horas totales","Horas de carga","Presión objetivo/descarga","Presión de carga",
+    "Presión descarga del paquete","Temperatura ambiente","Temp. descarga del paquete",
+    "Temp. descarga del aire-end","Temp. inyección de refrigerante","Caída de presión separador"
+]
+OF_LABELS = [
+    "Temp. entrada aire 1ra etapa","Temp. descarga aire 1ra etapa","Presión descarga 1ra etapa",
+    "Temp. entrada 2da etapa","Temp. descarga 2da etapa","Presión descarga 2da etapa",
+    "Temperatura del aceite","Presión de aceite","Vacío de entrada","(otro)"
+]
+
+# --- Lecturas de SECADOR (solo PDF; en el HTML ya tienes estos campos) ---
+SEC_LABELS = [
+    "Temperatura de aire de entrada",
+    "Temperatura de aire de salida",
+    "Temperatura del calentador",
+    "Temperatura ambiente",
+    "Punto de rocío",
+    "Tiempo de ciclo",
+    "Horas totales",
+    "Condiciones de prefiltro",
+    "Condiciones de pos filtro",
+]
+
+# --- Datos eléctricos estándar (compresores) ---
+E3 = [
+    ("Voltaje comp. en carga","v_carga"),
+    ("Voltaje comp. en descarga","v_descarga"),
+    ("Voltaje a tierra","v_tierra"),
+    ("Corriente comp. en carga","i_carga"),
+    ("Corriente comp. en descarga","i_descarga"),
+    ("Corriente total del paquete","i_total"),
+]
+E1 = [
+    ("Corriente de placa","i_placa"),
+    ("Voltaje del bus DC","v_busdc"),
+    ("RPM del motor (VFD)","rpm_vfd"),
+    ("Temp. IGBT U=","t_igbt_u"),("Temp. IGBT V=","t_igbt_v"),("Temp. IGBT W=","t_igbt_w"),
+    ("Temp. rectificador","t_rect"),
+]
+
+# --- Datos eléctricos especiales para SECADOR (solo 2 filas) ---
+SEC_E3 = [
+    ("Corriente comp. en carga", "i_carga"),
+    ("Voltaje comp. en carga", "v_carga"),  # esta usa L1-2 / L2-3 / L3-1
+]
+SEC_E1 = []  # sin filas individuales para secador
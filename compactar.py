@@ -0,0 +1,88 @@
+# compactar.py
+# Compactación de los borradores ya enviados, para que inair_reportes.db no
+# crezca sin límite. Pensado para correr programado (cron / scheduler):
+#
+#   python compactar.py                          # reglas por defecto (o variables de entorno)
+#   python compactar.py --imagenes-dias 15 --pdf-dias 60
+#   python compactar.py --pdf-dias 0 --sin-vacuum
+#
+# Reglas:
+#   - Borradores enviados hace más de COMPACT_IMAGE_DAYS días: se quitan sus
+#     fotos y firmas de trabajo (las copias del folio siguen en static/uploads
+#     y static/firmas).
+#   - Borradores enviados hace más de COMPACT_PDF_DAYS días: el PDF sale de la
+#     base a PDF_ARCHIVE_DIR/<año-mes>/<folio>.pdf.gz; la vista previa y el
+#     envío lo leen de ahí (database.iter_draft_pdf).
+#   - Al final, VACUUM incremental para regresar las páginas libres al disco.
+import os, re, gzip, argparse
+from datetime import datetime
+
+from database import (
+    init_db, strip_sent_draft_images, get_sent_drafts_with_pdf, archive_draft_pdf,
+    get_draft_pdf_archives, iter_draft_pdf, vacuum_db
+)
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+PDF_ARCHIVE_DIR = os.environ.get("PDF_ARCHIVE_DIR", os.path.join(APP_ROOT, "data", "archivo"))
+IMAGE_DAYS = int(os.environ.get("COMPACT_IMAGE_DAYS", "30"))
+PDF_DAYS = int(os.environ.get("COMPACT_PDF_DAYS", "90"))
+# Páginas máximas que libera cada VACUUM incremental (0 = todas)
+VACUUM_PAGES = int(os.environ.get("COMPACT_VACUUM_PAGES", "0"))
+
+def archive_path(folio):
+    name = re.sub(r"[^A-Za-z0-9_-]", "_", folio)
+    return os.path.join(PDF_ARCHIVE_DIR, datetime.now().strftime("%Y-%m"), f"{name}.pdf.gz")
+
+def archive_pdf(draft):
+    """Copia el PDF del borrador a su .pdf.gz y lo quita de la base. Regresa True si se archivó."""
+    path = archive_path(draft["folio"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wb", compresslevel=6) as f:
+        for chunk in iter_draft_pdf(draft["folio"]):
+            f.write(chunk)
+    os.replace(tmp, path)
+    # si el PDF cambió mientras se copiaba, la copia no sirve
+    if archive_draft_pdf(draft["folio"], path, draft["pdf_size"], draft["pdf_cache_key"]):
+        return True
+    if path not in get_draft_pdf_archives():
+        os.remove(path)
+    return False
+
+def sweep_archives():
+    """Borra los .pdf.gz que ya no usa ningún borrador (se editó y se volvió a generar el PDF)."""
+    in_use = get_draft_pdf_archives()
+    removed = 0
+    for root, _, files in os.walk(PDF_ARCHIVE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(".pdf.gz") and path not in in_use:
+                os.remove(path)
+                removed += 1
+    return removed
+
+def compact(image_days=IMAGE_DAYS, pdf_days=PDF_DAYS, vacuum_pages=VACUUM_PAGES, vacuum=True):
+    """Aplica las reglas. Regresa un dict con lo que se hizo."""
+    result = {"drafts_stripped": strip_sent_draft_images(image_days), "pdfs_archived": 0}
+    for draft in get_sent_drafts_with_pdf(pdf_days):
+        if archive_pdf(draft):
+            result["pdfs_archived"] += 1
+    result["archives_removed"] = sweep_archives()
+    if vacuum:
+        result["pages_freed"], result["pages_left"] = vacuum_db(vacuum_pages)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compacta los borradores enviados")
+    parser.add_argument("--imagenes-dias", type=int, default=IMAGE_DAYS,
+                        help="quita fotos y firmas de los enviados hace más de N días")
+    parser.add_argument("--pdf-dias", type=int, default=PDF_DAYS,
+                        help="archiva comprimidos los PDFs de los enviados hace más de N días")
+    parser.add_argument("--vacuum-paginas", type=int, default=VACUUM_PAGES,
+                        help="páginas máximas a liberar (0 = todas)")
+    parser.add_argument("--sin-vacuum", action="store_true", help="no corre VACUUM")
+    args = parser.parse_args()
+
+    init_db()
+    result = compact(args.imagenes_dias, args.pdf_dias, args.vacuum_paginas, not args.sin_vacuum)
+    print(", ".join(f"{k}={v}" for k, v in result.items()))
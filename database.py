@@ -1,170 +1,459 @@
 import sqlite3
 import os
+import re
+import math
+import gzip
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+import blobs
+
 DB_NAME = "inair_reportes.db"
 
-def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_NAME)
+# Tamaño de los pedazos al copiar el PDF hacia/desde draft_reports.pdf_preview
+PDF_CHUNK = 64 * 1024
+
+# Columnas de draft_reports que guardan una referencia al almacén de blobs (blobs.py)
+DRAFT_IMAGE_COLUMNS = ("foto1_data", "foto2_data", "foto3_data", "foto4_data",
+                       "firma_tecnico_data", "firma_cliente_data")
+
+# Ajustes de cada conexión (un solo lugar). WAL deja leer mientras otro
+# escribe; busy_timeout espera el lock en vez de fallar con "database is locked".
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+STATEMENT_CACHE = int(os.environ.get("SQLITE_STATEMENT_CACHE", "256"))
+PRAGMAS = {
+    # before anything creates the file; older databases are switched by compactar.py
+    "auto_vacuum": "INCREMENTAL",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -int(os.environ.get("SQLITE_CACHE_KB", "16384")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_MB", "128")) * 1024 * 1024,
+    "busy_timeout": BUSY_TIMEOUT_MS,
+}
+
+# Índice de texto de reports (reports_fts) y el peso de cada columna en bm25;
+# un folio o una serie que coinciden pesan más que una palabra de la descripción
+REPORTS_FTS_COLUMNS = ("folio", "cliente", "tecnico", "modelo", "serie", "marca", "descripcion_servicio")
+REPORTS_FTS_WEIGHTS = "10.0, 4.0, 4.0, 3.0, 8.0, 2.0, 1.0"
+
+# Reportes por página del historial (get_reports_page)
+REPORTS_PAGE_SIZE = int(os.environ.get("REPORTS_PAGE_SIZE", "50"))
+
+_local = threading.local()
+
+def _connect():
+    """New connection with PRAGMAS applied. Prefer get_db(); this is for connections that outlive a call."""
+    conn = sqlite3.connect(DB_NAME, timeout=BUSY_TIMEOUT_MS / 1000.0, cached_statements=STATEMENT_CACHE)
     conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
     return conn
 
-def init_db():
-    """Initialize the database with tables"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                nombre TEXT NOT NULL,
-                prefijo TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT 'technician',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Clients table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS clients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                contacto TEXT,
-                telefono TEXT,
-                email TEXT,
-                direccion TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Client Equipment table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS client_equipment (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_id INTEGER NOT NULL,
-                tipo_equipo TEXT NOT NULL,
-                modelo TEXT,
-                serie TEXT,
-                marca TEXT,
-                potencia TEXT,
-                ultimo_servicio DATE,
-                frecuencia_meses INTEGER DEFAULT 1,
-                proximo_servicio DATE,
-                kit_2000 TEXT,
-                kit_4000 TEXT,
-                kit_6000 TEXT,
-                kit_8000 TEXT,
-                kit_16000 TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Reports table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reports (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                folio TEXT UNIQUE NOT NULL,
-                fecha DATE NOT NULL,
-                cliente TEXT NOT NULL,
-                tipo_equipo TEXT NOT NULL,
-                modelo TEXT,
-                serie TEXT,
-                marca TEXT,
-                potencia TEXT,
-                tipo_servicio TEXT NOT NULL,
-                descripcion_servicio TEXT,
-                tecnico TEXT NOT NULL,
-                localidad TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+def get_db():
+    """
+    Database connection of the current thread (one per request under the web
+    server), opened once and reused, with its statement cache. Use it as
+    `with get_db() as conn:` to commit or roll back; don't close it.
+    """
+    conn = getattr(_local, "conn", None)
+    # a process started with fork inherits the parent's slot: it opens its own
+    if conn is None or _local.pid != os.getpid():
+        conn = _local.conn = _connect()
+        _local.pid = os.getpid()
+    return conn
+
+def release_db():
+    """End of a request: roll back whatever a caller left open. The connection stays for the next one."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
+
+# ========== Schema Migrations ==========
+# Cada migración corre una sola vez, en orden, y PRAGMA user_version guarda
+# cuántas van. Las tres primeras también aceptan bases de antes de
+# user_version (con parte del esquema ya creado), por eso usan IF NOT EXISTS
+# y revisan columnas; las que se agreguen después pueden suponer la anterior.
+# Nunca se edita una migración ya publicada: se agrega la siguiente.
 
-        # Folios table
+def _migrate_1_base(cursor):
+    """Core tables, the columns added to them over time and the default users"""
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            prefijo TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'technician',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Clients table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            contacto TEXT,
+            telefono TEXT,
+            email TEXT,
+            direccion TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Client Equipment table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS client_equipment (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER NOT NULL,
+            tipo_equipo TEXT NOT NULL,
+            modelo TEXT,
+            serie TEXT,
+            marca TEXT,
+            potencia TEXT,
+            ultimo_servicio DATE,
+            frecuencia_meses INTEGER DEFAULT 1,
+            proximo_servicio DATE,
+            kit_2000 TEXT,
+            kit_4000 TEXT,
+            kit_6000 TEXT,
+            kit_8000 TEXT,
+            kit_16000 TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (client_id) REFERENCES clients (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Reports table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folio TEXT UNIQUE NOT NULL,
+            fecha DATE NOT NULL,
+            cliente TEXT NOT NULL,
+            tipo_equipo TEXT NOT NULL,
+            modelo TEXT,
+            serie TEXT,
+            marca TEXT,
+            potencia TEXT,
+            tipo_servicio TEXT NOT NULL,
+            descripcion_servicio TEXT,
+            tecnico TEXT NOT NULL,
+            localidad TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Folios table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS folios (
+            prefijo TEXT PRIMARY KEY,
+            ultimo_numero INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Draft reports table - stores complete drafts with images and signatures
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS draft_reports (
+            folio TEXT PRIMARY KEY,
+            form_data TEXT NOT NULL,
+            foto1_data TEXT,
+            foto2_data TEXT,
+            foto3_data TEXT,
+            foto4_data TEXT,
+            firma_tecnico_data TEXT,
+            firma_cliente_data TEXT,
+            pdf_preview BLOB,
+            pdf_cache_key TEXT,
+            pdf_archive TEXT,
+            pdf_archive_size INTEGER,
+            version INTEGER NOT NULL DEFAULT 0,
+            status TEXT DEFAULT 'draft',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # PDF render queue - one row per job, claimed by pdf_queue.py workers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            folio TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pdf_jobs_status ON pdf_jobs (status, id)")
+
+    # Resumable photo uploads: received bytes so far, assembled in blobs.partial_path(id)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS draft_uploads (
+            id TEXT PRIMARY KEY,
+            folio TEXT NOT NULL,
+            slot TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'open',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_draft_uploads_folio ON draft_uploads (folio, slot, sha256)")
+
+    # Reference counts of the draft images kept in the blob store (blobs.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS draft_blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Check if new columns exist (for migration)
+    try:
+        cursor.execute("SELECT ultimo_servicio FROM client_equipment LIMIT 1")
+    except sqlite3.OperationalError:
+        # Columns don't exist, add them
+        alter_commands = [
+            "ALTER TABLE client_equipment ADD COLUMN ultimo_servicio DATE",
+            "ALTER TABLE client_equipment ADD COLUMN frecuencia_meses INTEGER DEFAULT 1",
+            "ALTER TABLE client_equipment ADD COLUMN proximo_servicio DATE",
+            "ALTER TABLE client_equipment ADD COLUMN kit_2000 TEXT",
+            "ALTER TABLE client_equipment ADD COLUMN kit_4000 TEXT",
+            "ALTER TABLE client_equipment ADD COLUMN kit_6000 TEXT",
+            "ALTER TABLE client_equipment ADD COLUMN kit_8000 TEXT",
+            "ALTER TABLE client_equipment ADD COLUMN kit_16000 TEXT"
+        ]
+        for cmd in alter_commands:
+            try:
+                cursor.execute(cmd)
+            except sqlite3.OperationalError:
+                pass 
+
+    # PDF cache key column on drafts (added after the first release)
+    try:
+        cursor.execute("SELECT pdf_cache_key FROM draft_reports LIMIT 1")
+    except sqlite3.OperationalError:
+        cursor.execute("ALTER TABLE draft_reports ADD COLUMN pdf_cache_key TEXT")
+
+    # Draft version for the autosave patches (apply_draft_patch)
+    try:
+        cursor.execute("SELECT version FROM draft_reports LIMIT 1")
+    except sqlite3.OperationalError:
+        cursor.execute("ALTER TABLE draft_reports ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    # Compressed copy of the PDF once compactar.py moves it out of the database
+    try:
+        cursor.execute("SELECT pdf_archive, pdf_archive_size FROM draft_reports LIMIT 1")
+    except sqlite3.OperationalError:
+        cursor.execute("ALTER TABLE draft_reports ADD COLUMN pdf_archive TEXT")
+        cursor.execute("ALTER TABLE draft_reports ADD COLUMN pdf_archive_size INTEGER")
+
+
+    # Create default users if none exist
+    cursor.execute("SELECT COUNT(*) FROM users")
+    user_count = cursor.fetchone()[0]
+
+    if user_count == 0:
+        print("No users found. Creating default users...")
+
+        # Create default admin
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS folios (
-                prefijo TEXT PRIMARY KEY,
-                ultimo_numero INTEGER DEFAULT 0
-            )
-        ''')
-        
-        # Draft reports table - stores complete drafts with images and signatures
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS draft_reports (
-                folio TEXT PRIMARY KEY,
-                form_data TEXT NOT NULL,
-                foto1_data TEXT,
-                foto2_data TEXT,
-                foto3_data TEXT,
-                foto4_data TEXT,
-                firma_tecnico_data TEXT,
-                firma_cliente_data TEXT,
-                pdf_preview BLOB,
-                status TEXT DEFAULT 'draft',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Check if new columns exist (for migration)
-        try:
-            cursor.execute("SELECT ultimo_servicio FROM client_equipment LIMIT 1")
-        except sqlite3.OperationalError:
-            # Columns don't exist, add them
-            alter_commands = [
-                "ALTER TABLE client_equipment ADD COLUMN ultimo_servicio DATE",
-                "ALTER TABLE client_equipment ADD COLUMN frecuencia_meses INTEGER DEFAULT 1",
-                "ALTER TABLE client_equipment ADD COLUMN proximo_servicio DATE",
-                "ALTER TABLE client_equipment ADD COLUMN kit_2000 TEXT",
-                "ALTER TABLE client_equipment ADD COLUMN kit_4000 TEXT",
-                "ALTER TABLE client_equipment ADD COLUMN kit_6000 TEXT",
-                "ALTER TABLE client_equipment ADD COLUMN kit_8000 TEXT",
-                "ALTER TABLE client_equipment ADD COLUMN kit_16000 TEXT"
-            ]
-            for cmd in alter_commands:
-                try:
-                    cursor.execute(cmd)
-                except sqlite3.OperationalError:
-                    pass 
+            INSERT INTO users (username, password, role, nombre, prefijo)
+            VALUES (?, ?, ?, ?, ?)
+        ''', ('admin', 'admin123', 'admin', 'Administrador', 'ADM'))
 
-        conn.commit()
-        
-        # Create default users if none exist
-        cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = cursor.fetchone()[0]
-        
-        if user_count == 0:
-            print("No users found. Creating default users...")
-            
-            # Create default admin
+        # Create default technicians
+        default_techs = [
+            ('fernando', 'fernando123', 'technician', 'Fernando', 'F'),
+            ('cesar', 'cesar123', 'technician', 'César', 'C'),
+            ('hiorvard', 'hiorvard123', 'technician', 'Hiorvard', 'H')
+        ]
+
+        for username, password, role, nombre, prefijo in default_techs:
             cursor.execute('''
                 INSERT INTO users (username, password, role, nombre, prefijo)
                 VALUES (?, ?, ?, ?, ?)
-            ''', ('admin', 'admin123', 'admin', 'Administrador', 'ADM'))
-            
-            # Create default technicians
-            default_techs = [
-                ('fernando', 'fernando123', 'technician', 'Fernando', 'F'),
-                ('cesar', 'cesar123', 'technician', 'César', 'C'),
-                ('hiorvard', 'hiorvard123', 'technician', 'Hiorvard', 'H')
-            ]
-            
-            for username, password, role, nombre, prefijo in default_techs:
-                cursor.execute('''
-                    INSERT INTO users (username, password, role, nombre, prefijo)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (username, password, role, nombre, prefijo))
-            
-            conn.commit()
-            print("Default users created:")
-            print("  - admin / admin123 (Administrator)")
-            print("  - fernando / fernando123 (Technician)")
-            print("  - cesar / cesar123 (Technician)")
-            print("  - hiorvard / hiorvard123 (Technician)")
+            ''', (username, password, role, nombre, prefijo))
+
+        print("Default users created:")
+        print("  - admin / admin123 (Administrator)")
+        print("  - fernando / fernando123 (Technician)")
+        print("  - cesar / cesar123 (Technician)")
+        print("  - hiorvard / hiorvard123 (Technician)")
+
+def _migrate_2_calendar(cursor):
+    """Maintenance calendar: equipment, kits and parts catalog"""
+    # Maintenance calendar equipment (soft delete through activo)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS equipos_calendario (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cliente_id INTEGER,
+            serie TEXT UNIQUE NOT NULL,
+            tipo_equipo TEXT,
+            modelo TEXT,
+            marca TEXT,
+            potencia TEXT,
+            frecuencia_meses INTEGER DEFAULT 1,
+            mes_inicio INTEGER,
+            anio_inicio INTEGER,
+            tipo_servicio_inicial TEXT DEFAULT '2000 Horas',
+            reiniciar_en_horas INTEGER,
+            notas TEXT,
+            clasificacion TEXT DEFAULT 'General',
+            activo INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (cliente_id) REFERENCES clients (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_equipos_calendario_activo
+        ON equipos_calendario (id) WHERE activo = 1
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_equipos_calendario_cliente
+        ON equipos_calendario (cliente_id, tipo_equipo, modelo, serie) WHERE activo = 1
+    ''')
+
+    # Parts kits per service type of a calendar equipment
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS equipos_kits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            equipo_id INTEGER NOT NULL,
+            tipo_servicio TEXT NOT NULL,
+            refacciones_json TEXT,
+            FOREIGN KEY (equipo_id) REFERENCES equipos_calendario (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_equipos_kits_equipo ON equipos_kits (equipo_id)")
+
+    # General parts catalog by equipment type and service
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS refacciones_catalogo (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo_equipo TEXT NOT NULL,
+            tipo_servicio TEXT NOT NULL,
+            nombre_refaccion TEXT NOT NULL,
+            cantidad REAL,
+            unidad TEXT,
+            UNIQUE (tipo_equipo, tipo_servicio, nombre_refaccion)
+        )
+    ''')
+
+    # Parts specific to one calendar equipment
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS equipos_refacciones_custom (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            equipo_id INTEGER NOT NULL,
+            tipo_servicio TEXT,
+            nombre_refaccion TEXT NOT NULL,
+            cantidad REAL,
+            unidad TEXT,
+            FOREIGN KEY (equipo_id) REFERENCES equipos_calendario (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_equipos_refacciones_custom_equipo
+        ON equipos_refacciones_custom (equipo_id, tipo_servicio, nombre_refaccion)
+    ''')
+
+def _migrate_3_report_search(cursor):
+    """Full-text index and history indexes of reports"""
+    # Full-text index of reports (search_reports), kept in sync by triggers.
+    # External content: the text lives only in reports, the index holds the terms.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'reports_fts'")
+    fts_exists = cursor.fetchone() is not None
+    cols = ", ".join(REPORTS_FTS_COLUMNS)
+    new_cols = ", ".join(f"new.{col}" for col in REPORTS_FTS_COLUMNS)
+    old_cols = ", ".join(f"old.{col}" for col in REPORTS_FTS_COLUMNS)
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(
+            {cols},
+            content='reports', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS reports_fts_ai AFTER INSERT ON reports BEGIN
+            INSERT INTO reports_fts (rowid, {cols}) VALUES (new.id, {new_cols});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS reports_fts_ad AFTER DELETE ON reports BEGIN
+            INSERT INTO reports_fts (reports_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS reports_fts_au AFTER UPDATE ON reports BEGIN
+            INSERT INTO reports_fts (reports_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            INSERT INTO reports_fts (rowid, {cols}) VALUES (new.id, {new_cols});
+        END
+    ''')
+    if not fts_exists:
+        # existing history: index it once
+        cursor.execute("INSERT INTO reports_fts (reports_fts) VALUES ('rebuild')")
+
+    # Calendar and equipment history look up reports by month and by serie
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reports_fecha ON reports (fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reports_serie ON reports (serie, fecha)")
+    # History pages walk reports newest first by (created_at, id)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reports_created ON reports (created_at, id)")
+
+MIGRATIONS = (_migrate_1_base, _migrate_2_calendar, _migrate_3_report_search)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Cuánto espera un proceso a que otro termine de migrar antes de rendirse
+MIGRATION_WAIT_S = float(os.environ.get("SCHEMA_MIGRATION_WAIT_S", "300"))
+
+def get_schema_version(conn=None):
+    """Migrations applied to the database (PRAGMA user_version)"""
+    return (conn or get_db()).execute("PRAGMA user_version").fetchone()[0]
+
+def init_db():
+    """
+    Bring the schema up to SCHEMA_VERSION. When it is current (every start
+    after the first) this is a single PRAGMA read. Otherwise the pending
+    migrations run in one exclusive transaction: the first process to get
+    the lock migrates and the others wait for it and find nothing to do.
+    """
+    conn = get_db()
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return
+    
+    deadline = time.monotonic() + MIGRATION_WAIT_S
+    while True:
+        try:
+            conn.execute("BEGIN EXCLUSIVE")
+            break
+        except sqlite3.OperationalError:
+            # lock taken (busy_timeout already waited): another process is migrating
+            if get_schema_version(conn) >= SCHEMA_VERSION:
+                return
+            if time.monotonic() > deadline:
+                raise
+    
+    try:
+        version = get_schema_version(conn)
+        cursor = conn.cursor()
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if version < SCHEMA_VERSION:
+        print(f"Database schema migrated from version {version} to {SCHEMA_VERSION}")
 
 # ========== User Functions ==========
 
@@ -255,8 +544,11 @@ def save_report(folio, fecha, cliente, tipo_equipo, modelo, serie, marca, potenc
     """Save report metadata to database"""
     with get_db() as conn:
         cursor = conn.cursor()
+        # DELETE + INSERT instead of INSERT OR REPLACE: REPLACE does not fire
+        # the delete trigger that keeps reports_fts in sync
+        cursor.execute("DELETE FROM reports WHERE folio = ?", (folio,))
         cursor.execute('''
-            INSERT OR REPLACE INTO reports 
+            INSERT INTO reports 
             (folio, fecha, cliente, tipo_equipo, modelo, serie, marca, potencia,
              tipo_servicio, descripcion_servicio, tecnico, localidad)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -279,34 +571,123 @@ def get_report_by_folio(folio):
         row = cursor.fetchone()
         return dict(row) if row else None
 
+def reports_match_query(search_term):
+    """
+    FTS5 MATCH expression for a free-text search: every word as a quoted
+    prefix ("f"* "0012"*), all required. None if there are no words.
+    """
+    words = re.findall(r"\w+", search_term)
+    return " ".join(f'"{word}"*' for word in words) or None
+
+def _reports_filter(search_term='', tipo_servicio='', fecha_inicio='', fecha_fin=''):
+    """
+    (FROM clause, WHERE conditions, params, rank expression) for the history
+    filters. With a text search the rows come from reports_fts and rank is
+    their bm25 score; otherwise rank is None. None if the search has no words.
+    """
+    source, conditions, params, rank = "reports r", [], [], None
+    
+    if search_term:
+        match = reports_match_query(search_term)
+        if not match:
+            # solo signos de puntuación: nada que buscar
+            return None
+        source = "reports_fts JOIN reports r ON r.id = reports_fts.rowid"
+        conditions.append("reports_fts MATCH ?")
+        params.append(match)
+        rank = f"bm25(reports_fts, {REPORTS_FTS_WEIGHTS})"
+    
+    if tipo_servicio:
+        conditions.append("r.tipo_servicio = ?")
+        params.append(tipo_servicio)
+    
+    if fecha_inicio:
+        conditions.append("r.fecha >= ?")
+        params.append(fecha_inicio)
+    
+    if fecha_fin:
+        conditions.append("r.fecha <= ?")
+        params.append(fecha_fin)
+    
+    return source, conditions, params, rank
+
 def search_reports(search_term='', tipo_servicio='', fecha_inicio='', fecha_fin=''):
-    """Search reports with filters"""
+    """Search reports with filters; text matches come best ranked first (bm25)"""
+    flt = _reports_filter(search_term, tipo_servicio, fecha_inicio, fecha_fin)
+    if flt is None:
+        return []
+    source, conditions, params, rank = flt
+    order = f"{rank}, r.id DESC" if rank else "r.created_at DESC"
     with get_db() as conn:
         cursor = conn.cursor()
-        query = "SELECT * FROM reports WHERE 1=1"
-        params = []
-        
-        if search_term:
-            query += " AND (folio LIKE ? OR cliente LIKE ? OR tecnico LIKE ?)"
-            search_pattern = f"%{search_term}%"
-            params.extend([search_pattern, search_pattern, search_pattern])
-        
-        if tipo_servicio:
-            query += " AND tipo_servicio = ?"
-            params.append(tipo_servicio)
-        
-        if fecha_inicio:
-            query += " AND fecha >= ?"
-            params.append(fecha_inicio)
-        
-        if fecha_fin:
-            query += " AND fecha <= ?"
-            params.append(fecha_fin)
-        
-        query += " ORDER BY created_at DESC"
-        cursor.execute(query, params)
+        cursor.execute(f"""
+            SELECT r.* FROM {source}
+            WHERE {" AND ".join(conditions) or "1=1"}
+            ORDER BY {order}
+        """, params)
         return [dict(row) for row in cursor.fetchall()]
 
+def get_reports_page(search_term='', tipo_servicio='', fecha_inicio='', fecha_fin='',
+                     cursor=None, limit=REPORTS_PAGE_SIZE):
+    """
+    One page of the history with the same filters as search_reports: newest
+    first by (created_at, id), or best match first by (bm25, id) when there is
+    a text search. cursor is the `next` of the previous page, tagged with
+    its order ("fecha:" or "rank:"). Returns (reports, next), next is None on
+    the last page. Raises ValueError on a cursor that does not belong to this
+    kind of search.
+    """
+    flt = _reports_filter(search_term, tipo_servicio, fecha_inicio, fecha_fin)
+    if flt is None:
+        return [], None
+    source, conditions, params, rank = flt
+    
+    if rank:
+        # el puntaje se calcula por consulta: se pagina sobre la subconsulta
+        select = f"SELECT r.*, {rank} AS score FROM {source}"
+        order, keyset = "score, id DESC", "(score > ? OR (score = ? AND id < ?))"
+        mode, key = "rank", lambda row: f"rank:{row['score']!r}|{row['id']}"
+    else:
+        select = f"SELECT r.* FROM {source}"
+        order, keyset = "created_at DESC, id DESC", "(created_at, id) < (?, ?)"
+        mode, key = "fecha", lambda row: f"fecha:{row['created_at']}|{row['id']}"
+    
+    outer, outer_params = [], []
+    if cursor:
+        # un cursor de la otra forma de ordenar se leería con llaves equivocadas
+        tag, _, value = cursor.partition(":")
+        if tag != mode:
+            raise ValueError(f"Not a {mode} cursor: {cursor!r}")
+        last, _, last_id = value.rpartition("|")
+        last_id = int(last_id)
+        if rank:
+            last = float(last)
+            if not math.isfinite(last):
+                raise ValueError(f"Bad cursor score: {cursor!r}")
+            outer_params = [last, last, last_id]
+        else:
+            datetime.fromisoformat(last)
+            outer_params = [last, last_id]
+        outer.append(keyset)
+    
+    with get_db() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(f"""
+            SELECT * FROM ({select} WHERE {" AND ".join(conditions) or "1=1"})
+            WHERE {" AND ".join(outer) or "1=1"}
+            ORDER BY {order}
+            LIMIT ?
+        """, params + outer_params + [limit + 1])
+        rows = db_cursor.fetchall()
+    
+    next_cursor = key(rows[limit - 1]) if len(rows) > limit else None
+    reports = []
+    for row in rows[:limit]:
+        report = dict(row)
+        report.pop("score", None)
+        reports.append(report)
+    return reports, next_cursor
+
 # ========== Folio Functions ==========
 
 def get_next_folio(prefijo):
@@ -447,16 +828,211 @@ def get_models_by_client_and_type(client_id, tipo_equipo):
         ''', (client_id, tipo_equipo))
         return [dict(row) for row in cursor.fetchall()]
 
+# ========== Maintenance Calendar Functions ==========
+
+# Columnas editables de equipos_calendario (serie solo se fija al crear)
+CALENDAR_EQUIPMENT_FIELDS = ("cliente_id", "tipo_equipo", "modelo", "marca", "potencia",
+                             "frecuencia_meses", "mes_inicio", "anio_inicio", "tipo_servicio_inicial",
+                             "reiniciar_en_horas", "notas", "clasificacion")
+
+def get_calendar_equipment_by_client(cliente_id):
+    """Get the active calendar equipment of a client"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, serie, tipo_equipo, modelo, marca, potencia
+            FROM equipos_calendario
+            WHERE cliente_id = ? AND activo = 1
+            ORDER BY tipo_equipo, modelo, serie
+        ''', (cliente_id,))
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_calendar_equipment():
+    """Get all active calendar equipment with the client name, newest first"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT e.*, c.nombre AS cliente_nombre
+            FROM equipos_calendario e
+            LEFT JOIN clients c ON e.cliente_id = c.id
+            WHERE e.activo = 1
+            ORDER BY e.id DESC
+        ''')
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_calendar_equipment_by_id(equipo_id):
+    """Get one calendar equipment by ID (active or not)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM equipos_calendario WHERE id = ?", (equipo_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def create_calendar_equipment(serie, **fields):
+    """
+    Add equipment to the maintenance calendar. fields are CALENDAR_EQUIPMENT_FIELDS;
+    raises sqlite3.IntegrityError if the serie already exists.
+    """
+    columns = ("serie",) + CALENDAR_EQUIPMENT_FIELDS
+    values = (serie,) + tuple(fields.get(name) for name in CALENDAR_EQUIPMENT_FIELDS)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            INSERT INTO equipos_calendario ({", ".join(columns)})
+            VALUES ({", ".join("?" * len(columns))})
+        ''', values)
+        return cursor.lastrowid
+
+def update_calendar_equipment(equipo_id, **fields):
+    """Update the editable fields (CALENDAR_EQUIPMENT_FIELDS) of a calendar equipment"""
+    values = tuple(fields.get(name) for name in CALENDAR_EQUIPMENT_FIELDS)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            UPDATE equipos_calendario
+            SET {", ".join(f"{name} = ?" for name in CALENDAR_EQUIPMENT_FIELDS)}
+            WHERE id = ?
+        ''', values + (equipo_id,))
+        return cursor.rowcount > 0
+
+def deactivate_calendar_equipment(equipo_id):
+    """Soft delete: the equipment leaves the calendar but keeps its history"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE equipos_calendario SET activo = 0 WHERE id = ?", (equipo_id,))
+        return cursor.rowcount > 0
+
+def get_equipment_kits(equipo_id):
+    """Get the parts kits of a calendar equipment"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM equipos_kits WHERE equipo_id = ? ORDER BY id", (equipo_id,))
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_kits_by_equipment():
+    """All kits grouped as {equipo_id: [kit, ...]}, for the monthly calendar"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM equipos_kits ORDER BY equipo_id, id")
+        kits = {}
+        for row in cursor.fetchall():
+            kits.setdefault(row['equipo_id'], []).append(dict(row))
+        return kits
+
+def replace_equipment_kits(equipo_id, kits):
+    """
+    Replace all the kits of an equipment with kits ([{tipo_servicio,
+    refacciones_json}, ...]) in one transaction.
+    """
+    rows = [(equipo_id, kit['tipo_servicio'], kit['refacciones_json']) for kit in kits]
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("DELETE FROM equipos_kits WHERE equipo_id = ?", (equipo_id,))
+        cursor.executemany('''
+            INSERT INTO equipos_kits (equipo_id, tipo_servicio, refacciones_json)
+            VALUES (?, ?, ?)
+        ''', rows)
+        return len(rows)
+
+def get_equipment_service_history(serie):
+    """Get the finished reports of an equipment serie, newest first"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT folio, fecha, tipo_servicio, descripcion_servicio
+            FROM reports
+            WHERE serie = ?
+            ORDER BY fecha DESC, id DESC
+        ''', (serie,))
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_month_report_folios(anio, mes):
+    """{serie: folio} of the latest report of each serie in a month, in one query"""
+    inicio = f"{anio:04d}-{mes:02d}-01"
+    fin = f"{anio + mes // 12:04d}-{mes % 12 + 1:02d}-01"
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT serie, folio FROM reports
+            WHERE fecha >= ? AND fecha < ? AND serie IS NOT NULL
+            ORDER BY fecha, id
+        ''', (inicio, fin))
+        # ascending order: the last row of each serie wins
+        return {row['serie']: row['folio'] for row in cursor.fetchall()}
+
+def get_parts_catalog(tipo_equipo=None):
+    """Get the parts catalog, optionally for one equipment type"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        if tipo_equipo is None:
+            cursor.execute("SELECT * FROM refacciones_catalogo ORDER BY tipo_equipo, tipo_servicio")
+        else:
+            cursor.execute('''
+                SELECT * FROM refacciones_catalogo
+                WHERE tipo_equipo = ?
+                ORDER BY tipo_servicio, nombre_refaccion
+            ''', (tipo_equipo,))
+        return [dict(row) for row in cursor.fetchall()]
+
+def create_catalog_part(tipo_equipo, tipo_servicio, nombre_refaccion, cantidad=None, unidad=None):
+    """Add a part to the catalog; raises sqlite3.IntegrityError if it already exists"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO refacciones_catalogo
+            (tipo_equipo, tipo_servicio, nombre_refaccion, cantidad, unidad)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (tipo_equipo, tipo_servicio, nombre_refaccion, cantidad, unidad))
+        return cursor.lastrowid
+
+def delete_catalog_part(part_id):
+    """Delete a part from the catalog"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM refacciones_catalogo WHERE id = ?", (part_id,))
+        return cursor.rowcount > 0
+
+def get_equipment_custom_parts(equipo_id):
+    """Get the parts specific to one calendar equipment"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM equipos_refacciones_custom
+            WHERE equipo_id = ?
+            ORDER BY tipo_servicio, nombre_refaccion
+        ''', (equipo_id,))
+        return [dict(row) for row in cursor.fetchall()]
+
 # ========== Draft Report Functions ==========
 
 def save_draft_report(folio, form_data, foto1=None, foto2=None, foto3=None, foto4=None,
-                      firma_tecnico=None, firma_cliente=None, pdf_preview=None):
-    """Save or update draft report with all data including images as Base64"""
+                      firma_tecnico=None, firma_cliente=None, pdf_preview=None, pdf_cache_key=None):
+    """
+    Save or update draft report with all data.
+    Images (data URL, Base64 or bytes) go to the blob store and the row keeps
+    only their references; pdf_preview can be bytes or a binary file (copied
+    into the BLOB in chunks).
+    """
     import json
     from datetime import datetime
     
-    with get_db() as conn:
+    pdf_file = pdf_preview if hasattr(pdf_preview, "read") else None
+    if pdf_file is not None:
+        pdf_preview = None
+    
+    form_data, images = _split_draft_images(form_data, {
+        "foto1_data": foto1, "foto2_data": foto2, "foto3_data": foto3, "foto4_data": foto4,
+        "firma_tecnico_data": firma_tecnico, "firma_cliente_data": firma_cliente
+    })
+    
+    with _freeing_blobs() as freed, get_db() as conn:
         cursor = conn.cursor()
+        # Write lock up front: the blob refcounts and files change with the row
+        cursor.execute("BEGIN IMMEDIATE")
+        images = _store_draft_images(cursor, folio, images, freed)
+        foto1, foto2, foto3, foto4 = (images[f"foto{i}_data"] for i in range(1, 5))
+        firma_tecnico, firma_cliente = images["firma_tecnico_data"], images["firma_cliente_data"]
         
         # Check if draft exists
         cursor.execute("SELECT folio FROM draft_reports WHERE folio = ?", (folio,))
@@ -474,53 +1050,418 @@ def save_draft_report(folio, form_data, foto1=None, foto2=None, foto3=None, foto
                     firma_tecnico_data = ?,
                     firma_cliente_data = ?,
                     pdf_preview = ?,
+                    pdf_cache_key = ?,
+                    pdf_archive = NULL,
+                    version = version + 1,
                     updated_at = CURRENT_TIMESTAMP
                 WHERE folio = ?
             ''', (json.dumps(form_data) if isinstance(form_data, dict) else form_data,
                   foto1, foto2, foto3, foto4,
                   firma_tecnico, firma_cliente,
-                  pdf_preview, folio))
+                  pdf_preview, pdf_cache_key if pdf_preview else None, folio))
         else:
             # Insert new draft
             cursor.execute('''
                 INSERT INTO draft_reports
                 (folio, form_data, foto1_data, foto2_data, foto3_data, foto4_data,
-                 firma_tecnico_data, firma_cliente_data, pdf_preview, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'draft')
+                 firma_tecnico_data, firma_cliente_data, pdf_preview, pdf_cache_key, version, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 'draft')
             ''', (folio,
                   json.dumps(form_data) if isinstance(form_data, dict) else form_data,
                   foto1, foto2, foto3, foto4,
                   firma_tecnico, firma_cliente,
-                  pdf_preview))
+                  pdf_preview, pdf_cache_key if pdf_preview else None))
+        
+        if pdf_file is not None:
+            _write_pdf_blob(conn, folio, pdf_file, pdf_cache_key)
         
         return True
 
+def _split_draft_images(form_data, images):
+    """
+    serializeForm also sends the images inside form_data: take them out so
+    they are stored once, in their columns. Explicit column values win.
+    """
+    if isinstance(form_data, dict):
+        form_data = dict(form_data)
+        for col in DRAFT_IMAGE_COLUMNS:
+            value = form_data.pop(col, None)
+            if images.get(col) is None:
+                images[col] = value
+    return form_data, images
+
+class BlobRefError(ValueError):
+    """An image field carries a blob reference that is malformed or not in draft_blobs"""
+
+def _store_draft_images(cursor, folio, images, freed):
+    """
+    Put the draft images ({column: value} for the columns being written) in
+    the blob store and return the column values (blob references; values that
+    are not Base64 images are kept as they are). Adds a reference to the new
+    images and drops the ones those columns had before; blobs left without
+    references go to freed (see _freeing_blobs). Only references the store
+    already has a draft_blobs row for are accepted (store_draft_blob, a
+    finished upload); any other "blob:" value raises BlobRefError. Needs the
+    write lock.
+    """
+    values = {}
+    for col, value in images.items():
+        value = value or None
+        if blobs.looks_like_ref(value):
+            if not blobs.is_ref(value):
+                raise BlobRefError(f"Invalid blob reference in {col}")
+            digest = blobs.ref_hash(value)
+            cursor.execute("UPDATE draft_blobs SET refcount = refcount + 1 WHERE hash = ?", (digest,))
+            if cursor.rowcount == 0:
+                raise BlobRefError(f"Blob {digest} not found")
+        else:
+            data = blobs.decode(value)
+            if data is not None:
+                digest = blobs.digest_of(data)
+                cursor.execute('''
+                    INSERT INTO draft_blobs (hash, size, refcount) VALUES (?, ?, 1)
+                    ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1
+                ''', (digest, len(data)))
+                blobs.write_blob(digest, data)
+                value = blobs.make_ref(digest)
+        values[col] = value
+    
+    if not values:
+        return values
+    cursor.execute(f"SELECT {', '.join(values)} FROM draft_reports WHERE folio = ?", (folio,))
+    row = cursor.fetchone()
+    if row:
+        _release_blobs(cursor, list(row), freed)
+    return values
+
+def store_draft_blob(data):
+    """
+    Put an uploaded image in the blob store before any draft references it
+    (refcount 0 until a patch uses it). Returns its blob reference.
+    """
+    digest = blobs.digest_of(data)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute('''
+            INSERT INTO draft_blobs (hash, size, refcount) VALUES (?, ?, 0)
+            ON CONFLICT(hash) DO NOTHING
+        ''', (digest, len(data)))
+        blobs.write_blob(digest, data)
+    return blobs.make_ref(digest)
+
+def apply_draft_patch(folio, base_version, changes):
+    """
+    Apply an autosave patch (only the fields that changed) in one transaction,
+    if base_version is the draft's current version (0 for a new draft).
+    Image fields carry a blob reference from store_draft_blob, a data URL, or
+    "" to clear them. Like a full save, it drops the stored PDF.
+    Returns (applied, version): the new version, or the current one when the
+    patch is stale. A reference the store does not have raises BlobRefError.
+    """
+    import json
+    
+    changes = dict(changes)
+    images = {col: changes.pop(col) for col in DRAFT_IMAGE_COLUMNS if col in changes}
+    
+    with _freeing_blobs() as freed, get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT version, form_data FROM draft_reports WHERE folio = ?", (folio,))
+        row = cursor.fetchone()
+        current = row['version'] if row else 0
+        if base_version != current:
+            return False, current
+        
+        form_data = json.loads(row['form_data']) if row else {}
+        for key, value in changes.items():
+            if value is None:
+                form_data.pop(key, None)
+            else:
+                form_data[key] = value
+        images = _store_draft_images(cursor, folio, images, freed)
+        
+        if row:
+            assignments = "".join(f", {col} = ?" for col in images)
+            cursor.execute(f'''
+                UPDATE draft_reports
+                SET form_data = ?{assignments},
+                    pdf_preview = NULL,
+                    pdf_cache_key = NULL,
+                    pdf_archive = NULL,
+                    version = version + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE folio = ?
+            ''', (json.dumps(form_data), *images.values(), folio))
+        else:
+            columns = "".join(f", {col}" for col in images)
+            marks = ", ?" * len(images)
+            cursor.execute(f'''
+                INSERT INTO draft_reports (folio, form_data{columns}, version, status)
+                VALUES (?, ?{marks}, 1, 'draft')
+            ''', (folio, json.dumps(form_data), *images.values()))
+        return True, current + 1
+
+def attach_draft_image(folio, column, ref, upload_id=None):
+    """
+    Point one image column of a draft at a blob, creating the draft if needed.
+    With upload_id the finished resumable upload is moved into the store as
+    that blob and closed, in the same transaction. Bumps the version and drops
+    the stored PDF like a patch. Returns the new version.
+    """
+    with _freeing_blobs() as freed, get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        if upload_id:
+            cursor.execute('''
+                UPDATE draft_uploads SET status = 'done', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'open'
+            ''', (upload_id,))
+            if cursor.rowcount == 0:
+                raise LookupError(f"Upload {upload_id} is not open")
+            digest = blobs.ref_hash(ref)
+            blobs.adopt_partial(upload_id, digest)
+            cursor.execute('''
+                INSERT INTO draft_blobs (hash, size, refcount) VALUES (?, ?, 0)
+                ON CONFLICT(hash) DO NOTHING
+            ''', (digest, blobs.blob_size(digest)))
+        value = _store_draft_images(cursor, folio, {column: ref}, freed)[column]
+        cursor.execute(f'''
+            UPDATE draft_reports
+            SET {column} = ?, pdf_preview = NULL, pdf_cache_key = NULL, pdf_archive = NULL,
+                version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE folio = ?
+        ''', (value, folio))
+        if cursor.rowcount == 0:
+            cursor.execute(f'''
+                INSERT INTO draft_reports (folio, form_data, {column}, version, status)
+                VALUES (?, '{{}}', ?, 1, 'draft')
+            ''', (folio, value))
+        cursor.execute("SELECT version FROM draft_reports WHERE folio = ?", (folio,))
+        return cursor.fetchone()[0]
+
+@contextmanager
+def _freeing_blobs():
+    """
+    Blobs freed by a transaction. Use it outside get_db(), as
+    `with _freeing_blobs() as freed, get_db() as conn:`, so it ends after the
+    transaction: _release_blobs sets the files aside, and they are deleted
+    only once the transaction has committed. If it raises (rolled back) the
+    files go back in place with their rows.
+    """
+    freed = []
+    try:
+        yield freed
+    except BaseException:
+        for digest, aside in freed:
+            blobs.put_back_blob(digest, aside)
+        raise
+    for digest, aside in freed:
+        try:
+            os.remove(aside)
+        except FileNotFoundError:
+            pass
+
+def _set_aside(freed, digest):
+    aside = blobs.set_aside_blob(digest)
+    if aside:
+        freed.append((digest, aside))
+
+def _release_blobs(cursor, values, freed):
+    """Drop one reference per blob reference in values; blobs left unreferenced go to freed"""
+    for value in values:
+        if not blobs.is_ref(value):
+            continue
+        digest = blobs.ref_hash(value)
+        cursor.execute("UPDATE draft_blobs SET refcount = refcount - 1 WHERE hash = ?", (digest,))
+        cursor.execute("DELETE FROM draft_blobs WHERE hash = ? AND refcount <= 0", (digest,))
+        if cursor.rowcount:
+            _set_aside(freed, digest)
+
+def _write_pdf_blob(conn, folio, pdf_file, pdf_cache_key):
+    """Copy an open PDF file into pdf_preview by chunks (incremental BLOB I/O)"""
+    size = pdf_file.seek(0, os.SEEK_END)
+    pdf_file.seek(0)
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE draft_reports
+        SET pdf_preview = zeroblob(?), pdf_cache_key = ?, pdf_archive = NULL,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE folio = ?
+    ''', (size, pdf_cache_key, folio))
+    if cursor.rowcount == 0:
+        return False
+    cursor.execute("SELECT rowid FROM draft_reports WHERE folio = ?", (folio,))
+    with conn.blobopen("draft_reports", "pdf_preview", cursor.fetchone()[0]) as blob:
+        while True:
+            chunk = pdf_file.read(PDF_CHUNK)
+            if not chunk:
+                break
+            blob.write(chunk)
+    return True
+
+def update_draft_form_data(folio, form_data):
+    """Update only form_data, leaving images and the PDF preview untouched"""
+    import json
+    
+    form_data, _ = _split_draft_images(form_data, {})
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE draft_reports
+            SET form_data = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE folio = ?
+        ''', (json.dumps(form_data) if isinstance(form_data, dict) else form_data, folio))
+        return cursor.rowcount > 0
+
+def get_draft_pdf_cache_key(folio):
+    """Cache key of the stored PDF preview, or None if the draft has no PDF"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT pdf_cache_key FROM draft_reports
+            WHERE folio = ? AND pdf_preview IS NOT NULL
+        ''', (folio,))
+        row = cursor.fetchone()
+        return row['pdf_cache_key'] if row else None
+
 def get_draft_by_folio(folio):
-    """Get complete draft report by folio"""
+    """Get complete draft report by folio, except the PDF preview (see iter_draft_pdf)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT folio, form_data, foto1_data, foto2_data, foto3_data, foto4_data,
+                   firma_tecnico_data, firma_cliente_data, pdf_cache_key, version, status,
+                   created_at, updated_at
+            FROM draft_reports WHERE folio = ?
+        ''', (folio,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+# Draft metadata: everything but form_data, the images and the PDF itself.
+# pdf_archive is only valid while pdf_preview is empty: every PDF write or
+# invalidation clears it.
+DRAFT_META_COLUMNS = '''folio, status, version, pdf_cache_key,
+                         COALESCE(length(pdf_preview),
+                                  CASE WHEN pdf_archive IS NOT NULL THEN pdf_archive_size END) AS pdf_size,
+                         created_at, updated_at'''
+
+def get_draft_meta(folio):
+    """
+    Draft metadata only (folio, status, version, pdf_cache_key, pdf_size, dates).
+    pdf_size is None if the draft has no PDF.
+    """
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM draft_reports WHERE folio = ?", (folio,))
+        cursor.execute(f"SELECT {DRAFT_META_COLUMNS} FROM draft_reports WHERE folio = ?", (folio,))
         row = cursor.fetchone()
         return dict(row) if row else None
 
+def get_draft_form_data(folio):
+    """form_data of a draft as a dict, or None if the draft does not exist"""
+    import json
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT form_data FROM draft_reports WHERE folio = ?", (folio,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        try:
+            return json.loads(row['form_data']) or {}
+        except (TypeError, ValueError):
+            return {}
+
+def get_draft_image(folio, column):
+    """Stored value of one image column (blob reference or Base64), or None"""
+    if column not in DRAFT_IMAGE_COLUMNS:
+        raise ValueError(f"Unknown image column: {column}")
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {column} FROM draft_reports WHERE folio = ?", (folio,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+def get_draft_pdf(folio):
+    """PDF preview of a draft as bytes, or None. Prefer iter_draft_pdf to serve it."""
+    pdf = b"".join(iter_draft_pdf(folio))
+    return pdf or None
+
+def open_draft_pdf(folio, chunk_size=PDF_CHUNK):
+    """
+    (size, chunks) of the stored PDF preview of a draft, or None if there is none.
+    The size and the bytes come from one read transaction: a render saved in
+    between can't make them disagree. PDFs archived by compactar.py are read
+    back from their gzip file. Uses its own connection, closed once chunks is
+    exhausted or closed: the response keeps reading after the request.
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN")
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT rowid, length(pdf_preview) AS pdf_size, pdf_archive, pdf_archive_size
+            FROM draft_reports WHERE folio = ?
+        ''', (folio,))
+        row = cursor.fetchone()
+        if not row or not (row['pdf_size'] or row['pdf_archive']):
+            conn.close()
+            return None
+        if row['pdf_size'] is None:
+            # opened before the snapshot ends: a later archive replaces the path, not this file
+            archive = gzip.open(row['pdf_archive'], "rb")
+            conn.close()
+            return row['pdf_archive_size'], _read_chunks(archive, chunk_size)
+        blob = conn.blobopen("draft_reports", "pdf_preview", row['rowid'], readonly=True)
+    except Exception:
+        conn.close()
+        raise
+    return row['pdf_size'], _blob_chunks(conn, blob, chunk_size)
+
+def _read_chunks(f, chunk_size):
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def _blob_chunks(conn, blob, chunk_size):
+    try:
+        yield from _read_chunks(blob, chunk_size)
+    finally:
+        conn.close()
+
+def iter_draft_pdf(folio, chunk_size=PDF_CHUNK):
+    """Yield the stored PDF preview of a draft in chunks (nothing if there is none). See open_draft_pdf."""
+    opened = open_draft_pdf(folio, chunk_size)
+    if opened is not None:
+        yield from opened[1]
+
 def get_all_drafts(status=None):
-    """Get all draft reports, optionally filtered by status"""
+    """Get all draft reports (metadata and form_data), optionally filtered by status"""
     with get_db() as conn:
         cursor = conn.cursor()
         if status:
-            cursor.execute('''
-                SELECT * FROM draft_reports 
+            cursor.execute(f'''
+                SELECT {DRAFT_META_COLUMNS}, form_data FROM draft_reports 
                 WHERE status = ?
                 ORDER BY updated_at DESC
             ''', (status,))
         else:
-            cursor.execute("SELECT * FROM draft_reports ORDER BY updated_at DESC")
+            cursor.execute(f"SELECT {DRAFT_META_COLUMNS}, form_data FROM draft_reports ORDER BY updated_at DESC")
         return [dict(row) for row in cursor.fetchall()]
 
 def delete_draft(folio):
-    """Delete a draft report by folio"""
-    with get_db() as conn:
+    """Delete a draft report by folio, releasing its images in the blob store"""
+    with _freeing_blobs() as freed, get_db() as conn:
         cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(f"SELECT {', '.join(DRAFT_IMAGE_COLUMNS)} FROM draft_reports WHERE folio = ?", (folio,))
+        row = cursor.fetchone()
+        if not row:
+            return False
+        _release_blobs(cursor, list(row), freed)
         cursor.execute("DELETE FROM draft_reports WHERE folio = ?", (folio,))
         return cursor.rowcount > 0
 
@@ -535,13 +1476,302 @@ def mark_draft_as_sent(folio):
         ''', (folio,))
         return cursor.rowcount > 0
 
-def update_draft_pdf(folio, pdf_data):
-    """Update only the PDF preview for a draft"""
+def update_draft_pdf(folio, pdf_data, pdf_cache_key=None):
+    """Update only the PDF preview for a draft. pdf_data can be bytes or a binary file."""
     with get_db() as conn:
+        if hasattr(pdf_data, "read"):
+            return _write_pdf_blob(conn, folio, pdf_data, pdf_cache_key)
         cursor = conn.cursor()
         cursor.execute('''
             UPDATE draft_reports
-            SET pdf_preview = ?, updated_at = CURRENT_TIMESTAMP
+            SET pdf_preview = ?, pdf_cache_key = ?, pdf_archive = NULL, updated_at = CURRENT_TIMESTAMP
             WHERE folio = ?
-        ''', (pdf_data, folio))
+        ''', (pdf_data, pdf_cache_key, folio))
+        return cursor.rowcount > 0
+
+
+# ========== Compaction Functions (compactar.py) ==========
+
+def strip_sent_draft_images(days):
+    """
+    Drop the photos and signatures of drafts sent more than `days` days ago,
+    releasing their blobs (the folio keeps its copies in static/uploads and
+    static/firmas). Image keys left inside form_data by older saves go too.
+    Returns the number of drafts stripped.
+    """
+    import json
+
+    with _freeing_blobs() as freed, get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        any_image = " OR ".join(f"{col} IS NOT NULL OR instr(form_data, '\"{col}\"')"
+                                for col in DRAFT_IMAGE_COLUMNS)
+        cursor.execute(f'''
+            SELECT folio, form_data, {', '.join(DRAFT_IMAGE_COLUMNS)} FROM draft_reports
+            WHERE status = 'sent' AND updated_at < datetime('now', ?) AND ({any_image})
+        ''', (f"-{int(days)} days",))
+        rows = cursor.fetchall()
+        cleared = ", ".join(f"{col} = NULL" for col in DRAFT_IMAGE_COLUMNS)
+        for row in rows:
+            _release_blobs(cursor, [row[col] for col in DRAFT_IMAGE_COLUMNS], freed)
+            try:
+                form_data = json.loads(row['form_data']) or {}
+            except (TypeError, ValueError):
+                form_data = {}
+            for col in DRAFT_IMAGE_COLUMNS:
+                form_data.pop(col, None)
+            cursor.execute(f"UPDATE draft_reports SET {cleared}, form_data = ? WHERE folio = ?",
+                           (json.dumps(form_data), row['folio']))
+        return len(rows)
+
+def get_sent_drafts_with_pdf(days):
+    """Folio, pdf_cache_key and pdf_size of sent drafts older than `days` days whose PDF is still in the database"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT folio, pdf_cache_key, length(pdf_preview) AS pdf_size FROM draft_reports
+            WHERE status = 'sent' AND pdf_preview IS NOT NULL AND updated_at < datetime('now', ?)
+            ORDER BY updated_at
+        ''', (f"-{int(days)} days",))
+        return [dict(row) for row in cursor.fetchall()]
+
+def archive_draft_pdf(folio, path, pdf_size, pdf_cache_key):
+    """
+    Swap the PDF of a draft for its compressed copy at `path`. Only applies if
+    the PDF is still the one that was copied (same size and cache key);
+    returns False otherwise, and the caller should drop the copy.
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE draft_reports
+            SET pdf_preview = NULL, pdf_archive = ?, pdf_archive_size = ?
+            WHERE folio = ? AND length(pdf_preview) = ? AND pdf_cache_key IS ?
+        ''', (path, pdf_size, folio, pdf_size, pdf_cache_key))
+        return cursor.rowcount > 0
+
+def get_draft_pdf_archives():
+    """Set of archive paths still in use (valid only while pdf_preview is empty)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT pdf_archive FROM draft_reports
+            WHERE pdf_archive IS NOT NULL AND pdf_preview IS NULL
+        ''')
+        return {row['pdf_archive'] for row in cursor.fetchall()}
+
+def vacuum_db(max_pages=0):
+    """
+    Give free pages back to the filesystem with incremental VACUUM (all of them
+    when max_pages is 0). A database created before auto_vacuum was enabled
+    gets one full VACUUM to switch it to incremental mode.
+    Returns (pages freed, database pages left).
+    """
+    conn = _connect()
+    conn.isolation_level = None  # VACUUM can't run inside a transaction
+    try:
+        cursor = conn.cursor()
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        before = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        # executescript steps the pragma to the end; execute() frees a single page
+        conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)})")
+        after = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after, cursor.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        conn.close()
+
+
+# ========== Storage Functions (archivos.py) ==========
+
+def get_folio_file_index():
+    """
+    What the disk copies of each folio can be checked against: ({folio:
+    {"status", "images"}} of the drafts, where images is the set of image
+    columns with a value, and the set of folios in reports).
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        has_image = ", ".join(f"{col} IS NOT NULL AS {col}" for col in DRAFT_IMAGE_COLUMNS)
+        cursor.execute(f"SELECT folio, status, {has_image} FROM draft_reports")
+        drafts = {
+            row['folio']: {"status": row['status'],
+                           "images": {col for col in DRAFT_IMAGE_COLUMNS if row[col]}}
+            for row in cursor.fetchall()
+        }
+        cursor.execute("SELECT folio FROM reports")
+        return drafts, {row['folio'] for row in cursor.fetchall()}
+
+def get_technicians_by_prefix():
+    """{folio prefix: technician name} from the users table"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT prefijo, nombre FROM users")
+        return {row['prefijo']: row['nombre'] for row in cursor.fetchall()}
+
+def get_draft_blob_hashes():
+    """Every hash the blob store has a row for"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT hash FROM draft_blobs")
+        return {row['hash'] for row in cursor.fetchall()}
+
+def get_unreferenced_blobs(days):
+    """Hash and size of blobs no draft references, stored more than `days` days ago"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT hash, size FROM draft_blobs
+            WHERE refcount <= 0 AND created_at < datetime('now', ?)
+        ''', (f"-{int(days)} days",))
+        return [dict(row) for row in cursor.fetchall()]
+
+def delete_unreferenced_blob(digest):
+    """Delete a blob (row and file) if still nothing references it. True if deleted."""
+    with _freeing_blobs() as freed, get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("DELETE FROM draft_blobs WHERE hash = ? AND refcount <= 0", (digest,))
+        if cursor.rowcount:
+            _set_aside(freed, digest)
+        return cursor.rowcount > 0
+
+def get_stale_draft_uploads(days):
+    """Resumable uploads still open with no chunk in the last `days` days"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM draft_uploads
+            WHERE status = 'open' AND updated_at < datetime('now', ?)
+        ''', (f"-{int(days)} days",))
+        return [dict(row) for row in cursor.fetchall()]
+
+
+# ========== Resumable Upload Functions ==========
+
+def create_draft_upload(folio, slot, size, sha256):
+    """
+    Start a resumable upload for a draft image slot. An open upload of the same
+    file (folio, slot, size, sha256) is reused so the client resumes from its offset.
+    """
+    import secrets
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM draft_uploads
+            WHERE folio = ? AND slot = ? AND sha256 = ? AND size = ? AND status = 'open'
+            ORDER BY created_at DESC LIMIT 1
+        ''', (folio, slot, sha256, size))
+        row = cursor.fetchone()
+        if row:
+            return dict(row)
+        upload_id = secrets.token_hex(16)
+        cursor.execute('''
+            INSERT INTO draft_uploads (id, folio, slot, size, sha256)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (upload_id, folio, slot, size, sha256))
+        cursor.execute("SELECT * FROM draft_uploads WHERE id = ?", (upload_id,))
+        return dict(cursor.fetchone())
+
+def get_draft_upload(upload_id):
+    """Get a resumable upload by id"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM draft_uploads WHERE id = ?", (upload_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def advance_draft_upload(upload_id, offset, received):
+    """Move the received offset forward, only if it is still `offset` (compare-and-set)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE draft_uploads
+            SET received = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND received = ? AND status = 'open'
+        ''', (received, upload_id, offset))
+        return cursor.rowcount > 0
+
+def finish_draft_upload(upload_id, status):
+    """Close an upload as 'done' or 'failed'. False if it was not open anymore."""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE draft_uploads
+            SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'open'
+        ''', (status, upload_id))
+        return cursor.rowcount > 0
+
+# ========== PDF Job Queue Functions ==========
+
+def enqueue_pdf_job(folio):
+    """Queue a PDF render for a folio. Reuses a job still pending for the same folio."""
+    with get_db() as conn:
+        # IMMEDIATE: two requests for the same folio can't both miss the pending job
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id FROM pdf_jobs
+            WHERE folio = ? AND status = 'pending'
+            ORDER BY id LIMIT 1
+        ''', (folio,))
+        row = cursor.fetchone()
+        if row:
+            return row['id']
+        cursor.execute("INSERT INTO pdf_jobs (folio) VALUES (?)", (folio,))
+        return cursor.lastrowid
+
+def claim_next_pdf_job():
+    """Atomically take the oldest pending job and mark it as running"""
+    try:
+        with get_db() as conn:
+            # IMMEDIATE takes the write lock up front so two workers never claim the same row
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute('''
+                SELECT * FROM pdf_jobs
+                WHERE status = 'pending'
+                ORDER BY id LIMIT 1
+            ''').fetchone()
+            if row:
+                conn.execute('''
+                    UPDATE pdf_jobs
+                    SET status = 'running', attempts = attempts + 1, started_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (row['id'],))
+        return dict(row) if row else None
+    except sqlite3.OperationalError:
+        # Database busy: let the worker try again on its next poll
+        return None
+
+def finish_pdf_job(job_id, error=None):
+    """Mark a job as done, or as error with its message"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE pdf_jobs
+            SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', ('error' if error else 'done', error, job_id))
         return cursor.rowcount > 0
+
+def get_pdf_job(job_id):
+    """Get a PDF job by ID"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM pdf_jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def requeue_stale_pdf_jobs(minutes=10):
+    """Put back in the queue jobs left 'running' by a worker that died"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE pdf_jobs
+            SET status = 'pending'
+            WHERE status = 'running' AND started_at < datetime('now', ?)
+        ''', (f"-{int(minutes)} minutes",))
+        return cursor.rowcount
@@ -0,0 +1,68 @@
+# firmas.py
+# Firmas como trazos vectoriales.
+#
+# El pad del formulario (enableSignaturePadHDPI) manda la firma como un SVG
+# mínimo: viewBox en pixeles CSS del canvas y un solo <path> con comandos M/L,
+# ya simplificados en el navegador. Aquí se lee ese SVG y se dibuja en el PDF
+# como trazos, sin pasar por PIL. Las firmas PNG de borradores anteriores
+# siguen el camino raster de siempre.
+import re
+
+_VIEWBOX_RE = re.compile(rb'viewBox="0 0 ([\d.]+) ([\d.]+)"')
+_PATH_RE = re.compile(rb'<path[^>]*\sd="([^"]*)"')
+_WIDTH_RE = re.compile(rb'stroke-width="([\d.]+)"')
+_CMD_RE = re.compile(rb'([ML])\s*(-?[\d.]+)[\s,]+(-?[\d.]+)')
+
+def is_vector(data):
+    return bool(data) and data.lstrip()[:4] == b"<svg"
+
+def parse_signature(data):
+    """
+    (ancho, alto, grosor, trazos) de una firma SVG, con los trazos como listas
+    de puntos (x, y) en coordenadas del viewBox. None si no es una firma
+    vectorial que se pueda leer.
+    """
+    if not is_vector(data):
+        return None
+    box, path = _VIEWBOX_RE.search(data), _PATH_RE.search(data)
+    if not box or not path:
+        return None
+    width = _WIDTH_RE.search(data)
+    strokes = []
+    try:
+        # el SVG viene del navegador: un número mal formado ("1.2.3") no es una firma
+        for cmd, x, y in _CMD_RE.findall(path.group(1)):
+            if cmd == b"M" or not strokes:
+                strokes.append([])
+            strokes[-1].append((float(x), float(y)))
+        w, h = float(box.group(1)), float(box.group(2))
+        line_w = float(width.group(1)) if width else 2.0
+    except ValueError:
+        return None
+    if not strokes or w <= 0 or h <= 0:
+        return None
+    return w, h, line_w, strokes
+
+def draw_signature(c, sig, x, y, w, h, center=False):
+    """
+    Dibuja la firma de parse_signature dentro de la caja (x, y, w, h) sin
+    deformarla, con la base en y (y centrada a lo ancho si center).
+    """
+    sw, sh, line_w, strokes = sig
+    scale = min(w/sw, h/sh)
+    if center:
+        x += (w - sw*scale) / 2
+    c.saveState()
+    c.setStrokeColorRGB(0, 0, 0)
+    c.setLineWidth(line_w * scale)
+    c.setLineCap(1)
+    c.setLineJoin(1)
+    p = c.beginPath()
+    for stroke in strokes:
+        # el SVG crece hacia abajo, el PDF hacia arriba
+        pts = [(x + px*scale, y + (sh - py)*scale) for px, py in stroke]
+        p.moveTo(*pts[0])
+        for pt in pts[1:] or pts:
+            p.lineTo(*pt)
+    c.drawPath(p, stroke=1, fill=0)
+    c.restoreState()
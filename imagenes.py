@@ -0,0 +1,150 @@
+# imagenes.py
+# Fotos de evidencia listas para imprimir: orientación EXIF corregida,
+# reducidas a la resolución de impresión del recuadro y re-codificadas a JPEG.
+#
+# El resultado se guarda por hash de contenido (memoria + disco), así que
+# volver a renderizar el mismo borrador no decodifica la foto original otra vez.
+#
+# Al llegar una foto, ingest_photo() prepara en un pool de hilos su versión de
+# impresión y una miniatura para el formulario (sin EXIF, ya orientadas).
+import os, io, hashlib, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+PRINT_CACHE_DIR = os.environ.get("PDF_IMAGE_CACHE_DIR", os.path.join(APP_ROOT, "cache", "print"))
+PRINT_DPI = int(os.environ.get("PDF_IMAGE_DPI", "200"))
+JPEG_QUALITY = int(os.environ.get("PDF_JPEG_QUALITY", "80"))
+MEMORY_ITEMS = 64
+THUMB_CACHE_DIR = os.environ.get("IMAGE_THUMB_CACHE_DIR", os.path.join(APP_ROOT, "cache", "thumbs"))
+THUMB_SIDE = 320
+THUMB_QUALITY = 70
+INGEST_WORKERS = int(os.environ.get("IMAGE_INGEST_WORKERS", "2"))
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _target_size(frame_w, frame_h, dpi):
+    """Pixeles que caben en un recuadro de frame_w x frame_h puntos a `dpi`."""
+    return max(1, round(frame_w / 72.0 * dpi)), max(1, round(frame_h / 72.0 * dpi))
+
+def _remember(key, value):
+    with _memory_lock:
+        _memory[key] = value
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_ITEMS:
+            _memory.popitem(last=False)
+
+def _recall(key):
+    with _memory_lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            return _memory[key]
+    return None
+
+def _write_cache_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # escribir y renombrar: otro worker (o hilo) nunca lee un JPEG a medias
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _encode_print(data, max_w, max_h, quality):
+    img = Image.open(io.BytesIO(data))
+    side = max(max_w, max_h)
+    img.draft("RGB", (side, side))  # JPEG: decodifica ya reducido (cuadrado por si EXIF rota)
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("RGBA", "LA", "P", "PA"):
+        img = img.convert("RGBA")
+        bg = Image.new("RGB", img.size, (255, 255, 255))
+        bg.paste(img, mask=img.getchannel("A"))
+        img = bg
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_w, max_h), Image.LANCZOS)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+def prepare_print_image(data, frame_w, frame_h, dpi=None, quality=None):
+    """
+    JPEG para embeber en un recuadro de frame_w x frame_h puntos.
+    Regresa los bytes originales si la imagen no se puede abrir.
+    """
+    if not data:
+        return data
+    dpi = dpi or PRINT_DPI
+    quality = quality or JPEG_QUALITY
+    max_w, max_h = _target_size(frame_w, frame_h, dpi)
+    name = f"{content_hash(data)}_{max_w}x{max_h}_q{quality}.jpg"
+
+    out = _recall(name)
+    if out is not None:
+        return out
+
+    path = os.path.join(PRINT_CACHE_DIR, name)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            out = f.read()
+        _remember(name, out)
+        return out
+
+    try:
+        out = _encode_print(data, max_w, max_h, quality)
+    except Exception:
+        return data
+
+    try:
+        _write_cache_file(path, out)
+    except OSError:
+        pass
+    _remember(name, out)
+    return out
+
+def thumbnail(data):
+    """
+    Miniatura JPEG (lado mayor THUMB_SIDE) para mostrar la foto en el
+    formulario, en caché de disco por hash. None si la imagen no se puede abrir.
+    """
+    if not data:
+        return None
+    path = os.path.join(THUMB_CACHE_DIR, f"{content_hash(data)}_{THUMB_SIDE}.jpg")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    try:
+        out = _encode_print(data, THUMB_SIDE, THUMB_SIDE, THUMB_QUALITY)
+    except Exception:
+        return None
+    try:
+        _write_cache_file(path, out)
+    except OSError:
+        pass
+    return out
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="imagenes")
+        return _pool
+
+def ingest_photo(load, frame_w, frame_h):
+    """
+    Encola en el pool la versión de impresión (recuadro de frame_w x frame_h
+    puntos) y la miniatura de una foto recién llegada. `load()` regresa los
+    bytes de la foto y se llama ya dentro del hilo. Regresa el Future.
+    """
+    def work():
+        data = load()
+        if data:
+            prepare_print_image(data, frame_w, frame_h)
+            thumbnail(data)
+    return _executor().submit(work)
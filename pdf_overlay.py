@@ -0,0 +1,337 @@
+# pdf_overlay.py
+# Modo "overlay": en lugar de dibujar todo el reporte con canvas, se dibujan
+# solo los valores sobre una capa transparente y se fusionan con la hoja
+# base de formatos/ (preventivo_base.pdf / correctivo_base.pdf), que se
+# parsea una sola vez por proceso.
+#
+# Las hojas base son de una página (carta) y sin espacio para fotos: si el
+# reporte no cabe en el formato, render_overlay_pdf() regresa None y se usa
+# el renderer normal (pdf_renderer.render_report_pdf).
+#
+# Coordenadas en puntos PDF (origen abajo-izquierda), medidas sobre las
+# hojas base tal como vienen de Excel.
+import os, io, re
+from functools import lru_cache
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+from reportlab.pdfgen import canvas
+from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from pdf_renderer import (
+    SPM_ROWS, SPM_COLS, _is_secador, _is_bitacora, _has_value, _wrap_text_force
+)
+from firmas import parse_signature, draw_signature
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+FORMATOS_DIR = os.path.join(APP_ROOT, "formatos")
+BASE_PDFS = {
+    "preventivo": os.path.join(FORMATOS_DIR, "preventivo_base.pdf"),
+    "correctivo": os.path.join(FORMATOS_DIR, "correctivo_base.pdf"),
+}
+
+FONT, FONT_B, SIZE = "Helvetica", "Helvetica-Bold", 7.5
+FOLIO_COLOR = colors.HexColor("#e0001b")
+
+class _NoCabe(Exception):
+    """El reporte no cabe en la hoja base; se usa el renderer normal."""
+
+@lru_cache(maxsize=None)
+def _base_page(kind):
+    """Página base ya parseada (una vez por proceso)."""
+    return PdfReader(BASE_PDFS[kind]).pages[0]
+
+def _base_kind(report):
+    """'preventivo' / 'correctivo' según el servicio, o None si no hay formato."""
+    ts = (report["tipo_servicio"] or "").lower()
+    if _is_bitacora(ts) or _is_secador(report["tipo_equipo"]):
+        return None
+    return "preventivo" if ts == "preventivo" else "correctivo"
+
+# ------------------ primitivas ------------------
+def _mask(c, x, y, w, h):
+    """Tapa los datos de ejemplo que traen las hojas base."""
+    c.saveState()
+    c.setFillColor(colors.white)
+    c.rect(x, y, w, h, stroke=0, fill=1)
+    c.restoreState()
+
+def _field(c, x, y, text, max_w, font=FONT, size=SIZE, align="left"):
+    """Valor de una sola línea; _NoCabe si no entra en max_w."""
+    text = (text or "").strip()
+    if not text:
+        return
+    w = stringWidth(text, font, size)
+    if w > max_w:
+        raise _NoCabe(text)
+    c.setFont(font, size)
+    if align == "center":
+        c.drawCentredString(x, y, text)
+    elif align == "right":
+        c.drawRightString(x, y, text)
+    else:
+        c.drawString(x, y, text)
+
+def _block(c, x, baselines, paragraphs, max_w, size=SIZE):
+    """Párrafos sobre los renglones impresos de la hoja; _NoCabe si sobran líneas."""
+    lines = []
+    for p in paragraphs:
+        for part in (p or "").split("\n"):
+            lines.extend(_wrap_text_force(part.strip(), max_w, FONT, size))
+    if len(lines) > len(baselines):
+        raise _NoCabe(paragraphs)
+    c.setFont(FONT, size)
+    for yy, ln in zip(baselines, lines):
+        c.drawString(x, yy, ln)
+
+def _ruled(first, step, n, lift=1.8):
+    """Baselines de n renglones a partir de la primera raya impresa."""
+    return [first + lift - i*step for i in range(n)]
+
+def _value(v):
+    return v if _has_value(v) else ""
+
+def _signature(c, data, x, y, w, h):
+    """Firma con su transparencia: en la hoja queda encima del texto impreso."""
+    if not data:
+        return
+    sig = parse_signature(data)
+    if sig is not None:
+        draw_signature(c, sig, x, y, w, h, center=True)
+        return
+    try:
+        img = ImageReader(io.BytesIO(data))
+    except Exception:
+        return
+    iw, ih = img.getSize()
+    scale = min(w/iw, h/ih)
+    dw, dh = iw*scale, ih*scale
+    c.drawImage(img, x + (w-dw)/2, y, dw, dh, mask="auto")
+
+def _signatures(c, report, tecnico_box, cliente_box, tecnico_name, cliente_name):
+    _signature(c, report["firma_tecnico"], *tecnico_box)
+    _signature(c, report["firma_cliente"], *cliente_box)
+    _field(c, *tecnico_name, _value(report["firma_tecnico_nombre"]), 150, size=6.5, align="center")
+    _field(c, *cliente_name, _value(report["firma_cliente_nombre"]), 150, size=6.5, align="center")
+
+# ------------------ preventivo ------------------
+# Columnas de horas del grid de actividades: (x izquierda, x derecha) por intervalo
+P_HORAS_IZQ = {2000: (144.6, 178.1), 4000: (178.1, 205.6), 6000: (205.6, 238.1), 8000: (238.1, 268.0)}
+P_HORAS_DER = {2000: (402.4, 437.5), 4000: (437.5, 489.1), 6000: (489.1, 540.7), 8000: (540.7, 587.9)}
+P_ACT_Y = _ruled(555.3, 10.09, 17, lift=1.8)     # 17 renglones de la columna izquierda
+P_LECT_Y = _ruled(370.7, 9.6, 11, lift=1.8)      # datos generales / oil free / eléctricos
+P_SPM_X = [318.8, 345.7, 373.5, 402.4, 437.5, 463.3, 489.1, 514.9, 540.7, 566.5, 587.9]
+P_SPM_Y = [446.2, 436.1, 426.1, 416.0, 405.9, 395.8]
+P_E3_X = [(437.5, 489.1), (489.1, 540.7), (540.7, 587.9)]
+P_OBS_Y = _ruled(260.2, 11.4, 10, lift=1.6)
+
+def _columna_horas(descripcion):
+    """Intervalo del grid (2000..8000) para '2000 HORAS', '16000 HORAS', etc."""
+    m = re.search(r"(\d+)", descripcion or "")
+    if not m:
+        return None
+    horas = int(m.group(1))
+    for col in (8000, 6000, 4000, 2000):
+        if horas and horas % col == 0:
+            return col
+    return None
+
+def _draw_preventivo(c, report):
+    col = _columna_horas(report["descripcion_servicio"])
+    if col is None:
+        raise _NoCabe(report["descripcion_servicio"])
+
+    # Encabezado (tapando los datos de ejemplo de la hoja)
+    _mask(c, 278.5, 689.0, 94.5, 27.0)
+    c.setFillColor(FOLIO_COLOR)
+    _field(c, 325.6, 698.5, report["folio"], 92, font=FONT_B, size=13, align="center")
+    c.setFillColor(colors.black)
+    _field(c, 481.0, 703.0, _value(report["fecha"]), 200, font=FONT_B, size=9, align="center")
+    _mask(c, 335.0, 675.5, 252.0, 11.0)
+    _field(c, 337.5, 678.2, _value(report["tipo_servicio"]) + "  " + _value(report["descripcion_servicio"]), 248, font=FONT_B)
+    _mask(c, 300.0, 647.5, 287.0, 11.5)
+    _field(c, 303.0, 651.1, _value(report["tipo_equipo"]), 282)
+    _field(c, 312.0, 636.9, _value(report["modelo"]), 60)
+    _field(c, 402.0, 636.9, _value(report["serie"]), 184)
+    _field(c, 307.0, 623.3, _value(report["marca"]), 65)
+    _field(c, 414.0, 623.5, _value(report["potencia"]), 172)
+
+    # Datos del cliente
+    _field(c, 142.0, 606.5, _value(report["cliente"]), 258)
+    _field(c, 142.0, 594.6, _value(report["direccion"]), 442)
+    _field(c, 80.0, 584.4, _value(report["telefono"]), 60, size=6.5)
+    _field(c, 180.0, 582.8, _value(report["contacto"]), 164)
+    _field(c, 376.0, 582.8, _value(report["email"]), 208)
+
+    # Actividades: X en la columna del intervalo. Las 17 primeras van a la
+    # izquierda; el resto (8 + R30) a la derecha.
+    izq, der = P_HORAS_IZQ[col], P_HORAS_DER[col]
+    for i, (_, estado) in enumerate(report["actividades"]):
+        if estado != "Realizado":
+            continue
+        if i == len(report["actividades"]) - 1 and report["ruido_tipo"] == "SPM":
+            continue  # SPM va en su propia tabla
+        x0, x1 = izq if i < 17 else der
+        _field(c, (x0+x1)/2, P_ACT_Y[i if i < 17 else i - 17], "X", x1 - x0, font=FONT_B, align="center")
+
+    # SPM
+    if report["spm"]:
+        for yy, (_, rk) in zip(P_SPM_Y, SPM_ROWS):
+            for j, ck in enumerate(SPM_COLS):
+                x0, x1 = P_SPM_X[j], P_SPM_X[j+1]
+                _field(c, (x0+x1)/2, yy, _value(report["spm"].get(f"{rk}_{ck}")), x1 - x0 - 2, size=6, align="center")
+
+    # Lecturas: datos generales (col. izquierda) y oil free (col. central).
+    # La hoja no tiene renglón para "(otro)": va en observaciones.
+    extras = []
+    for n, (_, labels, vals) in enumerate(report["lecturas"]):
+        x, w, filas = (279.0, 38.0, 9) if n == 1 else (141.5, 35.0, 10)
+        for i, v in enumerate(vals):
+            v = _value(v)
+            if i < filas:
+                _field(c, x, P_LECT_Y[i], v, w, size=6.5)
+            elif v:
+                extras.append(f"{labels[i]}: {v}")
+
+    # Eléctricos trifásicos: valor a la derecha de cada celda (L1-2, L2-3...)
+    for i, (_, vals) in enumerate(report["electricos_3f"][:6]):
+        for (x0, x1), v in zip(P_E3_X, vals):
+            _field(c, x1 - 1.5, P_LECT_Y[i], _value(v), x1 - x0 - 14, size=6, align="right")
+    e1 = dict(report["electricos_1f"])
+    _field(c, 405.0, P_LECT_Y[6], _value(e1.get("Corriente de placa")), 180, size=6.5)
+    _field(c, 405.0, P_LECT_Y[7], _value(e1.get("Voltaje del bus DC")), 180, size=6.5)
+    _field(c, 404.0, P_LECT_Y[8], _value(e1.get("RPM del motor (VFD)")), 32, size=6)
+    for x, key in ((415.0, "Temp. IGBT U="), (476.0, "Temp. IGBT V="), (528.0, "Temp. IGBT W=")):
+        _field(c, x, P_LECT_Y[9], _value(e1.get(key)), 46, size=6)
+    _field(c, 405.0, P_LECT_Y[10], _value(e1.get("Temp. rectificador")), 180, size=6.5)
+
+    # Observaciones + lo que no tiene casilla en la hoja
+    parrafos = []
+    if extras:
+        parrafos.append("Otras lecturas: " + ", ".join(extras))
+    if _has_value(report["observaciones"]):
+        parrafos.append(report["observaciones"])
+    if _has_value(report["act_otras"]):
+        parrafos.append("Otras actividades: " + report["act_otras"])
+    if report["analisis_ruido"]:
+        for etiqueta, key in (("Resultado análisis de ruido", "ruido_resultado"),
+                              ("Observaciones análisis de ruido", "ruido_observaciones")):
+            if _has_value(report[key]):
+                parrafos.append(f"{etiqueta}: {report[key]}")
+    _block(c, 45.0, P_OBS_Y, parrafos, 538)
+
+    _signatures(c, report, (150.0, 116.5, 110.0, 22.0), (425.0, 116.5, 90.0, 22.0),
+                (204.3, 112.8), (458.9, 112.8))
+
+# ------------------ correctivo ------------------
+def _draw_correctivo(c, report):
+    # Encabezado
+    _mask(c, 331.5, 729.0, 129.0, 28.0)
+    c.setFillColor(FOLIO_COLOR)
+    _field(c, 396.0, 737.5, report["folio"], 126, font=FONT_B, size=14, align="center")
+    c.setFillColor(colors.black)
+    _mask(c, 462.5, 735.0, 133.0, 22.0)
+    _field(c, 529.0, 743.4, _value(report["fecha"]), 130, font=FONT_B, size=9, align="center")
+    _mask(c, 403.0, 705.5, 193.0, 14.0)
+    _field(c, 406.0, 709.2, _value(report["tipo_servicio"]), 188, font=FONT_B)
+    if report["descripcion_servicio"] != report["tipo_servicio"]:
+        _field(c, 335.0, 692.5, _value(report["descripcion_servicio"]), 259)
+    _mask(c, 360.0, 671.0, 236.0, 15.0)
+    _field(c, 362.0, 675.5, _value(report["tipo_equipo"]), 232)
+    _field(c, 372.0, 658.5, _value(report["modelo"]), 88)
+    _field(c, 492.0, 658.5, _value(report["serie"]), 102)
+    _mask(c, 368.0, 637.5, 92.0, 14.5)
+    _field(c, 376.5, 641.5, _value(report["marca"]), 84)
+    _field(c, 510.0, 641.5, _value(report["potencia"]), 85)
+
+    # Datos del cliente
+    _field(c, 163.0, 620.3, _value(report["cliente"]), 330)
+    _field(c, 168.0, 605.7, _value(report["direccion"]), 418)
+    _field(c, 86.0, 592.8, _value(report["telefono"]), 74, size=6.5)
+    _field(c, 210.0, 591.0, _value(report["contacto"]), 217)
+    _field(c, 464.0, 591.0, _value(report["email"]), 123)
+
+    # Secciones de renglones: (raya superior, n renglones, separación)
+    corr = dict(report["correctivo"])
+    secciones = [
+        ((569.9, 4, 10.85), [f"Diagnóstico: {corr['Diagnóstico del problema']}",
+                             f"Causa raíz: {corr['Causa raíz']}"]),
+        ((510.8, 6, 10.8), [corr["Condiciones en que se encontró el equipo"]]),
+        ((429.5, 8, 10.8), [corr["Actividades realizadas"],
+                            f"Refacciones utilizadas: {corr['Refacciones utilizadas']}"]),
+        ((327.9, 6, 10.8), [corr["Condiciones en que se entrega el equipo"]]),
+        ((246.7, 10, 12.49), [report["observaciones"]]),
+    ]
+    for (first, n, step), parrafos in secciones:
+        parrafos = [p for p in parrafos if _has_value(p) and not p.endswith(": N/A")]
+        _block(c, 43.0, _ruled(first, step, n), parrafos, 542)
+
+    _signatures(c, report, (180.0, 84.0, 120.0, 26.0), (355.0, 84.0, 120.0, 26.0),
+                (240.0, 79.6), (413.4, 79.6))
+
+# ------------------ generación PDF ------------------
+OVERLAY_NAME = "/InairOverlay"
+
+def _stream(writer, data):
+    st = DecodedStreamObject()
+    st.set_data(data)
+    return writer._add_object(st)
+
+def _stamp(writer, page, layer):
+    """
+    Pone la capa (página de reportlab ya clonada al writer) encima de `page`
+    como Form XObject. A diferencia de PageObject.merge_page, no re-parsea
+    ni re-escribe el contenido de la hoja base: solo agrega dos streams
+    chicos alrededor de él.
+    """
+    form = layer["/Contents"].get_object()
+    form.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): layer.mediabox,
+        NameObject("/Resources"): layer["/Resources"],
+    })
+    resources = page["/Resources"].get_object()
+    xobjects = resources.get("/XObject")
+    xobjects = xobjects.get_object() if xobjects is not None else DictionaryObject()
+    xobjects[NameObject(OVERLAY_NAME)] = layer.raw_get("/Contents")
+    resources[NameObject("/XObject")] = xobjects
+
+    contents = page.raw_get("/Contents")
+    contents = list(contents.get_object()) if isinstance(contents.get_object(), ArrayObject) else [contents]
+    page[NameObject("/Contents")] = ArrayObject(
+        [_stream(writer, b"q\n")] + contents + [_stream(writer, f"\nQ\nq {OVERLAY_NAME} Do Q\n".encode())]
+    )
+
+def render_overlay_pdf(report, out=None):
+    """
+    PDF del reporte sobre la hoja base de formatos/, o None si el reporte
+    no cabe en el formato (fotos, textos largos, secador, bitácora...).
+    Con `out` escribe ahí y devuelve `out`; sin él devuelve los bytes.
+    Si regresa None no se escribió nada en `out`.
+    """
+    kind = _base_kind(report)
+    if kind is None or report["fotos"]:
+        return None
+
+    base = _base_page(kind)
+    box = base.mediabox
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=(float(box.width), float(box.height)))
+    try:
+        (_draw_preventivo if kind == "preventivo" else _draw_correctivo)(c, report)
+    except _NoCabe:
+        return None
+    c.showPage()
+    c.save()
+
+    writer = PdfWriter()
+    page = writer.add_page(base)   # copia: la base en caché no se modifica
+    _stamp(writer, page, PdfReader(io.BytesIO(buf.getvalue())).pages[0].clone(writer))
+    if out is None:
+        buf = io.BytesIO()
+        writer.write(buf)
+        return buf.getvalue()
+    writer.write(out)
+    return out
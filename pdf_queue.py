@@ -0,0 +1,108 @@
+# pdf_queue.py
+# Workers que renderizan los PDFs encolados en la tabla pdf_jobs.
+#
+# El request solo guarda el borrador y encola el folio; aquí se lee el
+# borrador, se dibuja el PDF y se guarda en draft_reports.pdf_preview.
+#
+#   python pdf_queue.py --workers 2
+import os, json, time, argparse, multiprocessing
+
+from database import (
+    init_db, get_draft_by_folio, get_draft_pdf_cache_key, save_report, update_draft_pdf,
+    claim_next_pdf_job, finish_pdf_job, requeue_stale_pdf_jobs, DRAFT_IMAGE_COLUMNS
+)
+from pdf_renderer import parse_report, spool_report_pdf, report_cache_key
+from archivos import save_report_files
+from blobs import load_data_url
+
+POLL_INTERVAL = float(os.environ.get("PDF_QUEUE_POLL", "0.5"))
+STALE_MINUTES = int(os.environ.get("PDF_QUEUE_STALE_MINUTES", "10"))
+
+def draft_to_form(draft):
+    """form_data del borrador + sus fotos/firmas (leídas del almacén de blobs), listo para parse_report."""
+    form = draft["form_data"]
+    form = dict(json.loads(form) if isinstance(form, str) else form or {})
+    for key in DRAFT_IMAGE_COLUMNS:
+        value = load_data_url(draft.get(key))
+        if value:
+            form[key] = value
+    return form
+
+def render_draft(folio):
+    """
+    Renderiza el borrador guardado de un folio y guarda PDF + metadatos del reporte.
+    Regresa el tamaño en bytes del PDF guardado. Si el PDF guardado ya corresponde
+    al contenido del borrador no se re-renderiza; en ese caso regresa None.
+    """
+    draft = get_draft_by_folio(folio)
+    if not draft:
+        raise LookupError(f"Borrador {folio} no encontrado")
+    form = draft_to_form(draft)
+    report = parse_report(form)
+    report["folio"] = folio
+
+    cache_key = report_cache_key(report)
+    pdf_file = None
+    if get_draft_pdf_cache_key(folio) != cache_key:
+        save_report_files(report)
+        pdf_file = spool_report_pdf(report)
+
+    save_report(
+        folio=folio,
+        fecha=report["fecha"],
+        cliente=report["cliente"],
+        tipo_equipo=report["tipo_equipo"],
+        modelo=report["modelo"],
+        serie=report["serie"],
+        marca=report["marca"],
+        potencia=report["potencia"],
+        tipo_servicio=report["tipo_servicio"],
+        descripcion_servicio=report["descripcion_servicio"],
+        tecnico=report["tecnico"],
+        localidad=report["localidad"]
+    )
+    if pdf_file is None:
+        return None
+    with pdf_file:
+        update_draft_pdf(folio, pdf_file, cache_key)
+        return pdf_file.tell()
+
+def run_next_job():
+    """Toma y procesa un job. Regresa False si la cola estaba vacía."""
+    job = claim_next_pdf_job()
+    if not job:
+        return False
+    try:
+        render_draft(job["folio"])
+    except Exception as e:
+        print(f"Error rendering PDF job {job['id']} ({job['folio']}): {e}")
+        finish_pdf_job(job["id"], error=str(e) or e.__class__.__name__)
+    else:
+        finish_pdf_job(job["id"])
+    return True
+
+def worker_loop(poll_interval=POLL_INTERVAL):
+    while True:
+        if not run_next_job():
+            time.sleep(poll_interval)
+
+def start_workers(n):
+    """Lanza n procesos worker y regresa la lista de procesos."""
+    procs = []
+    for i in range(n):
+        p = multiprocessing.Process(target=worker_loop, name=f"pdf-worker-{i+1}", daemon=True)
+        p.start()
+        procs.append(p)
+    return procs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Workers de la cola de PDFs")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PDF_WORKERS", "2")))
+    args = parser.parse_args()
+
+    init_db()
+    requeue_stale_pdf_jobs(STALE_MINUTES)
+    procs = start_workers(max(1, args.workers))
+    print(f"PDF queue: {len(procs)} worker(s) running")
+    for p in procs:
+        p.join()
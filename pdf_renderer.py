@@ -0,0 +1,851 @@
+# pdf_renderer.py
+# Render del reporte técnico a PDF, independiente de Flask.
+#
+# parse_report() convierte un form (request.form o el form_data de un borrador)
+# en un dict de reporte; render_report_pdf() recibe ese dict y devuelve bytes
+# (o los escribe en un archivo, ver spool_report_pdf()).
+import os, io, json, base64, hashlib, math, tempfile
+from functools import lru_cache
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.utils import ImageReader
+from PIL import Image
+
+from catalogos import (
+    ACTIVIDADES_SENTENCE, DG_LABELS, OF_LABELS, SEC_LABELS, E3, E1, SEC_E3, SEC_E1
+)
+from imagenes import prepare_print_image, content_hash, PRINT_DPI, JPEG_QUALITY
+from firmas import parse_signature, draw_signature
+import blobs
+
+# Subir cuando cambie el layout: invalida los PDFs ya guardados (report_cache_key)
+RENDERER_VERSION = "1"
+# "canvas": todo el reporte con canvas. "overlay": valores sobre las hojas
+# base de formatos/ cuando el reporte cabe en ellas (ver pdf_overlay.py).
+RENDER_MODE = os.environ.get("PDF_RENDER_MODE", "canvas")
+
+# PDFs más grandes que esto se pasan de memoria a un archivo temporal
+PDF_SPOOL_MAX = int(os.environ.get("PDF_SPOOL_MAX", str(1024 * 1024)))
+
+# Recuadro de cada foto de evidencia: dos por renglón en el ancho útil (17.6cm)
+PHOTO_W = (17.6*cm - 0.9*cm) / 2.0
+PHOTO_H = PHOTO_W * 0.70
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+LOGO_PATH = os.path.join(APP_ROOT, "static", "img", "logo_inair.png")
+
+SPM_ROWS = [("CARGA dBm","carga_dbm"),("CARGA dBc","carga_dbc"),("CARGA dBi","carga_dbi"),
+            ("DESCARGA dbm","descarga_dbm"),("DESCARGA dBc","descarga_dbc"),("DESCARGA dBi","descarga_dbi")]
+SPM_COLS = ["mbrg","bg","lpmi_mri","lpm2_mr2","hpm1","hpm2","hpf1","hpf2","lpf1","lpf2"]
+
+# ===== Helpers para unidades y tipos de equipo =====
+def _is_oilfree(tipo_equipo: str) -> bool:
+    """True si el tipo de equipo contiene 'libre de aceite'."""
+    return "libre de aceite" in (tipo_equipo or "").lower()
+
+def _is_secador(tipo_equipo: str) -> bool:
+    """True si el tipo de equipo es un secador."""
+    return "secador" in (tipo_equipo or "").lower()
+
+def _is_bitacora(tipo_servicio: str) -> bool:
+    """True si el tipo de servicio es Bitácora (con o sin acento)."""
+    return (tipo_servicio or "").lower() in ("bitácora", "bitacora")
+
+# ------------------ util texto/medidas ------------------
+def _text_or_na(v):
+    v = (v or "").strip()
+    return v if v else "N/A"
+
+def _join_val_unit(value, unit):
+    """Join a value with its unit. Returns 'N/A' if value is empty."""
+    value = (value or "").strip()
+    unit = (unit or "").strip()
+    if not value or value == "N/A":
+        return "N/A"
+    if unit:
+        return f"{value} {unit}"
+    return value
+
+def _has_value(v):
+    return bool(v and v.strip() and v.strip() != "N/A")
+
+def _decode_data_url(data):
+    """
+    Bytes de un data URL, de un base64 'pelón' o de una referencia al almacén
+    de blobs ("blob:<sha256>"). None si no se puede decodificar.
+    """
+    if not data:
+        return None
+    if blobs.is_ref(data):
+        return blobs.read_blob(blobs.ref_hash(data))
+    if "," in data:
+        data = data.split(",", 1)[1]
+    try:
+        return base64.b64decode(data)
+    except Exception:
+        return None
+
+# Anchos por glifo (en milésimas de punto) y líneas ya envueltas, por proceso
+_glyph_units = {}
+WRAP_CACHE_SIZE = 2048
+
+def _glyph_width(ch, font):
+    key = (font, ch)
+    units = _glyph_units.get(key)
+    if units is None:
+        units = _glyph_units[key] = round(stringWidth(ch, font, 1000), 3)
+    return units
+
+def _text_units(text, font):
+    return sum(_glyph_width(ch, font) for ch in text)
+
+@lru_cache(maxsize=WRAP_CACHE_SIZE)
+def _wrap_cached(text, max_w, font, size):
+    # Mismo resultado que medir cada candidato con stringWidth, pero sumando
+    # anchos acumulados: cada glifo se mide una sola vez.
+    limit = max_w * 1000.0 / size
+    space = _glyph_width(" ", font)
+    lines, line, line_u = [], "", 0
+    for word in text.split(" "):
+        word_u = _text_units(word, font)
+        if line:
+            cand, cand_u = line + " " + word, line_u + space + word_u
+        else:
+            cand, cand_u = word, word_u
+        stripped = cand.strip()
+        if stripped != cand:
+            cand, cand_u = stripped, _text_units(stripped, font)
+        if cand_u <= limit:
+            line, line_u = cand, cand_u
+        else:
+            if line: lines.append(line); line = ""
+            buf, buf_u = "", 0
+            for ch in word:
+                ch_u = _glyph_width(ch, font)
+                if buf_u + ch_u <= limit:
+                    buf += ch; buf_u += ch_u
+                else:
+                    lines.append(buf); buf, buf_u = ch, ch_u
+            line, line_u = buf, buf_u
+    if line: lines.append(line)
+    return tuple(lines)
+
+def _wrap_text_force(text, max_w, font="Helvetica", size=9):
+    if not text: return [""] if text == "" else []
+    return list(_wrap_cached(text, max_w, font, size))
+
+def _ellipsize(text, max_w, font="Helvetica", size=9):
+    """Recorta con '…' al prefijo más largo que quepa en max_w (mínimo 2 caracteres)."""
+    s = (text or "N/A").strip() or "N/A"
+    limit = max_w * 1000.0 / size
+    cum = [0]
+    for ch in s:
+        cum.append(cum[-1] + _glyph_width(ch, font))
+    if cum[-1] <= limit or len(s) <= 3:
+        return s
+    dots = _glyph_width("…", font)
+    n = len(s) - 2
+    while n > 2 and cum[n] + dots > limit:
+        n -= 1
+    return s[:n] + "…"
+
+# ------------------ parseo del formulario ------------------
+def parse_report(form, files=None):
+    """
+    Arma el dict de reporte a partir de un form (cualquier objeto con .get:
+    request.form o el form_data de un borrador). `files` es opcional
+    (request.files); un archivo subido tiene prioridad sobre foto#_data.
+    """
+    files = files or {}
+    get = lambda k, d="": form.get(k, d)
+
+    tipo_servicio = _text_or_na(get("tipo_servicio"))
+    desc_servicio = _text_or_na(get("descripcion_servicio"))
+    ts = (tipo_servicio or "").lower()
+    # Si el tipo es Bitácora, aseguramos la descripción
+    if _is_bitacora(ts):
+        desc_servicio = "Bitácora"
+
+    tipo_equipo = _text_or_na(get("tipo_equipo"))
+    marca_sel = get("marca") or ""
+    # Acepta "Otros" en cualquier capitalización
+    if marca_sel.strip().lower() == "otros":
+        marca = _text_or_na(get("otra_marca"))
+    else:
+        marca = _text_or_na(marca_sel)
+    if marca and marca != "N/A":
+        marca = marca.title()
+
+    # Potencia: HP normal / CFM para secador
+    potencia_num = (get("potencia", "") or "").strip()
+    if potencia_num:
+        potencia = f"{potencia_num} CFM" if _is_secador(tipo_equipo) else f"{potencia_num} HP"
+    else:
+        potencia = "N/A"
+
+    # fotos: archivo subido o base64 auto-guardado (foto#_data / foto#_existing)
+    fotos = []
+    for i in range(1, 5):
+        desc = _text_or_na(get(f"foto{i}_desc"))
+        ffile = files.get(f"foto{i}")
+        data = None
+        if ffile and ffile.filename:
+            data = ffile.read()
+        else:
+            data = _decode_data_url(get(f"foto{i}_data") or get(f"foto{i}_existing"))
+        if data:
+            fotos.append({"slot": i, "data": data, "desc": desc})
+
+    # actividades (compresor estándar)
+    analisis_ruido = get("act_analisis_ruido") == "1" or bool(get("act_analisis_ruido"))
+    actividades = []
+    for idx, nombre in enumerate(ACTIVIDADES_SENTENCE, start=1):
+        # Check if checkbox is marked: value should be "1" or "on"
+        val = get(f"act_{idx}")
+        marcado = val == "1" or val == "on"
+        actividades.append((nombre, "Realizado" if marcado else "N/A"))
+    actividades.append(("Análisis de ruidos en rodamientos (R30)", "Realizado" if analisis_ruido else "N/A"))
+
+    # ruido R30/SPM
+    ruido_tipo = _text_or_na(get("ruido_tipo")) if analisis_ruido else "N/A"
+    spm = {}
+    if analisis_ruido and ruido_tipo == "SPM":
+        for _, rk in SPM_ROWS:
+            for ck in SPM_COLS:
+                spm[f"{rk}_{ck}"] = _text_or_na(get(f"{rk}_{ck}"))
+
+    # Bandera: ¿estamos en Preventivo + Secador?
+    es_secador_preventivo = (_is_secador(tipo_equipo) and ts == "preventivo")
+
+    # Lecturas: cada tabla es (titulo, labels, valores)
+    lecturas = []
+    if es_secador_preventivo:
+        sec_vals = [_join_val_unit(get(f"sec_{i}", ""), get(f"sec_{i}_unit", "")) for i in range(1, 7+1)]
+        sec_vals.append(_text_or_na(get("sec_prefiltro")))
+        sec_vals.append(_text_or_na(get("sec_posfiltro")))
+        lecturas.append(("Lecturas del equipo (Secador)", SEC_LABELS, sec_vals))
+    else:
+        dg_vals = [_join_val_unit(get(f"dg_{i+1}", ""), get(f"dg_{i+1}_unit", "")) for i in range(len(DG_LABELS))]
+        lecturas.append(("Lecturas del equipo", DG_LABELS, dg_vals))
+        if _is_oilfree(tipo_equipo):
+            of_vals = [_join_val_unit(get(f"of_{i+1}", ""), get(f"of_{i+1}_unit", "")) for i in range(len(OF_LABELS))]
+            lecturas.append(("Compresor (oil free)", OF_LABELS, of_vals))
+
+    # Datos eléctricos: trifásicos (3 valores) e individuales, ya con unidad
+    e3_rows, e1_rows = (SEC_E3, SEC_E1) if es_secador_preventivo else (E3, E1)
+    electricos_3f = []
+    for titulo, key in e3_rows:
+        fases = ("l12", "l23", "l31") if key in ("v_carga", "v_descarga") else ("l1", "l2", "l3")
+        units = [get(f"{key}_unit", ""), get(f"{key}_unit_l2", ""), get(f"{key}_unit_l3", "")]
+        vals = [_join_val_unit(_text_or_na(get(f"{key}_{ph}")), u) for ph, u in zip(fases, units)]
+        electricos_3f.append((titulo, vals))
+    electricos_1f = [(titulo, _join_val_unit(_text_or_na(get(key)), get(f"{key}_unit", "")))
+                     for titulo, key in e1_rows]
+
+    correctivo = [
+        ("Diagnóstico del problema", _text_or_na(get("diag_problema"))),
+        ("Causa raíz", _text_or_na(get("causa_raiz"))),
+        ("Actividades realizadas", _text_or_na(get("actividades_realizadas"))),
+        ("Refacciones utilizadas", _text_or_na(get("refacciones"))),
+        ("Condiciones en que se encontró el equipo", _text_or_na(get("cond_encontro"))),
+        ("Condiciones en que se entrega el equipo", _text_or_na(get("cond_entrega"))),
+    ]
+
+    return {
+        "folio": get("folio"),
+        "fecha": _text_or_na(get("fecha")),
+        "tecnico": _text_or_na(get("tecnico")),
+        "localidad": _text_or_na(get("localidad")),
+        "tipo_servicio": tipo_servicio,
+        "descripcion_servicio": desc_servicio,
+        "cliente": _text_or_na(get("cliente")),
+        "contacto": _text_or_na(get("contacto")),
+        "direccion": _text_or_na(get("direccion")),
+        "telefono": _text_or_na(get("telefono")),
+        "email": _text_or_na(get("email")),
+        "tipo_equipo": tipo_equipo,
+        "modelo": _text_or_na(get("modelo")),
+        "serie": _text_or_na(get("serie")),
+        "marca": marca,
+        "potencia": potencia,
+        "actividades": actividades,
+        "act_otras": _text_or_na(get("act_otras")),
+        "analisis_ruido": analisis_ruido,
+        "ruido_tipo": ruido_tipo,
+        "ruido_resultado": _text_or_na(get("ruido_resultado")) if analisis_ruido else "N/A",
+        "ruido_observaciones": _text_or_na(get("ruido_observaciones")) if analisis_ruido else "N/A",
+        "spm": spm,
+        "lecturas": lecturas,
+        "electricos_3f": electricos_3f,
+        "electricos_1f": electricos_1f,
+        "correctivo": correctivo,
+        "observaciones": _text_or_na(get("observaciones")),
+        "fotos": fotos,
+        "firma_tecnico_nombre": _text_or_na(get("firma_tecnico_nombre")),
+        "firma_cliente_nombre": _text_or_na(get("firma_cliente_nombre")),
+        "firma_tecnico": _decode_data_url(get("firma_tecnico_data")),
+        "firma_cliente": _decode_data_url(get("firma_cliente_data")),
+    }
+
+def report_cache_key(report):
+    """
+    Hash de las entradas normalizadas del reporte (fotos y firmas por su
+    sha256) + versión del renderer y ajustes de imagen. Mismo key, mismo PDF.
+    """
+    def norm(v):
+        if isinstance(v, bytes):
+            return "sha256:" + content_hash(v)
+        if isinstance(v, dict):
+            return {k: norm(x) for k, x in v.items()}
+        if isinstance(v, (list, tuple)):
+            return [norm(x) for x in v]
+        return v
+    payload = json.dumps({"renderer": RENDERER_VERSION, "mode": RENDER_MODE, "images": [PRINT_DPI, JPEG_QUALITY],
+                          "report": norm(report)}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# ------------------ dibujo piezas comunes ------------------
+PAGE_FURNITURE_FORM = "inair_page_furniture"
+FOOTER_BASE_Y = 1.35*cm
+FOOTER_RECT_H = 1.9*cm
+FOOTER_COLS = [
+    ("INGENIERIA EN AIRE SA DE CV        RFC: IAI1605258G6",
+     ["Avenida Alfonso Vidal y Planas #445, Interior S/N, Colonia Nueva Tijuana,",
+      "Tijuana, Baja California, México, CP: 22435, Lada 664 Tel(s) 250-0022"]),
+    ("INGENIERIA EN AIRE SA DE CV        RFC: IAI1605258G6",
+     ["Avenida del Carmen #3863, Fracc. Residencias, Mexicali, Baja California, México,",
+      "CP: 21280, Lada 686 Tel(s) 962-9932"]),
+]
+
+_furniture_cache = {}
+
+def _page_furniture():
+    """Logo ya decodificado y líneas del pie ya envueltas; se calculan una vez por proceso."""
+    if not _furniture_cache:
+        logo = None
+        try:
+            if os.path.exists(LOGO_PATH):
+                logo = ImageReader(LOGO_PATH)
+        except Exception:
+            pass
+        col_w = 8.8*cm; gap = 0.4*cm
+        maxw = col_w - 0.2*cm
+        cols = []
+        for k, (title, lines) in enumerate(FOOTER_COLS):
+            pieces = [p for ln in lines for p in _wrap_text_force(ln, maxw, "Helvetica", 7.6)]
+            cols.append((1.7*cm + k*(col_w + gap), title, pieces))
+        _furniture_cache.update(logo=logo, cols=cols)
+    return _furniture_cache
+
+def _build_page_furniture_form(c):
+    """Partes fijas de cada página (logo, título, separador y pie) como form XObject."""
+    furniture = _page_furniture()
+    c.beginForm(PAGE_FURNITURE_FORM)
+    if furniture["logo"] is not None:
+        try:
+            c.drawImage(furniture["logo"], 1.5*cm, 27.6*cm, width=4.2*cm, height=1.6*cm,
+                        preserveAspectRatio=True, anchor='sw')
+        except Exception:
+            pass
+    c.setFont("Helvetica-Bold", 14); c.drawString(7.5*cm, 28.1*cm, "REPORTE TÉCNICO")
+    c.setFont("Helvetica", 9)
+    c.drawRightString(16.5*cm, 28.2*cm, "Folio:")
+    c.setStrokeColorRGB(0.82,0.82,0.82); c.line(1.5*cm, 26.9*cm, 19.5*cm, 26.9*cm)
+
+    # Pie con fondo suave
+    base_y = FOOTER_BASE_Y
+    rect_h = FOOTER_RECT_H
+    c.setFillColorRGB(0.95, 0.96, 0.99)
+    c.roundRect(1.5*cm, base_y-0.2*cm, 18.0*cm, rect_h, 6, fill=1, stroke=0)
+    c.setStrokeColorRGB(0.75,0.75,0.8); c.roundRect(1.5*cm, base_y-0.2*cm, 18.0*cm, rect_h, 6, fill=0, stroke=1)
+    c.setFillColorRGB(0,0,0)
+    for x, title, pieces in furniture["cols"]:
+        c.setFont("Helvetica-Bold", 8)
+        c.drawString(x, base_y + rect_h - 0.55*cm, title)
+        c.setFont("Helvetica", 7.6)
+        yy = base_y + rect_h - 1.0*cm
+        for piece in pieces:
+            c.drawString(x, yy, piece); yy -= 0.34*cm
+    c.endForm()
+
+def _draw_header_and_footer(c, folio, fecha, tecnico, localidad):
+    # Lo fijo se define una vez por documento y se estampa en cada página
+    if not c.hasForm(PAGE_FURNITURE_FORM):
+        _build_page_furniture_form(c)
+    c.doForm(PAGE_FURNITURE_FORM)
+
+    # Solo folio/fecha/técnico/localidad cambian por página
+    c.setFillColorRGB(0.82,0,0); c.setFont("Helvetica-Bold", 10)
+    c.drawRightString(19.0*cm, 28.2*cm, folio)
+    c.setFillColorRGB(0,0,0); c.setFont("Helvetica", 9)
+    c.drawRightString(19.0*cm, 27.7*cm, f"Fecha: {fecha}")
+    c.drawRightString(19.0*cm, 27.2*cm, f"Técnico: {tecnico}")
+    c.drawString(1.5*cm, 27.2*cm, f"Localidad: {localidad}")
+    c.setStrokeColorRGB(0,0,0)
+
+def _draw_section(c, title, y, box_h):
+    c.setStrokeColorRGB(0.7,0.7,0.7); c.setLineWidth(1)
+    c.roundRect(1.5*cm, y-box_h, 18.0*cm, box_h, 6, stroke=1, fill=0)
+    c.setFillColorRGB(0.95,0.95,0.98); c.rect(1.5*cm, y-18, 18.0*cm, 18, fill=1, stroke=0)
+    c.setFillColorRGB(0,0,0); c.setFont("Helvetica-Bold", 10); c.drawString(1.7*cm, y-13, title)
+    return y-22
+
+def _row_box(total_w, cols, line_h, inner_x):
+    """
+    Mide un renglón de columnas "Etiqueta: valor" (cada valor envuelto a su
+    ancho). Regresa (alto, draw) con draw(c, y) dibujando el renglón en y.
+    """
+    widths = [total_w * col["ratio"] for col in cols]
+    for w, col in zip(widths, cols):
+        lab = col["label"] + ": "
+        lab_w = stringWidth(lab, "Helvetica-Bold", 9)
+        avail = max(10, w - 8 - lab_w)
+        parts = _wrap_text_force(col["value"], avail, "Helvetica", 9)
+        col["_parts"], col["_lab_w"] = parts, lab_w
+    max_lines = max(len(col["_parts"]) for col in cols)
+    rect_h = max_lines*line_h + 0.40*cm
+
+    def draw(c, y):
+        c.setStrokeColorRGB(0.85,0.85,0.85)
+        c.rect(inner_x-0.3*cm, y-rect_h+0.2*cm, total_w, rect_h, fill=0, stroke=1)
+        c.setStrokeColorRGB(0,0,0)
+        x = inner_x
+        for w, col in zip(widths, cols):
+            c.setFont("Helvetica-Bold", 9); c.drawString(x, y-0.3*cm, col["label"] + ": ")
+            c.setFont("Helvetica", 9)
+            yy = y-0.3*cm
+            for i, ln in enumerate(col["_parts"]):
+                if i == 0: c.drawString(x + col["_lab_w"], yy, ln)
+                else:      c.drawString(x, yy - i*line_h, ln)
+            x += w
+    return rect_h, draw
+
+def _text_rows(lines, x, line_h, font="Helvetica", size=9):
+    """Un renglón (alto, draw) por línea ya envuelta; permite partir el texto entre páginas."""
+    def row(ln):
+        def draw(c, y):
+            c.setFont(font, size); c.drawString(x, y - 0.38*cm, ln)
+        return line_h, draw
+    return [row(ln) for ln in lines]
+
+# ------------------ layout en dos pasadas ------------------
+# Cada sección se arma como renglones ya medidos [(alto, draw(c, y_top))].
+# _plan_pages reparte los renglones en páginas (sin dibujar nada) y
+# _draw_pages dibuja cada caja una sola vez, con su alto final.
+PAGE_TOP = A4[1] - 3.2*cm
+PAGE_BOTTOM = FOOTER_BASE_Y - 0.2*cm + FOOTER_RECT_H + 0.1*cm   # arriba del pie
+SECTION_HEAD = 22          # franja del título; ver _draw_section
+SECTION_PAD = 0.2*cm       # aire bajo el último renglón de la caja
+SECTION_GAP = 0.2*cm       # separación entre cajas
+
+def _section(title, rows, head=(), pad_top=0, keep=2):
+    """
+    rows: renglones de la sección; head: renglones que se repiten en cada
+    página (encabezados de tabla). keep: renglones mínimos que acompañan al
+    título y que pasan a la continuación (sin huérfanos ni viudas).
+    """
+    return {"title": title, "rows": list(rows), "head": list(head), "pad_top": pad_top, "keep": keep}
+
+def _plan_pages(sections):
+    """Primera pasada: [[(sección, i, j, continuación, y, alto_caja)], ...] por página."""
+    pages = [[]]
+    y = PAGE_TOP
+    for s in sections:
+        rows, keep = s["rows"], s["keep"]
+        head_h = SECTION_HEAD + s["pad_top"] + sum(h for h, _ in s["head"])
+        i, cont = 0, False
+        while True:
+            avail = y - PAGE_BOTTOM - head_h - SECTION_PAD
+            n, used = 0, 0
+            while i + n < len(rows) and used + rows[i+n][0] <= avail:
+                used += rows[i+n][0]; n += 1
+            left = len(rows) - i
+            if n < left and left - n < keep:
+                # no dejar menos de `keep` renglones para la siguiente página
+                while n > 0 and left - n < keep:
+                    n -= 1; used -= rows[i+n][0]
+            if y < PAGE_TOP and (n < min(keep, left) or (not left and avail < 0)):
+                pages.append([]); y = PAGE_TOP
+                continue
+            if not n and left:
+                n, used = 1, rows[i][0]  # renglón más alto que la página
+            box_h = head_h + used + SECTION_PAD
+            pages[-1].append((s, i, i + n, cont, y, box_h))
+            y -= box_h + SECTION_GAP
+            i += n
+            if i >= len(rows):
+                break
+            pages.append([]); y = PAGE_TOP; cont = True
+    return pages
+
+def _draw_pages(c, pages, folio, fecha, tecnico, localidad):
+    """Segunda pasada: dibuja el plan de _plan_pages."""
+    for p, fragments in enumerate(pages):
+        if p:
+            c.showPage()
+        _draw_header_and_footer(c, folio, fecha, tecnico, localidad)
+        for s, i, j, cont, y, box_h in fragments:
+            title = s["title"] + (" (continuación)" if cont else "")
+            yy = _draw_section(c, title, y, box_h) - s["pad_top"]
+            for h, draw in s["head"] + s["rows"][i:j]:
+                draw(c, yy)
+                yy -= h
+
+def _image_reader(data):
+    """ImageReader desde bytes; None si la imagen no se puede abrir."""
+    if not data:
+        return None
+    try:
+        return ImageReader(io.BytesIO(data))
+    except Exception:
+        return None
+
+def _signature_reader(data):
+    """Firma sobre fondo blanco (los canvas del navegador vienen con alpha)."""
+    if not data:
+        return None
+    try:
+        img = Image.open(io.BytesIO(data)).convert("RGBA")
+        bg = Image.new("RGBA", img.size, (255,255,255,255))
+        bg.alpha_composite(img)
+        return ImageReader(bg.convert("RGB"))
+    except Exception:
+        return _image_reader(data)
+
+# ------------------ generación PDF ------------------
+def spool_report_pdf(report):
+    """
+    Renderiza a un SpooledTemporaryFile (en memoria hasta PDF_SPOOL_MAX, luego
+    en disco) posicionado al inicio. Quien lo recibe lo cierra.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX)
+    try:
+        render_report_pdf(report, out)
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+def render_report_pdf(report, out=None):
+    """
+    Dibuja el reporte (dict de parse_report). Sin `out` devuelve los bytes del
+    PDF; con `out` (archivo binario) escribe el PDF ahí y devuelve `out`.
+    """
+    if out is None:
+        buf = io.BytesIO()
+        render_report_pdf(report, buf)
+        return buf.getvalue()
+
+    if RENDER_MODE == "overlay":
+        from pdf_overlay import render_overlay_pdf  # pdf_overlay importa este módulo
+        if render_overlay_pdf(report, out) is not None:
+            return out
+
+    folio = report["folio"]; fecha = report["fecha"]
+    tecnico = report["tecnico"]; localidad = report["localidad"]
+    tipo_servicio = report["tipo_servicio"]
+    ts = (tipo_servicio or "").lower()
+
+    inner_x = 1.8*cm
+    inner_w = 17.6*cm
+    line_h = 0.52*cm
+    sections = []
+
+    # DATOS DEL CLIENTE
+    rows = [
+        _row_box(inner_w, [{"label":"Cliente","value":report["cliente"],"ratio":1.0}], line_h, inner_x),
+        _row_box(inner_w, [
+            {"label":"Contacto","value":report["contacto"],"ratio":0.45},
+            {"label":"Teléfono","value":report["telefono"],"ratio":0.22},
+            {"label":"Email","value":report["email"],"ratio":0.33},
+        ], line_h, inner_x),
+        _row_box(inner_w, [{"label":"Dirección","value":report["direccion"],"ratio":1.0}], line_h, inner_x),
+    ]
+    sections.append(_section("Datos del cliente", rows, keep=len(rows)))
+
+    # SERVICIO
+    rows = [_row_box(inner_w, [{"label":"Tipo","value":tipo_servicio,"ratio":0.30},
+                               {"label":"Descripción","value":report["descripcion_servicio"],"ratio":0.70}],
+                     line_h, inner_x)]
+    sections.append(_section("Servicio", rows, keep=1))
+
+    # EQUIPO
+    rows = [
+        _row_box(inner_w, [{"label":"Tipo","value":report["tipo_equipo"],"ratio":1.0}], line_h, inner_x),
+        _row_box(inner_w, [
+            {"label":"Modelo","value":report["modelo"],"ratio":0.25},
+            {"label":"Serie","value":report["serie"],"ratio":0.25},
+            {"label":"Marca","value":report["marca"],"ratio":0.25},
+            {"label":"Potencia","value":report["potencia"],"ratio":0.25},
+        ], line_h, inner_x),
+    ]
+    sections.append(_section("Datos del equipo", rows, keep=len(rows)))
+
+    # ===== Flujo por tipo de servicio =====
+    if ts == "preventivo":
+        # Filter out activities where estado is "N/A" (not performed)
+        filtered_actividades = [(act, est) for act, est in report["actividades"] if _has_value(est)]
+        act_otras = report["act_otras"]
+
+        if filtered_actividades:
+            acts = filtered_actividades[:]
+            n = len(acts); left_rows = math.ceil(n/2)
+            row_h = 0.52*cm; gutter = 0.6*cm; col_w_act = 5.9*cm; col_w_estado = 2.0*cm
+            left_x = inner_x; right_x = left_x + (col_w_act + col_w_estado) + gutter
+
+            def act_head(c, y):
+                c.setFont("Helvetica-Bold", 8.4)
+                for base_x in (left_x, right_x):
+                    c.rect(base_x, y-row_h, col_w_act, row_h, fill=0, stroke=1)
+                    c.rect(base_x+col_w_act, y-row_h, col_w_estado, row_h, fill=0, stroke=1)
+                    c.drawString(base_x+3, y-row_h+3, "Actividad")
+                    c.drawString(base_x+col_w_act+3, y-row_h+3, "Estado")
+
+            def act_row(pair):
+                def draw(c, y):
+                    c.setFont("Helvetica", 7.8)
+                    for base_x, item in zip((left_x, right_x), pair):
+                        if item is None:
+                            continue
+                        act, est = item
+                        c.rect(base_x, y-row_h, col_w_act, row_h, fill=0, stroke=1)
+                        c.rect(base_x+col_w_act, y-row_h, col_w_estado, row_h, fill=0, stroke=1)
+                        c.drawString(base_x+3, y-row_h+3, _ellipsize(act, col_w_act - 6, "Helvetica", 7.8))
+                        c.drawString(base_x+col_w_act+3, y-row_h+3, est)
+                return row_h, draw
+
+            left, right = acts[:left_rows], acts[left_rows:]
+            rows = [act_row((left[k], right[k] if k < len(right) else None)) for k in range(left_rows)]
+
+            otras_text = "" if act_otras == "N/A" else act_otras
+            if otras_text:
+                lab = "OTRAS ACTIVIDADES: "; labw = stringWidth(lab, "Helvetica-Bold", 9)
+                otras_lines = _wrap_text_force(otras_text, inner_w-0.6*cm-labw-6, "Helvetica", 9)
+                otras_h = len(otras_lines)*line_h + 0.8*cm
+
+                def draw_otras(c, y):
+                    y_after = y - 0.3*cm
+                    c.setStrokeColorRGB(0.85,0.85,0.85)
+                    c.rect(inner_x-0.3*cm, y_after-otras_h+0.2*cm, inner_w, otras_h, fill=0, stroke=1)
+                    c.setStrokeColorRGB(0,0,0)
+                    yy = y_after - 0.3*cm
+                    c.setFont("Helvetica-Bold", 9); c.drawString(inner_x, yy, lab)
+                    c.setFont("Helvetica", 9)
+                    for i, ln in enumerate(otras_lines):
+                        c.drawString(inner_x + labw + 6, yy - i*line_h, ln)
+                rows.append((otras_h + 0.1*cm, draw_otras))
+
+            sections.append(_section("Actividades de mantenimiento preventivo", rows,
+                                     head=[(row_h, act_head)]))
+
+        # análisis de ruido
+        if report["analisis_ruido"]:
+            ruido_tipo = report["ruido_tipo"]
+            if ruido_tipo == "SPM":
+                spm_vals = report["spm"]
+                headers = ["MBRG","BG","LPMI-MRI","LPM2-MR2","HPM1","HPM2","HPF1","HPF2","LPF1","LPF2"]
+                left_x2 = inner_x; colw0 = 3.4*cm; colw = 1.45*cm; rh = 0.68*cm
+
+                # Filter out rows where all values are N/A or empty
+                filtered_row_defs = [(lbl, key) for lbl, key in SPM_ROWS
+                                     if any(_has_value(spm_vals.get(f"{key}_{col}", "N/A")) for col in SPM_COLS)]
+
+                def spm_head(c, y):
+                    c.setFont("Helvetica-Bold", 8); c.setStrokeColorRGB(0.7,0.7,0.7)
+                    c.rect(left_x2, y-rh, colw0 + 10*colw, rh, fill=0, stroke=1)
+                    c.drawString(left_x2+2, y-rh+3, "ANÁLISIS DE RUIDO EN RODAMIENTOS (SPM)")
+                    x = left_x2 + colw0
+                    c.setFont("Helvetica-Bold", 7.2)
+                    for h in headers:
+                        c.rect(x, y-2*rh, colw, rh, fill=0, stroke=1); c.drawString(x+2, y-2*rh+3, h); x += colw
+
+                def spm_row(lbl, key):
+                    def draw(c, y):
+                        c.setStrokeColorRGB(0.7,0.7,0.7)
+                        c.rect(left_x2, y-rh, colw0, rh, fill=0, stroke=1)
+                        c.setFont("Helvetica-Bold", 8); c.drawString(left_x2+2, y-rh+3, lbl)
+                        x = left_x2 + colw0; c.setFont("Helvetica", 7.0)
+                        for col in SPM_COLS:
+                            val = spm_vals.get(f"{key}_{col}", "N/A")
+                            c.rect(x, y-rh, colw, rh, fill=0, stroke=1); c.drawString(x+2, y-rh+3, val[:8]); x += colw
+                        c.setStrokeColorRGB(0,0,0)
+                    return rh, draw
+
+                # Only draw table if there are rows with data
+                if filtered_row_defs:
+                    sections.append(_section("Análisis de ruido", [spm_row(l, k) for l, k in filtered_row_defs],
+                                             head=[(2*rh, spm_head)]))
+                else:
+                    sections.append(_section("Análisis de ruido", []))
+            else:
+                def ruido_row(lab, val):
+                    def draw(c, y):
+                        yy = y - 0.45*cm
+                        c.setFont("Helvetica-Bold", 9); c.drawString(inner_x, yy, lab)
+                        c.setFont("Helvetica", 9); c.drawString(inner_x + stringWidth(lab, "Helvetica-Bold", 9) + 6, yy, val)
+                    return 0.6*cm, draw
+                rows = [ruido_row(lab, val) for lab, val in (("Tipo:", ruido_tipo),
+                                                              ("Resultado:", report["ruido_resultado"]),
+                                                              ("Observaciones:", report["ruido_observaciones"]))]
+                sections.append(_section("Análisis de ruido", rows, pad_top=0.25*cm, keep=len(rows)))
+
+    elif ts in ("correctivo", "diagnóstico", "diagnostico", "revisión", "revision"):
+        for title, content in report["correctivo"]:
+            lines = _wrap_text_force(content, inner_w-0.6*cm)
+            sections.append(_section(title, _text_rows(lines, inner_x, line_h), pad_top=0.12*cm))
+
+    # Bitácora: no pintamos preventivo/correctivo
+
+    # ===== LECTURAS DEL EQUIPO =====
+    def kv_table(title, labels, values):
+        # Filter out rows where value is empty or "N/A"
+        filtered_rows = [(lab, val) for lab, val in zip(labels, values) if _has_value(val)]
+        if not filtered_rows:
+            return  # Don't draw the table if no data
+
+        row_h = 0.52*cm
+        lab_w = 10.8*cm
+        val_w = inner_w - lab_w
+
+        def kv_row(lab, val):
+            def draw(c, y):
+                c.setStrokeColorRGB(0.85,0.85,0.85)
+                c.rect(inner_x-0.3*cm, y-row_h, lab_w+val_w, row_h, fill=0, stroke=1)
+                c.setStrokeColorRGB(0,0,0)
+                c.setFont("Helvetica", 8.6)
+                c.drawString(inner_x, y-row_h+3, lab)
+                c.setFont("Helvetica-Bold", 8.6)
+                c.drawString(inner_x + lab_w, y-row_h+3, val)
+            return row_h, draw
+
+        sections.append(_section(title, [kv_row(lab, val) for lab, val in filtered_rows], pad_top=0.25*cm))
+
+    for title, labels, values in report["lecturas"]:
+        kv_table(title, labels, values)
+
+    # ===== DATOS ELÉCTRICOS =====
+    def electric(rows_3f, rows_1f):
+        row_h = 0.52*cm
+
+        # keep only rows where at least one phase has data
+        filtered_e3 = [(titulo, vals) for titulo, vals in rows_3f if any(_has_value(v) for v in vals)]
+        filtered_e1 = [(titulo, val) for titulo, val in rows_1f if _has_value(val)]
+
+        if not filtered_e3 and not filtered_e1:
+            return  # Don't draw section if no data
+
+        x0 = inner_x-0.3*cm; lab_w = 7.6*cm; cell = 3.1*cm
+
+        def head(c, y):
+            c.setFont("Helvetica-Bold", 8.7)
+            c.rect(x0, y-row_h, lab_w+3*cell, row_h, fill=0, stroke=1)
+            c.drawString(x0+2, y-row_h+3, "MEDICIÓN")
+            c.drawString(x0+lab_w+2,        y-row_h+3, "L1 / L1-2")
+            c.drawString(x0+lab_w+cell+2,   y-row_h+3, "L2 / L2-3")
+            c.drawString(x0+lab_w+2*cell+2, y-row_h+3, "L3 / L3-1")
+
+        # Trifásicos
+        def row_3f(titulo, vals):
+            def draw(c, y):
+                c.setFont("Helvetica", 8.6)
+                c.rect(x0, y-row_h, lab_w, row_h, fill=0, stroke=1)
+                c.drawString(x0+2, y-row_h+3, titulo)
+                for j, val in enumerate(vals):
+                    c.rect(x0+lab_w+j*cell, y-row_h, cell, row_h, fill=0, stroke=1)
+                    c.drawString(x0+lab_w+j*cell+2, y-row_h+3, val)
+            return row_h, draw
+
+        # Individuales
+        def row_1f(titulo, val):
+            def draw(c, y):
+                c.setFont("Helvetica", 8.6)
+                c.rect(x0, y-row_h, lab_w+3*cell, row_h, fill=0, stroke=1)
+                c.drawString(x0+2, y-row_h+3, titulo)
+                c.setFont("Helvetica-Bold", 8.6)
+                c.drawRightString(x0+lab_w+3*cell-4, y-row_h+3, val)
+            return row_h, draw
+
+        rows = [row_3f(t, v) for t, v in filtered_e3] + [row_1f(t, v) for t, v in filtered_e1]
+        sections.append(_section("Datos eléctricos", rows, head=[(row_h, head)], pad_top=0.25*cm))
+
+    electric(report["electricos_3f"], report["electricos_1f"])
+
+    # OBSERVACIONES
+    obs_lines = _wrap_text_force(report["observaciones"], inner_w-0.6*cm)
+    sections.append(_section("Observaciones y recomendaciones", _text_rows(obs_lines, inner_x, line_h),
+                             pad_top=0.17*cm))
+
+    # FOTOS: un renglón por par de fotos
+    def fotos_rows(items):
+        gutter_col = inner_w - 2*PHOTO_W
+        col_w = PHOTO_W
+        img_w = PHOTO_W
+        img_h = PHOTO_H
+        caption_h = 1.10*cm
+        row_gap = 0.6*cm
+        per_row_h = img_h + caption_h + row_gap
+
+        def draw_one(c, foto, x, ytop, num):
+            c.rect(x, ytop - img_h, img_w, img_h, stroke=1, fill=0)
+            img = _image_reader(prepare_print_image(foto["data"], img_w, img_h))
+            if img is not None:
+                try:
+                    c.drawImage(img, x, ytop - img_h, width=img_w, height=img_h,
+                                preserveAspectRatio=True, anchor='sw')
+                except Exception:
+                    pass
+            c.setFont("Helvetica", 8.2)
+            maxw = img_w - 6
+            lines = _wrap_text_force(foto["desc"] or "N/A", maxw, "Helvetica", 8.2)
+            line1 = _ellipsize(lines[0] if lines else "N/A", maxw, "Helvetica", 8.2)
+            line2 = _ellipsize(lines[1] if len(lines) > 1 else "", maxw, "Helvetica", 8.2)
+            base = ytop - img_h - 0.32*cm
+            c.drawString(x, base, f"Foto {num}: {line1}")
+            if line2:
+                c.drawString(x, base - 0.34*cm, line2)
+
+        def pair_row(k):
+            def draw(c, y):
+                for x, idx in ((inner_x, k), (inner_x + col_w + gutter_col, k + 1)):
+                    if idx < len(items):
+                        draw_one(c, items[idx], x, y, idx + 1)
+            # el último par no necesita la separación hacia el siguiente
+            return (per_row_h if k + 2 < len(items) else per_row_h - row_gap), draw
+
+        return [pair_row(k) for k in range(0, len(items), 2)]
+
+    # Si es Bitácora, limitamos a 2 fotos
+    fotos = report["fotos"]
+    if _is_bitacora(ts):
+        fotos = fotos[:2]
+    if fotos:
+        sections.append(_section("Evidencias fotográficas", fotos_rows(fotos), pad_top=0.35*cm, keep=1))
+
+    # FIRMAS
+    def firmas(c, y):
+        c.setFont("Helvetica", 9)
+        for x, x_end, rol, nombre, firma in (
+                (2.0*cm, 9.2*cm, "Técnico", report["firma_tecnico_nombre"], report["firma_tecnico"]),
+                (10.2*cm, 17.2*cm, "Cliente", report["firma_cliente_nombre"], report["firma_cliente"])):
+            c.drawString(x, y-1.0*cm, f"{rol}: {nombre}")
+            c.line(x, y-2.7*cm, x_end, y-2.7*cm)
+            sig = parse_signature(firma)
+            if sig is not None:
+                draw_signature(c, sig, x, y-2.6*cm, 7.2*cm, 1.6*cm)
+                continue
+            img = _signature_reader(firma)
+            if img is not None:
+                try:
+                    c.drawImage(img, x, y-2.6*cm, width=7.2*cm, height=1.6*cm,
+                                preserveAspectRatio=True, anchor='sw')
+                except Exception:
+                    pass
+    sections.append(_section("Firmas", [(2.75*cm, firmas)], keep=1))
+
+    c = canvas.Canvas(out, pagesize=A4)
+    _draw_pages(c, _plan_pages(sections), folio, fecha, tecnico, localidad)
+    c.showPage(); c.save()
+    return out
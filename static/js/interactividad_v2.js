@@ -12,42 +12,128 @@ function onMarcaChange() {
    cambia USE_JPEG_FOR_DRAFT a true para guardar JPEG de ~85% calidad */
 const USE_JPEG_FOR_DRAFT = true;
 
+/* Las firmas viajan como trazos: cada trazo es una lista de puntos (px CSS
+   del canvas) simplificada con Douglas-Peucker, y la firma completa un SVG
+   mínimo (data:image/svg+xml) de unos pocos KB. El PDF la dibuja como
+   vectores (firmas.py). Una firma PNG de un borrador anterior se sigue
+   guardando como PNG si le agregan trazos. */
+const SIGNATURE_LINE_WIDTH = 2;
+const SIGNATURE_EPSILON = 0.6;   // tolerancia de la simplificación, en px CSS
+const signaturePads = {};        // por id del hidden: { load(value) }
+
+function simplifyStroke(points, epsilon) {
+  if (points.length < 3) return points.slice();
+  const keep = new Array(points.length).fill(false);
+  keep[0] = keep[points.length - 1] = true;
+  const stack = [[0, points.length - 1]];
+  while (stack.length) {
+    const [first, last] = stack.pop();
+    const a = points[first], b = points[last];
+    const dx = b.x - a.x, dy = b.y - a.y;
+    const len = Math.hypot(dx, dy);
+    let maxDist = 0, index = -1;
+    for (let i = first + 1; i < last; i++) {
+      const p = points[i];
+      const dist = len ? Math.abs(dy * p.x - dx * p.y + b.x * a.y - b.y * a.x) / len
+                       : Math.hypot(p.x - a.x, p.y - a.y);
+      if (dist > maxDist) { maxDist = dist; index = i; }
+    }
+    if (maxDist > epsilon) {
+      keep[index] = true;
+      stack.push([first, index], [index, last]);
+    }
+  }
+  return points.filter((_, i) => keep[i]);
+}
+
+function signatureToDataUrl(strokes, w, h) {
+  const n = v => +v.toFixed(1);
+  const d = strokes.map(s => {
+    const pts = s.length === 1 ? [s[0], s[0]] : s;   // un punto suelto también se dibuja
+    return pts.map((p, i) => `${i ? "L" : "M"}${n(p.x)} ${n(p.y)}`).join("");
+  }).join("");
+  const svg = `<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 ${n(w)} ${n(h)}" width="${n(w)}" height="${n(h)}">` +
+    `<path d="${d}" fill="none" stroke="#000" stroke-width="${SIGNATURE_LINE_WIDTH}" ` +
+    `stroke-linecap="round" stroke-linejoin="round"/></svg>`;
+  return "data:image/svg+xml;base64," + btoa(svg);
+}
+
+function signatureFromDataUrl(value) {
+  // { w, h, strokes } de una firma guardada por signatureToDataUrl; null si es otra cosa
+  if (!value || !value.startsWith("data:image/svg+xml;base64,")) return null;
+  let svg;
+  try { svg = atob(value.split(",", 2)[1]); } catch (_) { return null; }
+  const box = svg.match(/viewBox="0 0 ([\d.]+) ([\d.]+)"/);
+  const path = svg.match(/\sd="([^"]*)"/);
+  if (!box || !path) return null;
+  const strokes = [];
+  for (const [, cmd, x, y] of path[1].matchAll(/([ML])\s*(-?[\d.]+)[\s,]+(-?[\d.]+)/g)) {
+    if (cmd === "M" || !strokes.length) strokes.push([]);
+    strokes[strokes.length - 1].push({ x: +x, y: +y });
+  }
+  return { w: +box[1], h: +box[2], strokes };
+}
+
 function enableSignaturePadHDPI(canvasId, clearBtnId, hiddenInputId) {
   const canvas = document.getElementById(canvasId);
   const clearBtn = document.getElementById(clearBtnId);
   const hidden = document.getElementById(hiddenInputId);
   if (!canvas) return;
   const ctx = canvas.getContext("2d");
+  let strokes = [];   // trazos de la firma, en px CSS
+  let raster = null;  // firma PNG cargada de un borrador anterior
 
   function paintWhiteBG() {
     const rect = canvas.getBoundingClientRect();
     ctx.fillStyle = "#fff";
     ctx.fillRect(0, 0, rect.width, rect.height);
   }
+  function redraw() {
+    paintWhiteBG();
+    if (raster) {
+      const rect = canvas.getBoundingClientRect();
+      ctx.drawImage(raster, 0, 0, rect.width, rect.height);
+    }
+    strokes.forEach(s => {
+      ctx.beginPath();
+      ctx.moveTo(s[0].x, s[0].y);
+      (s.length > 1 ? s.slice(1) : s).forEach(p => ctx.lineTo(p.x, p.y));
+      ctx.stroke();
+    });
+  }
   function resize() {
     const dpr = window.devicePixelRatio || 1;
     const rect = canvas.getBoundingClientRect();
     canvas.width = Math.round(rect.width * dpr);
     canvas.height = Math.round(rect.height * dpr);
     ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
-    ctx.lineWidth = 2;
+    ctx.lineWidth = SIGNATURE_LINE_WIDTH;
     ctx.lineCap = "round";
-    paintWhiteBG();
+    ctx.lineJoin = "round";
+    redraw();
   }
   resize(); window.addEventListener("resize", resize);
 
+  function serialize() {
+    if (raster) return canvas.toDataURL("image/png");
+    if (!strokes.length) return "";
+    const rect = canvas.getBoundingClientRect();
+    return signatureToDataUrl(strokes, rect.width, rect.height);
+  }
+
   let drawing = false;
   function pos(e) {
     const r = canvas.getBoundingClientRect(); const t = e.touches ? e.touches[0] : e;
     return { x: t.clientX - r.left, y: t.clientY - r.top };
   }
-  function start(e) { drawing = true; const p = pos(e); ctx.beginPath(); ctx.moveTo(p.x, p.y); e.preventDefault(); }
-  function move(e) { if (!drawing) return; const p = pos(e); ctx.lineTo(p.x, p.y); ctx.stroke(); e.preventDefault(); }
+  function start(e) { drawing = true; const p = pos(e); strokes.push([p]); ctx.beginPath(); ctx.moveTo(p.x, p.y); e.preventDefault(); }
+  function move(e) { if (!drawing) return; const p = pos(e); strokes[strokes.length - 1].push(p); ctx.lineTo(p.x, p.y); ctx.stroke(); e.preventDefault(); }
   function end(e) {
+    if (!drawing) return;
     drawing = false; e.preventDefault();
+    strokes[strokes.length - 1] = simplifyStroke(strokes[strokes.length - 1], SIGNATURE_EPSILON);
     if (!hidden) return;
-    // Para el *submit* al servidor guardamos PNG (fondo blanco)
-    hidden.value = canvas.toDataURL("image/png");
+    hidden.value = serialize();
   }
 
   canvas.addEventListener("mousedown", start);
@@ -60,11 +146,33 @@ function enableSignaturePadHDPI(canvasId, clearBtnId, hiddenInputId) {
   canvas.style.touchAction = "none";
 
   clearBtn?.addEventListener("click", () => {
+    strokes = []; raster = null;
     ctx.setTransform(1, 0, 0, 1, 0, 0);
     ctx.clearRect(0, 0, canvas.width, canvas.height);
     resize();
     if (hidden) hidden.value = "";
   });
+
+  // Pinta una firma guardada (trazos SVG o PNG de antes) para seguir firmando encima
+  signaturePads[hiddenInputId] = {
+    load(value) {
+      strokes = []; raster = null;
+      if (hidden) hidden.value = value || "";
+      const sig = signatureFromDataUrl(value);
+      if (sig) {
+        const rect = canvas.getBoundingClientRect();
+        const k = sig.w ? rect.width / sig.w : 1;
+        strokes = sig.strokes.map(s => s.map(p => ({ x: p.x * k, y: p.y * k })));
+        redraw();
+      } else if (value) {
+        const img = new Image();
+        img.onload = () => { raster = img; redraw(); };
+        img.src = value;
+      } else {
+        redraw();
+      }
+    }
+  };
 }
 
 /* === Descripción según tipo de servicio (incluye Bitácora) === */
@@ -411,7 +519,16 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 
   // Volcar valores guardados al form
-  function applyDraft(draft) {
+  // Foto guardada como referencia al almacén ("blob:<sha256>"): se muestra su miniatura
+  function photoPreviewSrc(i, value, thumbs) {
+    if (thumbs && thumbs[`foto${i}_data`]) return thumbs[`foto${i}_data`];
+    if (value.startsWith("blob:")) {
+      return `/api/draft_image/${encodeURIComponent(FOLIO)}/foto${i}?size=thumb&v=${value.slice(5, 21)}`;
+    }
+    return value;
+  }
+
+  function applyDraft(draft, thumbs = {}) {
     const elements = form.querySelectorAll("input, select, textarea");
 
     // First pass: temporarily enable ALL disabled elements
@@ -444,6 +561,11 @@ document.addEventListener("DOMContentLoaded", () => {
       el.disabled = true;
     });
 
+    // Firmas: pintarlas en su canvas para que los trazos nuevos se sumen a ellas
+    ["firma_tecnico_data", "firma_cliente_data"].forEach(name => {
+      if (name in draft) signaturePads[name]?.load(draft[name]);
+    });
+
     // Fourth pass: Smart UI Restoration for Composite Fields (Tipo, Modelo, Serie)
     // We need to decide whether to show the Select or the Input based on the loaded value
 
@@ -564,7 +686,7 @@ document.addEventListener("DOMContentLoaded", () => {
       updatePotenciaHint?.();
     } catch (_) { }
 
-    // Restaurar fotos desde draft (Base64)
+    // Restaurar fotos desde draft (Base64 o referencia + miniatura)
     for (let i = 1; i <= 4; i++) {
       const fotoDataKey = `foto${i}_data`;
       if (draft[fotoDataKey]) {
@@ -574,7 +696,7 @@ document.addEventListener("DOMContentLoaded", () => {
         const hiddenData = document.getElementById(`foto${i}_data`);
 
         if (previewImg && previewContainer) {
-          previewImg.src = draft[fotoDataKey];
+          previewImg.src = photoPreviewSrc(i, draft[fotoDataKey], thumbs);
           previewContainer.style.display = 'block';
           if (fotoInput) fotoInput.style.display = 'none';
           console.log(`[RESTORE] Foto ${i} restaurada (${draft[fotoDataKey].substring(0, 50)}...)`);
@@ -619,34 +741,147 @@ document.addEventListener("DOMContentLoaded", () => {
     }, 2000);
   }
 
+  // Autosave al servidor por parches: solo viajan los campos que cambiaron
+  // desde la última versión que confirmó el servidor. Las fotos y firmas se
+  // suben una vez por /api/draft_images y en el parche va su referencia.
+  const IMAGE_FIELDS = ["foto1_data", "foto2_data", "foto3_data", "foto4_data",
+                        "firma_tecnico_data", "firma_cliente_data"];
+  let serverVersion = 0;     // versión del borrador en el servidor (0 = no existe)
+  let serverSnapshot = {};   // valores que el servidor ya tiene, tal como los serializa el form
+  const uploadedImages = {}; // campo -> { value, ref } de la última imagen subida
+  let serverSaving = false;
+  let serverSavePending = false;
+
+  function diffAgainstServer(data) {
+    const changes = {};
+    Object.keys(data).forEach(k => {
+      if (k.startsWith("__")) return;
+      if (data[k] !== serverSnapshot[k]) changes[k] = data[k];
+    });
+    return changes;
+  }
+
+  async function uploadImage(folio, field, dataUrl) {
+    const cached = uploadedImages[field];
+    if (cached && cached.value === dataUrl) return cached.ref;
+    const blob = await (await fetch(dataUrl)).blob();
+    let ref;
+    if (field.startsWith("foto") && window.crypto?.subtle) {
+      // Fotos: subida por pedazos reanudable; el servidor ya la deja en el folio
+      const done = await uploadResumable(folio, field.replace("_data", ""), blob);
+      ref = done.ref;
+      if (done.version === serverVersion + 1) {
+        serverVersion = done.version;
+        serverSnapshot[field] = dataUrl;
+      }
+    } else {
+      const body = new FormData();
+      body.append("image", blob, field);
+      const response = await fetch('/api/draft_images', { method: 'POST', body });
+      if (!response.ok) throw new Error(`upload ${field}: ${response.status}`);
+      ref = (await response.json()).ref;
+    }
+    uploadedImages[field] = { value: dataUrl, ref };
+    return ref;
+  }
+
+  async function sha256Hex(blob) {
+    const digest = await crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, "0")).join("");
+  }
+
+  // init -> pedazos con offset -> finalize con checksum. Si se cae la conexión se
+  // pregunta al servidor dónde va y se sigue desde ahí; volver a iniciar la misma
+  // foto (mismo folio/slot/sha256) retoma la subida abierta.
+  async function uploadResumable(folio, slot, blob) {
+    const sha256 = await sha256Hex(blob);
+    const init = await fetch('/api/uploads', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ folio, slot, size: blob.size, sha256 })
+    });
+    if (!init.ok) throw new Error(`upload ${slot}: ${init.status}`);
+    const upload = await init.json();
+    const url = `/api/uploads/${upload.upload_id}`;
+    let offset = upload.offset;
+    let failures = 0;
+
+    while (offset < blob.size) {
+      try {
+        const response = await fetch(`${url}?offset=${offset}`, {
+          method: 'PUT',
+          body: blob.slice(offset, offset + upload.chunk_size)
+        });
+        const body = await response.json();
+        if (!response.ok && response.status !== 409) throw new Error(`chunk ${slot}: ${response.status}`);
+        if (typeof body.offset !== "number") throw new Error(body.error || `chunk ${slot}`);
+        offset = body.offset;  // 409: el servidor dice desde dónde seguir
+        failures = 0;
+      } catch (e) {
+        if (++failures > 5) throw e;
+        await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+        try {
+          const status = await fetch(url);
+          if (status.ok) offset = (await status.json()).offset;
+        } catch (_) { }
+      }
+    }
+
+    const response = await fetch(`${url}/finalize`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ sha256 })
+    });
+    if (!response.ok) throw new Error(`finalize ${slot}: ${response.status}`);
+    return response.json();
+  }
+
+  async function sendPatch(folio, changes) {
+    const patch = { ...changes };
+    for (const field of IMAGE_FIELDS) {
+      // Las referencias ("blob:...") ya están en el servidor; solo se suben imágenes nuevas
+      if (patch[field]?.startsWith("data:")) patch[field] = await uploadImage(folio, field, patch[field]);
+    }
+    const response = await fetch('/api/autosave_draft', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ folio, base_version: serverVersion, changes: patch })
+    });
+    return { response, body: await response.json().catch(() => ({})) };
+  }
+
   async function saveDraftToServer(data) {
     const folio = data.folio || (window.__FOLIO__ !== "sin-folio" ? window.__FOLIO__ : null);
     if (!folio || folio === "sin-folio") return;
 
+    // Un parche a la vez: el siguiente se calcula contra la versión que confirme este
+    if (serverSaving) { serverSavePending = true; return; }
+
+    let changes = diffAgainstServer(data);
+    if (!Object.keys(changes).length) return;
+
+    serverSaving = true;
     showSaveStatus("Guardando...");
 
     try {
-      // Preparamos el payload. 
-      // Nota: api_autosave_draft espera { folio, form_data, ... }
-      // serializeForm devuelve un objeto plano con todos los campos.
-      // Lo enviamos como form_data.
-      const payload = {
-        folio: folio,
-        form_data: data,
-        // Si quisieras enviar firmas/fotos por separado, podrías extraerlas aquí.
-        // Por ahora, el backend extraerá lo que necesite de form_data si está estructurado así,
-        // o simplemente guardará el JSON completo.
-        firma_tecnico_data: data.firma_tecnico_data,
-        firma_cliente_data: data.firma_cliente_data
-      };
+      let { response, body } = await sendPatch(folio, changes);
 
-      const response = await fetch('/api/autosave_draft', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(payload)
-      });
+      if (response.status === 409 || body.error === "invalid_blob") {
+        if (body.error === "stale_version") {
+          // El servidor tiene otra versión (otra pestaña, o se guardó con el PDF): reenviamos todo sobre ella
+          serverVersion = body.version;
+          serverSnapshot = {};
+        } else {
+          // Una imagen subida ya no está en el servidor: se vuelve a subir
+          Object.keys(uploadedImages).forEach(k => delete uploadedImages[k]);
+        }
+        changes = diffAgainstServer(data);
+        ({ response, body } = await sendPatch(folio, changes));
+      }
 
       if (response.ok) {
+        serverVersion = body.version;
+        Object.assign(serverSnapshot, changes);
         showSaveStatus("Guardado en servidor");
       } else {
         console.warn("Server autosave failed", response.status);
@@ -655,6 +890,12 @@ document.addEventListener("DOMContentLoaded", () => {
     } catch (e) {
       console.error("Server autosave error:", e);
       showSaveStatus("Error de conexión", true);
+    } finally {
+      serverSaving = false;
+      if (serverSavePending) {
+        serverSavePending = false;
+        saveDraftToServer(serializeForm());
+      }
     }
   }
 
@@ -713,6 +954,10 @@ document.addEventListener("DOMContentLoaded", () => {
         if (draft.form_data) {
           const formData = draft.form_data;
 
+          // Los parches de autosave parten de lo que el servidor ya tiene
+          serverVersion = draft.version || 0;
+          serverSnapshot = { ...formData };
+
           // 1. Wait for clients list to be populated
           const waitForClients = new Promise((resolve) => {
             const check = setInterval(() => {
@@ -749,33 +994,11 @@ document.addEventListener("DOMContentLoaded", () => {
           }
 
           // 3. Now apply the rest of the draft (Equipment fields will now find their options!)
-          applyDraft(formData);
-
-          if (draft.firma_tecnico_data) {
-            const canvas = document.getElementById('firma_tecnico_canvas');
-            if (canvas) {
-              const ctx = canvas.getContext('2d');
-              const img = new Image();
-              img.onload = () => {
-                ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
-                document.getElementById('firma_tecnico_data').value = draft.firma_tecnico_data;
-              };
-              img.src = draft.firma_tecnico_data;
-            }
-          }
+          applyDraft(formData, draft.thumbnails || {});
 
-          if (draft.firma_cliente_data) {
-            const canvas = document.getElementById('firma_cliente_canvas');
-            if (canvas) {
-              const ctx = canvas.getContext('2d');
-              const img = new Image();
-              img.onload = () => {
-                ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
-                document.getElementById('firma_cliente_data').value = draft.firma_cliente_data;
-              };
-              img.src = draft.firma_cliente_data;
-            }
-          }
+          ["firma_tecnico_data", "firma_cliente_data"].forEach(name => {
+            if (draft[name]) signaturePads[name]?.load(draft[name]);
+          });
           return true;
         }
       }
@@ -0,0 +1,70 @@
+# Cada prueba corre contra su propia base SQLite, su propio almacén de blobs y
+# sus propias copias en tmp_path; nada toca inair_reportes.db, data/ ni static/.
+import os, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest
+
+import archivos
+import blobs
+import database
+import imagenes
+
+# app.py llama a init_db() al importarse: que sea sobre una base desechable
+database.DB_NAME = os.path.join(tempfile.mkdtemp(prefix="inair-tests-"), "inair_reportes.db")
+
+
+def close_db():
+    """Cierra la conexión del hilo para que la siguiente abra database.DB_NAME."""
+    conn = getattr(database._local, "conn", None)
+    if conn is not None:
+        conn.close()
+    database._local.conn = None
+
+
+@pytest.fixture
+def image_cache(tmp_path, monkeypatch):
+    """Cachés de fotos (impresión y miniaturas) en el directorio de la prueba."""
+    monkeypatch.setattr(imagenes, "PRINT_CACHE_DIR", str(tmp_path / "cache" / "print"))
+    monkeypatch.setattr(imagenes, "THUMB_CACHE_DIR", str(tmp_path / "cache" / "thumbs"))
+    imagenes._memory.clear()
+    return tmp_path
+
+
+@pytest.fixture
+def db(image_cache, tmp_path, monkeypatch):
+    """Base nueva con el esquema al día; regresa el directorio de la prueba."""
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "inair_reportes.db"))
+    monkeypatch.setattr(blobs, "BLOB_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(archivos, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(archivos, "FIRMAS_DIR", str(tmp_path / "firmas"))
+    close_db()
+    database.init_db()
+    yield tmp_path
+    # copias en segundo plano pendientes: que caigan aquí y no en static/
+    archivos._writer.submit(lambda: None).result()
+    close_db()
+
+
+def _client(role):
+    import app as app_module
+    client = app_module.app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = "admin" if role == "admin" else "fernando"
+        s["prefijo"] = "ADM" if role == "admin" else "F"
+        s["role"] = role
+    return client
+
+
+@pytest.fixture
+def client(db):
+    """Cliente de Flask con sesión de técnico."""
+    return _client("technician")
+
+
+@pytest.fixture
+def admin_client(db):
+    """Cliente de Flask con sesión de administrador."""
+    return _client("admin")
@@ -0,0 +1,210 @@
+# Copias de fotos y firmas de cada folio (archivos.py)
+import base64
+import io
+import os
+import time
+from datetime import datetime
+
+import pytest
+from PIL import Image
+
+import archivos
+import blobs
+import database
+from archivos import report_file_path
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10"><path d="M1 1L9 9"/></svg>'
+
+
+def image(fmt, mode="RGBA"):
+    out = io.BytesIO()
+    Image.new(mode, (40, 20), (0, 0, 0, 0) if mode == "RGBA" else (0, 0, 0)).save(out, format=fmt)
+    return out.getvalue()
+
+
+def report(folio="F-0001", fotos=(), firma_tecnico=None, firma_cliente=None):
+    return {"folio": folio, "fotos": [{"slot": i, "data": d} for i, d in fotos],
+            "firma_tecnico": firma_tecnico, "firma_cliente": firma_cliente}
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_report_files_are_written_from_the_bytes(db):
+    png, jpeg = image("PNG"), image("JPEG", "RGB")
+    archivos.persist_report_files(report(fotos=[(2, jpeg)], firma_tecnico=png, firma_cliente=SVG)).result()
+
+    assert read(report_file_path(archivos.UPLOAD_DIR, "F-0001", "foto2.png")) == jpeg
+    # PNG y trazos tal cual, sin pasar por PIL
+    assert read(report_file_path(archivos.FIRMAS_DIR, "F-0001", "firma_tecnico.png")) == png
+    assert read(report_file_path(archivos.FIRMAS_DIR, "F-0001", "firma_cliente.svg")) == SVG
+
+
+def test_non_png_signature_becomes_png_on_white(db):
+    data_url = "data:image/jpeg;base64," + base64.b64encode(image("JPEG", "RGB")).decode()
+    path = archivos.save_signature_png(data_url, "F-0001", "firma_cliente")
+    img = Image.open(path)
+    assert img.format == "PNG" and img.mode == "RGB"
+    assert archivos.save_signature_png("no es data url", "F-0001", "firma_cliente") is None
+
+
+def test_unchanged_copy_is_not_rewritten(db):
+    png = image("PNG")
+    archivos.save_report_files(report(fotos=[(1, png)]))
+    path = report_file_path(archivos.UPLOAD_DIR, "F-0001", "foto1.png")
+    os.utime(path, (1, 1))
+
+    archivos.save_report_files(report(fotos=[(1, png)]))
+    assert os.path.getmtime(path) == 1
+    archivos.save_report_files(report(fotos=[(1, png + b"x")]))
+    assert read(path) == png + b"x"
+
+
+def flat(base_dir, folio, name, data=b"plana"):
+    os.makedirs(base_dir, exist_ok=True)
+    path = os.path.join(base_dir, f"{folio}_{name}")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_migrate_moves_flat_copies_into_shards(db):
+    base = archivos.UPLOAD_DIR
+    for i in range(5):
+        flat(base, f"F-{i:04d}", "foto1.png", f"foto {i}".encode())
+    # ya hay una copia repartida más nueva: la plana sobra
+    flat(base, "F-0009", "foto2.png")
+    newer = report_file_path(base, "F-0009", "foto2.png")
+    os.makedirs(os.path.dirname(newer))
+    with open(newer, "wb") as f:
+        f.write(b"nueva")
+    flat(base, "otro", "archivo.txt")
+
+    assert archivos.migrate_flat_files(base, batch=2, pause=0) == (5, 1)
+    assert sorted(os.listdir(base)) == sorted({archivos._shard(f"F-{i:04d}") for i in (0, 1, 2, 3, 4, 9)}
+                                              | {"otro_archivo.txt"})
+    assert read(archivos.find_report_file(base, "F-0003", "foto1.png")) == b"foto 3"
+    assert read(newer) == b"nueva"
+
+
+def test_migrate_survives_files_moved_or_removed_meanwhile(db, monkeypatch):
+    base = archivos.UPLOAD_DIR
+    for folio in ("F-0001", "F-0002", "F-0003"):
+        flat(base, folio, "foto1.png")
+    shard_path = archivos.report_file_path
+
+    def concurrent_saves(base_dir, folio, name):
+        # entre el listado y el movimiento: un guardado (_copy_path) mueve
+        # una a su lugar y otra se borra
+        path, src = shard_path(base_dir, folio, name), os.path.join(base_dir, f"{folio}_{name}")
+        if folio == "F-0001":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(src, path)
+        elif folio == "F-0002":
+            os.remove(src)
+        return path
+
+    monkeypatch.setattr(archivos, "report_file_path", concurrent_saves)
+    assert archivos.migrate_flat_files(base, pause=0) == (1, 2)
+    monkeypatch.undo()
+    assert os.path.exists(report_file_path(base, "F-0001", "foto1.png"))
+    assert os.path.exists(report_file_path(base, "F-0003", "foto1.png"))
+    assert not any(name.endswith(".png") for name in os.listdir(base))
+
+
+def test_save_moves_unmigrated_copy_into_its_shard(db):
+    old = flat(archivos.FIRMAS_DIR, "F-0001", "firma_tecnico.svg")
+    archivos.save_signature_png(SVG, "F-0001", "firma_tecnico")
+    assert not os.path.exists(old)
+    assert archivos.find_report_file(archivos.FIRMAS_DIR, "F-0001", "firma_tecnico.svg") == \
+        report_file_path(archivos.FIRMAS_DIR, "F-0001", "firma_tecnico.svg")
+
+
+DAY = 86400
+
+
+def copy(base_dir, folio, name, days_old, data=b"copia"):
+    path = report_file_path(base_dir, folio, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    t = time.time() - days_old * DAY
+    os.utime(path, (t, t))
+    return path
+
+
+@pytest.fixture
+def orphans(db):
+    """Borrador F-0001 con foto1 y firma del técnico, reporte F-0002 y sus copias."""
+    database.save_draft_report("F-0001", {}, foto1=image("PNG"), firma_tecnico=SVG)
+    database.save_report("F-0002", "2026-05-01", "ACME", "", "", "", "", "", "Preventivo", "", "Fernando", "")
+    U, S = archivos.UPLOAD_DIR, archivos.FIRMAS_DIR
+    keep = [copy(U, "F-0001", "foto1.png", 30), copy(U, "F-0002", "foto1.png", 30),
+            copy(S, "F-0001", "firma_tecnico.svg", 30)]
+    gone = [copy(U, "F-0001", "foto2.png", 30),           # ya no está en el borrador
+            copy(U, "F-0003", "foto1.png", 30),           # folio desconocido
+            copy(S, "F-0001", "firma_tecnico.png", 40),   # hay una más nueva (.svg)
+            flat(U, "F-0001", "foto1.png")]               # plana más vieja que la repartida
+    t = time.time() - 40 * DAY
+    os.utime(gone[-1], (t, t))
+    recent = copy(U, "F-0004", "foto1.png", 0)            # huérfana, pero dentro de la gracia
+    return keep, gone, recent
+
+
+def test_find_orphan_copies(orphans):
+    keep, gone, recent = orphans
+    assert sorted(archivos.find_orphan_copies()) == sorted(gone + [recent])
+
+
+def test_find_orphan_copies_skips_copies_that_vanish(orphans, monkeypatch):
+    keep, gone, recent = orphans
+    listed = list(archivos._copies())
+    # un guardado mueve o borra una copia después del listado
+    os.remove(gone[-1])
+    monkeypatch.setattr(archivos, "_copies", lambda: iter(listed))
+    assert sorted(archivos.find_orphan_copies()) == sorted(gone[:-1] + [recent])
+
+
+def test_collect_orphans_dry_run_then_apply(orphans):
+    keep, gone, recent = orphans
+    stray = blobs.blob_path("cd" * 32)                    # archivo sin fila en draft_blobs
+    os.makedirs(os.path.dirname(stray), exist_ok=True)
+    with open(stray, "wb") as f:
+        f.write(b"x" * 10)
+    os.utime(stray, (0, 0))
+    unused = blobs.ref_hash(database.store_draft_blob(b"nunca se usa"))
+    with database.get_db() as conn:
+        conn.execute("UPDATE draft_blobs SET created_at = datetime('now', '-30 days') WHERE hash = ?", (unused,))
+
+    found = archivos.collect_orphans(grace_days=7)
+    assert sorted(what for kind, what, size in found if kind == "copia") == sorted(gone)
+    assert ("blob sin fila", stray, 10) in found
+    assert ("blob", unused, len(b"nunca se usa")) in found
+    assert all(os.path.exists(p) for p in gone + [stray])
+
+    assert sorted(archivos.collect_orphans(grace_days=7, dry_run=False)) == sorted(found)
+    assert not any(os.path.exists(p) for p in gone + [stray, blobs.blob_path(unused)])
+    assert all(os.path.exists(p) for p in keep + [recent])
+    assert archivos.collect_orphans(grace_days=7) == []
+
+
+def test_storage_usage_by_technician_and_month(db, orphans, monkeypatch):
+    monkeypatch.setattr(archivos, "DB_NAME", database.DB_NAME)
+    monkeypatch.setattr(archivos, "PDF_ARCHIVE_DIR", str(db / "archivo"))
+    keep, gone, recent = orphans
+    usage, totals = archivos.storage_usage()
+
+    month = lambda p: datetime.fromtimestamp(os.path.getmtime(p)).strftime("%Y-%m")
+    expected = {}
+    for path in keep + gone + [recent]:
+        prefix = os.path.basename(path).split("-", 1)[0]
+        row = expected.setdefault(("Fernando" if prefix == "F" else prefix, month(path)), [0, 0])
+        row[0] += 1
+        row[1] += os.path.getsize(path)
+    assert usage == expected
+
+    assert totals["static/uploads"] == sum(os.path.getsize(p) for p in keep + gone + [recent] if "uploads" in p)
+    assert totals["PDFs archivados"] == 0
+    assert totals["base de datos"] > 0 and totals["blobs de borradores"] > 0
@@ -0,0 +1,79 @@
+# Autoguardado por parches (/api/autosave_draft) y referencias a blobs del cliente
+import base64
+
+import pytest
+
+import blobs
+import database
+
+PNG = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==")
+
+
+def patch(client, changes, folio="F-0001", base_version=0):
+    return client.post("/api/autosave_draft",
+                       json={"folio": folio, "base_version": base_version, "changes": changes})
+
+
+@pytest.fixture
+def victim(tmp_path):
+    path = tmp_path / "victim.txt"
+    path.write_text("secreto")
+    return path
+
+
+def test_path_ref_is_rejected_and_never_touches_the_file(client, victim):
+    ref = "blob:" + "../" * 12 + str(victim).lstrip("/")
+    r = patch(client, {"foto1_data": ref})
+    assert r.status_code == 400
+    assert r.json["error"] == "invalid_blob"
+    assert database.get_draft_meta("F-0001") is None
+    assert client.get("/api/draft_image/F-0001/foto1").status_code == 404
+
+    # Una base ya envenenada antes del arreglo tampoco sirve ni borra el archivo
+    with database.get_db() as conn:
+        conn.execute("INSERT INTO draft_reports (folio, form_data, foto1_data, version) VALUES ('F-0002', '{}', ?, 1)",
+                     (ref,))
+    assert client.get("/api/draft_image/F-0002/foto1").status_code == 404
+    assert patch(client, {"foto1_data": ""}, folio="F-0002", base_version=1).status_code == 200
+    assert victim.read_text() == "secreto"
+
+
+@pytest.mark.parametrize("ref", [
+    "blob:" + "0" * 64,            # bien formada pero el almacén no la conoce
+    "blob:" + "A" * 64,            # mayúsculas
+    "blob:1234",
+    "blob:",
+])
+def test_unknown_or_malformed_ref_is_400(client, ref):
+    r = patch(client, {"foto1_data": ref})
+    assert r.status_code == 400
+    assert r.json["error"] == "invalid_blob"
+    assert database.get_draft_blob_hashes() == set()
+
+
+def test_existing_file_without_row_is_not_a_blob(client):
+    # blob_size tendría éxito, pero sin fila en draft_blobs no es una referencia válida
+    digest = blobs.digest_of(PNG)
+    blobs.write_blob(digest, PNG)
+    assert patch(client, {"foto1_data": blobs.make_ref(digest)}).status_code == 400
+
+
+def test_full_save_rejects_forged_ref(client, victim):
+    r = client.post("/api/autosave_draft", json={
+        "folio": "F-0001", "form_data": {"foto1_data": "blob:../../../../" + str(victim).lstrip("/")}})
+    assert r.status_code == 400
+    assert r.json["error"] == "invalid_blob"
+
+
+def test_uploaded_ref_is_accepted_and_served(client):
+    ref = client.post("/api/draft_images", json={"data": "data:image/png;base64," + base64.b64encode(PNG).decode()}).json["ref"]
+    assert blobs.is_ref(ref)
+
+    r = patch(client, {"foto1_data": ref, "cliente": "ACME"})
+    assert r.status_code == 200 and r.json["version"] == 1
+    assert client.get("/api/draft_image/F-0001/foto1").data == PNG
+
+    # versión vieja: 409 con la actual
+    r = patch(client, {"cliente": "Otro"}, base_version=0)
+    assert r.status_code == 409
+    assert r.json == {"error": "stale_version", "version": 1}
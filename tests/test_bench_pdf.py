@@ -0,0 +1,33 @@
+# Benchmark del render (bench_pdf.py): comparación contra la línea base
+import bench_pdf
+
+BASE = {"time_ms": 100.0, "pages": 2, "bytes": 1000, "peak_kb": 500.0}
+
+
+def test_compare_flags_only_what_passes_the_tolerance():
+    assert bench_pdf.compare("caso", dict(BASE), BASE) == []
+    assert bench_pdf.compare("caso", {**BASE, "time_ms": 124.0, "bytes": 1099}, BASE) == []
+
+    problems = bench_pdf.compare("caso", {**BASE, "time_ms": 130.0, "pages": 3}, BASE)
+    assert len(problems) == 2
+    assert any("pages 2 -> 3" in p for p in problems) and any("time_ms" in p for p in problems)
+
+    # --slack 2 duplica la tolerancia; sin línea base no hay nada que comparar
+    assert bench_pdf.compare("caso", {**BASE, "time_ms": 130.0}, BASE, slack=2) == []
+    assert bench_pdf.compare("caso", {**BASE, "time_ms": 1e6}, None) == []
+
+
+def test_baseline_round_trip_and_coverage(tmp_path):
+    path = tmp_path / "baseline.json"
+    bench_pdf.save_baseline({"caso": BASE}, path)
+    assert bench_pdf.load_baseline(path) == {"caso": BASE}
+    assert bench_pdf.load_baseline(tmp_path / "no-existe.json") == {}
+
+    assert set(bench_pdf.load_baseline()) == set(bench_pdf.CASES)
+
+
+def test_run_case_measures_a_render(image_cache):
+    result = bench_pdf.run_case(bench_pdf.build_form(**bench_pdf.CASES["correctivo"]), repeat=1)
+    assert set(result) == set(BASE)
+    assert result["pages"] == bench_pdf.load_baseline()["correctivo"]["pages"]
+    assert result["bytes"] > 0 and result["peak_kb"] > 0
@@ -0,0 +1,70 @@
+# Referencias al almacén de blobs (blobs.py) y su liberación en database.py
+import os
+
+import pytest
+
+import blobs
+import database
+
+DIGEST = "ab" * 32
+
+
+@pytest.mark.parametrize("value", [
+    "blob:" + DIGEST,
+])
+def test_is_ref_accepts_sha256_hex(value):
+    assert blobs.is_ref(value)
+    assert blobs.ref_hash(value) == DIGEST
+
+
+@pytest.mark.parametrize("value", [
+    "blob:../../../../tmp/victim.txt",
+    "blob:" + DIGEST.upper(),
+    "blob:" + DIGEST[:-1],
+    "blob:" + DIGEST + "0",
+    "blob:" + DIGEST + "/../x",
+    "blob:",
+    "data:image/png;base64,AAAA",
+    None,
+    b"blob:" + DIGEST.encode(),
+])
+def test_is_ref_rejects_malformed(value):
+    assert not blobs.is_ref(value)
+
+
+@pytest.mark.parametrize("digest", ["../../etc/passwd", DIGEST.upper(), "", DIGEST[:10]])
+def test_paths_reject_malformed_digest(digest):
+    with pytest.raises(ValueError):
+        blobs.blob_path(digest)
+    with pytest.raises(ValueError):
+        blobs.ref_hash("blob:" + digest)
+    with pytest.raises(ValueError):
+        blobs.read_blob(digest)
+    with pytest.raises(ValueError):
+        blobs.delete_blob(digest)
+
+
+def test_released_blob_survives_rollback(db):
+    ref = database.store_draft_blob(b"\x89PNG foto")
+    assert database.apply_draft_patch("F-0001", 0, {"foto1_data": ref}) == (True, 1)
+    path = blobs.blob_path(blobs.ref_hash(ref))
+
+    # form_data no se puede serializar: la transacción falla después de soltar la foto
+    with pytest.raises(TypeError):
+        database.apply_draft_patch("F-0001", 1, {"foto1_data": "", "x": object()})
+
+    assert os.path.exists(path)
+    assert database.get_draft_image("F-0001", "foto1_data") == ref
+    assert database.get_draft_blob_hashes() == {blobs.ref_hash(ref)}
+
+
+def test_released_blob_deleted_after_commit(db):
+    ref = database.store_draft_blob(b"\x89PNG foto")
+    database.apply_draft_patch("F-0001", 0, {"foto1_data": ref})
+    path = blobs.blob_path(blobs.ref_hash(ref))
+
+    assert database.apply_draft_patch("F-0001", 1, {"foto1_data": ""}) == (True, 2)
+
+    assert not os.path.exists(path)
+    assert os.listdir(os.path.dirname(path)) == []
+    assert database.get_draft_blob_hashes() == set()
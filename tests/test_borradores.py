@@ -0,0 +1,44 @@
+# Lecturas de borradores por columnas (get_draft_meta, get_draft_form_data, ...)
+import pytest
+
+import blobs
+import database
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def test_meta_leaves_out_form_data_images_and_pdf(db):
+    database.save_draft_report("F-0001", {"cliente": "ACME"}, foto1=PNG, pdf_preview=b"%PDF-xyz")
+    meta = database.get_draft_meta("F-0001")
+    assert set(meta) == {"folio", "status", "version", "pdf_cache_key", "pdf_size", "created_at", "updated_at"}
+    assert meta["pdf_size"] == len(b"%PDF-xyz") and meta["version"] == 1
+
+    draft = database.get_draft_by_folio("F-0001")
+    assert "pdf_preview" not in draft
+    assert blobs.is_ref(draft["foto1_data"])
+
+    assert database.get_draft_meta("F-0002") is None
+
+
+def test_form_data_and_single_image(db):
+    database.save_draft_report("F-0001", {"cliente": "ACME"}, foto2=PNG)
+    assert database.get_draft_form_data("F-0001") == {"cliente": "ACME"}
+    assert database.get_draft_form_data("F-0002") is None
+    assert blobs.load_bytes(database.get_draft_image("F-0001", "foto2_data")) == PNG
+    assert database.get_draft_image("F-0001", "foto1_data") is None
+
+    with pytest.raises(ValueError):
+        database.get_draft_image("F-0001", "form_data")
+
+    database.update_draft_form_data("F-0001", "no es json")
+    assert database.get_draft_form_data("F-0001") == {}
+
+
+def test_draft_list_by_status(db):
+    database.save_draft_report("F-0001", {"cliente": "A"})
+    database.save_draft_report("F-0002", {"cliente": "B"})
+    database.mark_draft_as_sent("F-0001")
+
+    assert [d["folio"] for d in database.get_all_drafts("sent")] == ["F-0001"]
+    assert {d["folio"] for d in database.get_all_drafts()} == {"F-0001", "F-0002"}
+    assert "foto1_data" not in database.get_all_drafts()[0]
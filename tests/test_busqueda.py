@@ -0,0 +1,75 @@
+# Búsqueda de texto del historial (reports_fts, search_reports)
+import pytest
+
+import database
+
+
+def report(folio, cliente="ACME", serie="SN1", descripcion="", tipo_servicio="Preventivo", fecha="2026-05-01"):
+    database.save_report(folio, fecha, cliente, "Compresor", "GA-37", serie, "Atlas Copco", "",
+                         tipo_servicio, descripcion, "fernando", "")
+
+
+def folios(*args, **kwargs):
+    return [r["folio"] for r in database.search_reports(*args, **kwargs)]
+
+
+def integrity_check():
+    with database.get_db() as conn:
+        conn.execute("INSERT INTO reports_fts (reports_fts) VALUES ('integrity-check')")
+
+
+def test_searches_every_indexed_column(db):
+    report("F-0012", cliente="Compresores Añejos", serie="XK9981", descripcion="Cambio de válvula de admisión")
+    report("C-0001", cliente="Otro", serie="ZZ1")
+
+    assert folios("F-0012") == ["F-0012"]
+    assert folios("xk99") == ["F-0012"]               # prefijo
+    assert folios("valvula") == ["F-0012"]            # sin acentos
+    assert folios("AÑEJOS") == ["F-0012"]
+    assert sorted(folios("atlas copco")) == ["C-0001", "F-0012"]
+    assert folios("fernando zz1") == ["C-0001"]       # todas las palabras
+
+
+def test_ranks_folio_and_serie_matches_first(db):
+    report("F-0001", descripcion="revisar equipo SN77 del cliente")
+    report("F-0002", serie="SN77")
+    assert folios("SN77") == ["F-0002", "F-0001"]
+
+
+@pytest.mark.parametrize("term", ['"', "*", "-- ()", "NEAR(", "AND OR"])
+def test_user_input_never_breaks_match_syntax(db, term):
+    report("F-0001")
+    database.search_reports(term)
+
+
+def test_punctuation_only_finds_nothing(db):
+    report("F-0001")
+    assert folios("-- ..") == []
+
+
+def test_filters_apply_with_text(db):
+    report("F-0001", tipo_servicio="Preventivo", fecha="2026-01-10")
+    report("F-0002", tipo_servicio="Correctivo", fecha="2026-02-10")
+    report("F-0003", tipo_servicio="Correctivo", fecha="2026-03-10")
+    assert folios("acme", tipo_servicio="Correctivo") == ["F-0003", "F-0002"]
+    assert folios("acme", fecha_inicio="2026-02-01", fecha_fin="2026-02-28") == ["F-0002"]
+
+
+def test_triggers_follow_insert_replace_update_delete(db):
+    report("F-0001", cliente="Primero")
+    assert folios("primero") == ["F-0001"]
+
+    # save_report del mismo folio reemplaza la fila: el índice no guarda el texto viejo
+    report("F-0001", cliente="Segundo")
+    assert folios("primero") == []
+    assert folios("segundo") == ["F-0001"]
+
+    with database.get_db() as conn:
+        conn.execute("UPDATE reports SET cliente = 'Tercero' WHERE folio = 'F-0001'")
+    assert folios("segundo") == []
+    assert folios("tercero") == ["F-0001"]
+
+    with database.get_db() as conn:
+        conn.execute("DELETE FROM reports WHERE folio = 'F-0001'")
+    assert folios("tercero") == []
+    integrity_check()
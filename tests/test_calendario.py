@@ -0,0 +1,96 @@
+# Equipos del calendario, kits y catálogo de refacciones (rutas sobre database.py)
+import json
+
+import database
+
+EQUIPO = {"tipo_equipo": "Compresor", "modelo": "GA37", "marca": "Atlas Copco",
+          "potencia": "50", "frecuencia_meses": 3, "mes_inicio": 1, "anio_inicio": 2026}
+
+
+def report(folio, serie, fecha):
+    database.save_report(folio, fecha, "ACME", "Compresor", "GA37", serie, "Atlas Copco", "",
+                         "Preventivo", "2000 HORAS", "Fernando", "")
+
+
+def test_create_update_and_deactivate(admin_client):
+    client_id = database.create_client("ACME")
+    r = admin_client.post("/api/equipos_create", json={**EQUIPO, "serie": "AII1", "cliente_id": str(client_id)})
+    equipo_id = r.json["id"]
+    assert admin_client.post("/api/equipos_create", json={**EQUIPO, "serie": "AII1"}).status_code == 400
+
+    admin_client.put(f"/api/equipos_update/{equipo_id}",
+                     json={**EQUIPO, "cliente_id": client_id, "modelo": "GA45", "reiniciar_en_horas": "8000"})
+    equipo = database.get_calendar_equipment_by_id(equipo_id)
+    assert (equipo["modelo"], equipo["reiniciar_en_horas"], equipo["clasificacion"]) == ("GA45", 8000, "General")
+    assert [e["id"] for e in admin_client.get(f"/api/clientes/{client_id}/equipos").json["equipos"]] == [equipo_id]
+
+    admin_client.delete(f"/api/equipos_delete/{equipo_id}")
+    assert admin_client.get("/api/equipos_list").json == []
+    assert database.get_calendar_equipment_by_id(equipo_id)["activo"] == 0
+
+
+def test_equipment_routes_do_not_log_payloads(admin_client, capsys):
+    equipo_id = admin_client.post("/api/equipos_create", json={**EQUIPO, "serie": "AII1"}).json["id"]
+    admin_client.put(f"/api/equipos_update/{equipo_id}", json=EQUIPO)
+    assert capsys.readouterr().out == ""
+
+
+def test_kits_are_replaced_as_a_whole(admin_client):
+    equipo_id = database.create_calendar_equipment("AII1", **EQUIPO)
+    kits = [{"tipo_servicio": "2000 Horas", "refacciones_json": "[]"},
+            {"tipo_servicio": "4000 Horas", "refacciones_json": '["Filtro"]'}]
+    admin_client.post(f"/api/equipos/{equipo_id}/kits", json=kits)
+    assert [k["tipo_servicio"] for k in admin_client.get(f"/api/equipos/{equipo_id}/kits").json] == \
+        ["2000 Horas", "4000 Horas"]
+
+    # una lista inválida no deja el equipo sin kits
+    r = admin_client.post(f"/api/equipos/{equipo_id}/kits", json=[{"tipo_servicio": "6000 Horas"}])
+    assert r.status_code == 500
+    assert len(database.get_equipment_kits(equipo_id)) == 2
+
+    database.replace_equipment_kits(equipo_id, kits[1:])
+    assert database.get_kits_by_equipment() == {equipo_id: database.get_equipment_kits(equipo_id)}
+    assert len(database.get_equipment_kits(equipo_id)) == 1
+
+
+def test_month_calendar(admin_client):
+    equipo_id = database.create_calendar_equipment("AII1", **EQUIPO)
+    database.create_calendar_equipment("AII2", **{**EQUIPO, "mes_inicio": 2})
+    database.replace_equipment_kits(equipo_id, [{"tipo_servicio": "4000 Horas", "refacciones_json": '["Filtro"]'}])
+    report("F-0001", "AII1", "2026-04-10")
+    report("F-0002", "AII1", "2026-04-20")
+    report("F-0003", "AII1", "2026-05-01")
+
+    [equipo] = admin_client.get("/api/calendario/2026/4").json
+    assert equipo["serie"] == "AII1"
+    assert equipo["tipo_servicio_calculado"] == "4000 Horas"
+    assert equipo["refacciones_sugeridas"] == ["Filtro"]
+    assert (equipo["estatus_servicio"], equipo["folio_servicio"]) == ("REALIZADO", "F-0002")
+
+    [equipo] = admin_client.get("/api/calendario/2026/7").json
+    assert (equipo["tipo_servicio_calculado"], equipo["estatus_servicio"]) == ("6000 Horas", "PENDIENTE")
+    assert [e["serie"] for e in admin_client.get("/api/calendario/2026/5").json] == ["AII2"]
+
+    assert database.get_month_report_folios(2026, 12) == {}
+    report("F-0004", "AII1", "2026-12-31")
+    report("F-0005", "AII1", "2027-01-01")
+    assert database.get_month_report_folios(2026, 12) == {"AII1": "F-0004"}
+
+    history = admin_client.get(f"/api/equipos_historial/{equipo_id}").json
+    assert [h["folio"] for h in history] == ["F-0005", "F-0004", "F-0003", "F-0002", "F-0001"]
+
+
+def test_parts_catalog(admin_client):
+    equipo_id = database.create_calendar_equipment("AII1", **EQUIPO)
+    part = {"tipo_equipo": "Compresor", "tipo_servicio": "2000 Horas", "nombre_refaccion": "Filtro de aire",
+            "cantidad": 1, "unidad": "pz"}
+    assert admin_client.post("/api/refacciones_catalogo/create", json=part).json == {"success": True}
+    assert admin_client.post("/api/refacciones_catalogo/create", json=part).status_code == 400
+    database.create_catalog_part("Secador", "2000 Horas", "Filtro coalescente")
+
+    assert len(admin_client.get("/api/refacciones_catalogo").json) == 2
+    parts = admin_client.get(f"/api/equipos/{equipo_id}/refacciones").json
+    assert [p["nombre_refaccion"] for p in parts["catalogo"]] == ["Filtro de aire"] and parts["custom"] == []
+
+    admin_client.delete(f"/api/refacciones_catalogo/{parts['catalogo'][0]['id']}")
+    assert database.get_parts_catalog("Compresor") == []
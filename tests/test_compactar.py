@@ -0,0 +1,78 @@
+# Compactación de borradores enviados (compactar.py)
+import os
+
+import pytest
+
+import blobs
+import compactar
+import database
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x01" * 64
+PDF = b"%PDF-1.4 " + bytes(range(256)) * 400
+
+
+@pytest.fixture
+def archive_dir(db, monkeypatch):
+    monkeypatch.setattr(compactar, "PDF_ARCHIVE_DIR", str(db / "archivo"))
+    return db / "archivo"
+
+
+def draft(folio, days_ago, sent=True):
+    database.save_draft_report(folio, {"cliente": "ACME"}, foto1=PNG, firma_tecnico=PNG, pdf_preview=PDF)
+    if sent:
+        database.mark_draft_as_sent(folio)
+    with database.get_db() as conn:
+        conn.execute("UPDATE draft_reports SET updated_at = datetime('now', ?) WHERE folio = ?",
+                     (f"-{days_ago} days", folio))
+
+
+def test_compact_strips_images_and_archives_pdf(archive_dir):
+    draft("F-0001", 100)
+    draft("F-0002", 100, sent=False)
+    draft("F-0003", 5)
+    digest = blobs.ref_hash(database.get_draft_image("F-0001", "foto1_data"))
+
+    result = compactar.compact(image_days=30, pdf_days=90)
+    assert result["drafts_stripped"] == 1 and result["pdfs_archived"] == 1
+
+    assert database.get_draft_image("F-0001", "foto1_data") is None
+    # la misma imagen sigue en uso por los otros dos borradores
+    assert os.path.exists(blobs.blob_path(digest))
+    assert database.get_draft_image("F-0002", "foto1_data") is not None
+
+    meta = database.get_draft_meta("F-0001")
+    assert meta["pdf_size"] == len(PDF)
+    [path] = database.get_draft_pdf_archives()
+    assert path.startswith(str(archive_dir)) and path.endswith("F-0001.pdf.gz")
+    size, chunks = database.open_draft_pdf("F-0001")
+    assert size == len(PDF) and b"".join(chunks) == PDF
+
+    # otra vez: nada que hacer
+    assert compactar.compact(image_days=30, pdf_days=90) == {
+        "drafts_stripped": 0, "pdfs_archived": 0, "archives_removed": 0,
+        "pages_freed": 0, "pages_left": result["pages_left"]}
+
+
+def test_new_pdf_drops_the_archive(archive_dir):
+    draft("F-0001", 100)
+    compactar.compact(image_days=30, pdf_days=90)
+    [path] = database.get_draft_pdf_archives()
+
+    database.update_draft_pdf("F-0001", b"%PDF-nuevo")
+    assert database.get_draft_pdf("F-0001") == b"%PDF-nuevo"
+    assert compactar.sweep_archives() == 1
+    assert not os.path.exists(path)
+
+
+def test_pdf_changed_while_copying_is_not_archived(archive_dir, monkeypatch):
+    draft("F-0001", 100)
+    iter_pdf = compactar.iter_draft_pdf
+
+    def iter_and_rerender(folio):
+        yield from iter_pdf(folio)
+        database.update_draft_pdf(folio, b"%PDF-re-render", "otra")
+
+    monkeypatch.setattr(compactar, "iter_draft_pdf", iter_and_rerender)
+    assert compactar.compact(image_days=30, pdf_days=90)["pdfs_archived"] == 0
+    assert database.get_draft_pdf("F-0001") == b"%PDF-re-render"
+    assert not any(files for _, _, files in os.walk(archive_dir))
@@ -0,0 +1,48 @@
+# Una conexión SQLite por hilo con sus PRAGMAS (get_db / release_db)
+import threading
+
+import database
+
+
+def test_one_connection_per_thread(db):
+    conn = database.get_db()
+    assert database.get_db() is conn
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(database.get_db()))
+    t.start()
+    t.join()
+    assert other[0] is not conn
+
+
+def test_pragmas_are_applied(db):
+    conn = database.get_db()
+    pragma = lambda name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+    assert pragma("journal_mode") == "wal"
+    assert pragma("busy_timeout") == database.BUSY_TIMEOUT_MS
+    assert pragma("cache_size") == database.PRAGMAS["cache_size"]
+    assert pragma("auto_vacuum") == 2  # incremental
+
+
+def test_release_rolls_back_what_a_caller_left_open(db):
+    conn = database.get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("INSERT INTO clients (nombre) VALUES ('a medias')")
+    database.release_db()
+    assert not conn.in_transaction
+    assert database.get_db() is conn
+    assert conn.execute("SELECT COUNT(*) FROM clients WHERE nombre = 'a medias'").fetchone()[0] == 0
+
+
+def test_forked_process_opens_its_own(db, monkeypatch):
+    conn = database.get_db()
+    monkeypatch.setattr(database._local, "pid", -1)  # como si este fuera el hijo de un fork
+    assert database.get_db() is not conn
+
+
+def test_request_end_releases_the_connection(db):
+    import app as app_module
+
+    with app_module.app.app_context():
+        database.get_db().execute("BEGIN IMMEDIATE")
+    assert not database.get_db().in_transaction
@@ -0,0 +1,78 @@
+# Firmas en trazos (firmas.py)
+import io
+
+import pytest
+from PyPDF2 import PdfReader
+
+import bench_pdf
+import firmas
+from pdf_overlay import render_overlay_pdf
+from pdf_renderer import parse_report, render_report_pdf
+
+
+def svg(d="M10 20L30 40L50 20M60 60L70 70", box="200 100", width="2.5"):
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {box}" width="200" height="100">'
+            f'<path d="{d}" fill="none" stroke="#000" stroke-width="{width}"/></svg>').encode()
+
+
+def test_parse_signature():
+    assert firmas.parse_signature(svg()) == (
+        200.0, 100.0, 2.5, [[(10.0, 20.0), (30.0, 40.0), (50.0, 20.0)], [(60.0, 60.0), (70.0, 70.0)]])
+    # sin M inicial el primer punto abre un trazo; sin grosor, 2
+    assert firmas.parse_signature(svg(d="L1 2 L3,4", width="x"))[2:] == (2.0, [[(1.0, 2.0), (3.0, 4.0)]])
+
+
+@pytest.mark.parametrize("data", [
+    svg(d="M1.2.3 4L5 6"),
+    svg(d="M1 2L3 4..5"),
+    svg(box=". 100"),
+    svg(box="200 1.0.0"),
+    svg(width="1..2"),
+    svg(box="0 100"),
+    svg(d=""),
+    b'<svg viewBox="0 0 10 10"></svg>',
+    b"\x89PNG\r\n\x1a\n",
+    b"",
+    None,
+])
+def test_unreadable_signature_is_none(data):
+    assert firmas.parse_signature(data) is None
+
+
+class Recorder:
+    """Canvas de mentira: guarda el grosor y los puntos del path."""
+    def __init__(self):
+        self.points, self.line_width = [], None
+
+    def __getattr__(self, name):
+        return lambda *a, **k: None
+
+    def setLineWidth(self, w):
+        self.line_width = w
+
+    def beginPath(self):
+        rec = self
+        class Path:
+            def moveTo(self, x, y): rec.points.append(("M", x, y))
+            def lineTo(self, x, y): rec.points.append(("L", x, y))
+        return Path()
+
+
+def test_draw_signature_scales_flips_and_centers():
+    sig = firmas.parse_signature(svg(d="M0 0L200 100M100 50", box="200 100", width="2"))
+    c = Recorder()
+    firmas.draw_signature(c, sig, 10, 20, 400, 100, center=True)
+    # escala 1 (el alto manda), centrada en 400 de ancho, y hacia arriba
+    assert c.line_width == 2
+    assert c.points == [("M", 110, 120), ("L", 310, 20), ("M", 210, 70), ("L", 210, 70)]
+
+
+def test_malformed_signature_does_not_break_the_pdf(image_cache):
+    form = bench_pdf.build_form()
+    report = parse_report(form)
+    report["folio"] = form["folio"]
+    report["firma_tecnico"] = svg(d="M1.2.3 4L5 6")
+    report["firma_cliente"] = svg()
+
+    assert PdfReader(io.BytesIO(render_report_pdf(report))).pages
+    assert PdfReader(io.BytesIO(render_overlay_pdf(report))).pages
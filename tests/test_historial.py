@@ -0,0 +1,112 @@
+# Historial paginado por cursor (get_reports_page, /api/historial)
+import pytest
+
+import database
+
+
+@pytest.fixture
+def reports(db):
+    # 25 reportes con el mismo created_at: el id desempata
+    for i in range(25):
+        database.save_report(f"F-{i:04d}", "2026-05-01", f"Cliente {i % 3}", "Compresor", "GA", f"SN{i}",
+                             "", "", "Correctivo" if i % 2 else "Preventivo", f"servicio {i}", "fernando", "")
+    return [r["folio"] for r in database.search_reports()]
+
+
+def walk(limit, **filters):
+    folios, cursor, pages = [], None, 0
+    while True:
+        page, cursor = database.get_reports_page(**filters, cursor=cursor, limit=limit)
+        folios += [r["folio"] for r in page]
+        pages += 1
+        if cursor is None:
+            return folios, pages
+
+
+def test_pages_cover_history_newest_first(reports):
+    folios, pages = walk(7)
+    assert folios == [f"F-{i:04d}" for i in reversed(range(25))]
+    assert pages == 4
+
+
+@pytest.mark.parametrize("filters", [
+    {"tipo_servicio": "Correctivo"},
+    {"search_term": "cliente"},
+    {"search_term": "servicio 1"},
+    {"search_term": "cliente 2", "tipo_servicio": "Preventivo"},
+])
+def test_pages_match_search_reports(reports, filters):
+    folios, _ = walk(4, **filters)
+    assert folios == [r["folio"] for r in database.search_reports(**filters)]
+    assert len(set(folios)) == len(folios)
+
+
+def test_last_full_page_has_no_next(reports):
+    page, cursor = database.get_reports_page(limit=25)
+    assert len(page) == 25 and cursor is None
+
+
+def test_api_cursor_round_trip(admin_client, reports):
+    first = admin_client.get("/api/historial?limit=10&tipo_servicio=Preventivo").json
+    second = admin_client.get("/api/historial", query_string={
+        "limit": 10, "tipo_servicio": "Preventivo", "cursor": first["next"]}).json
+    folios = [r["folio"] for r in first["reports"] + second["reports"]]
+    assert folios == [r["folio"] for r in database.search_reports(tipo_servicio="Preventivo")]
+    assert second["next"] is None
+    assert "score" not in first["reports"][0]
+
+
+def test_api_ranked_cursor_round_trip(admin_client, reports):
+    expected = [r["folio"] for r in database.search_reports("cliente")]
+    folios, cursor = [], None
+    while True:
+        body = admin_client.get("/api/historial", query_string={
+            "search": "cliente", "limit": 6, "cursor": cursor or ""}).json
+        folios += [r["folio"] for r in body["reports"]]
+        cursor = body["next"]
+        if not cursor:
+            break
+    assert folios == expected
+
+
+@pytest.mark.parametrize("cursor", [
+    "x|y", "sin-separador", "2026-05-01 00:00:00|abc", "|",
+    "2026-05-01 00:00:00|3",          # sin etiqueta
+    "fecha:x|3", "fecha:|3", "rank:nan|3", "rank:-1.5|3", "otro:2026-05-01 00:00:00|3",
+])
+def test_api_bad_cursor_is_400(admin_client, reports, cursor):
+    r = admin_client.get("/api/historial", query_string={"cursor": cursor})
+    assert r.status_code == 400
+
+
+def test_cursor_of_the_other_order_is_400(admin_client, reports):
+    date_cursor = admin_client.get("/api/historial?limit=5").json["next"]
+    rank_cursor = admin_client.get("/api/historial?limit=5&search=cliente").json["next"]
+    assert date_cursor.startswith("fecha:") and rank_cursor.startswith("rank:")
+
+    r = admin_client.get("/api/historial", query_string={"search": "cliente", "cursor": date_cursor})
+    assert r.status_code == 400
+    r = admin_client.get("/api/historial", query_string={"cursor": rank_cursor})
+    assert r.status_code == 400
+    # con filtros pero sin texto también se pagina por fecha
+    with pytest.raises(ValueError):
+        database.get_reports_page(tipo_servicio="Preventivo", cursor=rank_cursor)
+
+
+def test_api_limit_is_capped_and_admin_only(admin_client, client, reports):
+    assert len(admin_client.get("/api/historial?limit=1000").json["reports"]) == 25
+    assert len(admin_client.get("/api/historial?limit=0").json["reports"]) == 1
+    assert client.get("/api/historial").status_code != 200
+
+
+def test_view_renders_first_page_only(admin_client, reports):
+    html = admin_client.get("/admin/historial").get_data(as_text=True)
+    assert html.count("<tr>") == 1 + 25
+    assert 'data-next=""' in html
+
+    for i in range(25, 25 + database.REPORTS_PAGE_SIZE):
+        database.save_report(f"F-{i:04d}", "2026-05-01", "ACME", "Compresor", "", "", "", "",
+                             "Preventivo", "", "fernando", "")
+    html = admin_client.get("/admin/historial").get_data(as_text=True)
+    assert html.count("<tr>") == 1 + database.REPORTS_PAGE_SIZE
+    assert 'data-next=""' not in html
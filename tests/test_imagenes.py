@@ -0,0 +1,93 @@
+# Versión de impresión y miniatura de las fotos al llegar (imagenes.py)
+import io
+import os
+
+from PIL import Image
+
+import imagenes
+from pdf_renderer import PHOTO_W, PHOTO_H
+
+
+def photo(w=2400, h=1600, fmt="JPEG"):
+    out = io.BytesIO()
+    Image.new("RGB", (w, h), (200, 30, 30)).save(out, format=fmt)
+    return out.getvalue()
+
+
+def size_of(data):
+    return Image.open(io.BytesIO(data)).size
+
+
+def test_ingest_writes_print_version_and_thumbnail(db):
+    data = photo()
+    imagenes.ingest_photo(lambda: data, PHOTO_W, PHOTO_H).result(timeout=30)
+
+    # (el pool es compartido: puede haber otras fotos de pruebas anteriores)
+    digest = imagenes.content_hash(data)
+    thumbs = [name for name in os.listdir(imagenes.THUMB_CACHE_DIR) if name.startswith(digest)]
+    prints = [name for name in os.listdir(imagenes.PRINT_CACHE_DIR) if name.startswith(digest)]
+    assert len(thumbs) == 1 and len(prints) == 1
+
+    # las siguientes lecturas salen de la caché, con el mismo resultado
+    assert imagenes.thumbnail(data) == open(os.path.join(imagenes.THUMB_CACHE_DIR, thumbs[0]), "rb").read()
+    assert max(size_of(imagenes.thumbnail(data))) == imagenes.THUMB_SIDE
+
+
+def test_print_version_fits_frame_at_print_dpi(db):
+    out = imagenes.prepare_print_image(photo(fmt="PNG"), PHOTO_W, PHOTO_H)
+    w, h = size_of(out)
+    max_w, max_h = imagenes._target_size(PHOTO_W, PHOTO_H, imagenes.PRINT_DPI)
+    assert out[:2] == b"\xff\xd8"
+    assert w <= max_w and h <= max_h
+
+
+def test_unreadable_image(db):
+    assert imagenes.thumbnail(b"no es imagen") is None
+    assert imagenes.prepare_print_image(b"no es imagen", PHOTO_W, PHOTO_H) == b"no es imagen"
+
+
+def test_draft_image_thumbnail_route(client):
+    import base64
+    data = photo()
+    ref = client.post("/api/draft_images", json={
+        "data": "data:image/jpeg;base64," + base64.b64encode(data).decode(), "field": "foto1_data"}).json["ref"]
+    assert client.post("/api/autosave_draft", json={
+        "folio": "F-0001", "base_version": 0, "changes": {"foto1_data": ref}}).status_code == 200
+
+    r = client.get("/api/draft_image/F-0001/foto1?size=thumb")
+    assert r.status_code == 200 and r.mimetype == "image/jpeg"
+    assert max(size_of(r.data)) == imagenes.THUMB_SIDE
+    assert client.get("/api/draft_image/F-0001/foto1?size=thumb",
+                      headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+
+def test_print_version_is_cached_on_disk_and_in_memory(image_cache):
+    data = photo(2000, 1500)  # no es la de otras pruebas: su ingesta en segundo plano no la llena
+    out = imagenes.prepare_print_image(data, PHOTO_W, PHOTO_H)
+    [name] = os.listdir(imagenes.PRINT_CACHE_DIR)
+    assert name.startswith(imagenes.content_hash(data))
+
+    # en memoria: ni se lee ni se reescribe el archivo
+    os.remove(os.path.join(imagenes.PRINT_CACHE_DIR, name))
+    assert imagenes.prepare_print_image(data, PHOTO_W, PHOTO_H) is out
+    assert not os.listdir(imagenes.PRINT_CACHE_DIR)
+
+    # sin la copia en memoria sale del archivo
+    imagenes._memory.clear()
+    imagenes._write_cache_file(os.path.join(imagenes.PRINT_CACHE_DIR, name), b"del disco")
+    assert imagenes.prepare_print_image(data, PHOTO_W, PHOTO_H) == b"del disco"
+
+
+def test_print_version_applies_exif_rotation_and_flattens_alpha(image_cache):
+    img = Image.new("RGB", (1200, 600), (0, 0, 255))
+    exif = img.getexif()
+    exif[0x0112] = 6  # rotada 90° en la cámara
+    out = io.BytesIO()
+    img.save(out, format="JPEG", exif=exif)
+    w, h = size_of(imagenes.prepare_print_image(out.getvalue(), 1000, 1000, dpi=72))
+    assert h > w
+
+    out = io.BytesIO()
+    Image.new("RGBA", (400, 400), (0, 0, 0, 0)).save(out, format="PNG")
+    flat = Image.open(io.BytesIO(imagenes.prepare_print_image(out.getvalue(), 100, 100)))
+    assert flat.mode == "RGB" and min(flat.getpixel((10, 10))) > 240
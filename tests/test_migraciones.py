@@ -0,0 +1,127 @@
+# Migraciones del esquema con PRAGMA user_version (init_db)
+import sqlite3
+
+import pytest
+
+import database
+from conftest import close_db
+
+# Lo que dejaba el init_db de las primeras versiones: sin user_version, sin
+# las columnas agregadas después y sin las tablas nuevas
+LEGACY_SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL,
+                    nombre TEXT NOT NULL, prefijo TEXT NOT NULL, role TEXT NOT NULL DEFAULT 'technician',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE clients (id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, contacto TEXT, telefono TEXT,
+                      email TEXT, direccion TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE client_equipment (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER NOT NULL,
+                               tipo_equipo TEXT NOT NULL, modelo TEXT, serie TEXT, marca TEXT, potencia TEXT,
+                               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE reports (id INTEGER PRIMARY KEY AUTOINCREMENT, folio TEXT UNIQUE NOT NULL, fecha DATE NOT NULL,
+                      cliente TEXT NOT NULL, tipo_equipo TEXT NOT NULL, modelo TEXT, serie TEXT, marca TEXT,
+                      potencia TEXT, tipo_servicio TEXT NOT NULL, descripcion_servicio TEXT, tecnico TEXT NOT NULL,
+                      localidad TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE folios (prefijo TEXT PRIMARY KEY, ultimo_numero INTEGER DEFAULT 0);
+CREATE TABLE draft_reports (folio TEXT PRIMARY KEY, form_data TEXT NOT NULL, foto1_data TEXT, foto2_data TEXT,
+                            foto3_data TEXT, foto4_data TEXT, firma_tecnico_data TEXT, firma_cliente_data TEXT,
+                            pdf_preview BLOB, status TEXT DEFAULT 'draft',
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+INSERT INTO users (username, password, nombre, prefijo, role) VALUES ('jefe', 'x', 'Jefe', 'J', 'admin');
+INSERT INTO reports (folio, fecha, cliente, tipo_equipo, serie, tipo_servicio, descripcion_servicio, tecnico)
+VALUES ('J-0001', '2025-01-01', 'Cliente Viejo', 'Compresor', 'SER1', 'Preventivo', 'válvula', 'Jefe');
+INSERT INTO draft_reports (folio, form_data) VALUES ('J-0001', '{}');
+"""
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    path = tmp_path / "inair_reportes.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.close()
+    monkeypatch.setattr(database, "DB_NAME", str(path))
+    close_db()
+    yield path
+    close_db()
+
+
+def columns(table):
+    return {row[1] for row in database.get_db().execute(f"PRAGMA table_info({table})")}
+
+
+def statements(fn):
+    """Sentencias SQL que ejecuta fn() en la conexión del hilo."""
+    seen = []
+    conn = database.get_db()
+    conn.set_trace_callback(seen.append)
+    try:
+        fn()
+    finally:
+        conn.set_trace_callback(None)
+    return seen
+
+
+def test_legacy_database_migrates_once(legacy_db):
+    assert database.get_schema_version() == 0
+
+    database.init_db()
+    assert database.get_schema_version() == database.SCHEMA_VERSION
+    assert {"ultimo_servicio", "kit_16000"} <= columns("client_equipment")
+    assert {"pdf_cache_key", "version", "pdf_archive", "pdf_archive_size"} <= columns("draft_reports")
+    assert "activo" in columns("equipos_calendario")
+    assert database.get_draft_meta("J-0001")["version"] == 0
+    # el historial que ya había queda en el índice de texto
+    assert [r["folio"] for r in database.search_reports("valvula")] == ["J-0001"]
+    # ya tenía usuarios: no se crean los de fábrica
+    assert [u["username"] for u in database.get_all_users()] == ["jefe"]
+
+    # segunda vez: una sola lectura del pragma
+    assert statements(database.init_db) == ["PRAGMA user_version"]
+    assert database.get_schema_version() == database.SCHEMA_VERSION
+
+
+def test_migrations_are_idempotent_from_version_0(legacy_db):
+    database.init_db()
+    database.save_report("J-0002", "2026-01-01", "Nuevo", "Compresor", "", "SER2", "", "", "Preventivo",
+                         "", "Jefe", "")
+
+    # una base que ya tiene todo el esquema pero user_version en 0 (p. ej. copiada de otra)
+    database.get_db().execute("PRAGMA user_version = 0")
+    database.init_db()
+    database.init_db()
+
+    assert database.get_schema_version() == database.SCHEMA_VERSION
+    assert len(database.get_all_users()) == 1
+    assert [r["folio"] for r in database.search_reports("nuevo")] == ["J-0002"]
+    assert sorted(r["folio"] for r in database.search_reports("ser")) == ["J-0001", "J-0002"]
+    with database.get_db() as conn:
+        conn.execute("INSERT INTO reports_fts (reports_fts) VALUES ('integrity-check')")
+
+
+def test_new_database_gets_default_users(db):
+    assert database.get_schema_version() == database.SCHEMA_VERSION
+    assert {u["username"] for u in database.get_all_users()} >= {"admin", "fernando"}
+
+
+def test_newer_schema_is_left_alone(db):
+    database.get_db().execute(f"PRAGMA user_version = {database.SCHEMA_VERSION + 5}")
+    assert statements(database.init_db) == ["PRAGMA user_version"]
+    assert database.get_schema_version() == database.SCHEMA_VERSION + 5
+
+
+def test_failed_migration_rolls_back_everything(legacy_db, monkeypatch):
+    def broken(cursor):
+        cursor.execute("CREATE TABLE nueva (id INTEGER)")
+        raise RuntimeError("migración rota")
+
+    migrations = database.MIGRATIONS + (broken,)
+    monkeypatch.setattr(database, "MIGRATIONS", migrations)
+    monkeypatch.setattr(database, "SCHEMA_VERSION", len(migrations))
+
+    with pytest.raises(RuntimeError):
+        database.init_db()
+    assert database.get_schema_version() == 0
+    assert "version" not in columns("draft_reports")
+    assert not database.get_db().execute("SELECT 1 FROM sqlite_master WHERE name = 'nueva'").fetchone()
+    assert not database.get_db().in_transaction
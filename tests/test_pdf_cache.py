@@ -0,0 +1,61 @@
+# Clave de caché del PDF (report_cache_key): mismo contenido, mismo PDF
+import app as app_module
+import bench_pdf
+import database
+import pdf_queue
+import pdf_renderer
+from pdf_renderer import parse_report, report_cache_key
+
+
+def key(form):
+    return report_cache_key(parse_report(form))
+
+
+def test_key_depends_only_on_report_content(monkeypatch):
+    form = bench_pdf.build_form(fotos=1)
+    base = key(form)
+    assert key(dict(form)) == base
+
+    assert key({**form, "observaciones": "Otra cosa"}) != base
+    assert key({**form, "foto1_data": bench_pdf._photo(9)}) != base
+    # un campo que el reporte no usa no cuenta
+    assert key({**form, "campo_ajeno": "x"}) == base
+
+    monkeypatch.setattr(pdf_renderer, "RENDERER_VERSION", "otro")
+    assert key(form) != base
+    monkeypatch.undo()
+    monkeypatch.setattr(pdf_renderer, "RENDER_MODE", "overlay")
+    assert key(form) != base
+
+
+def test_generar_pdf_renders_only_when_the_key_changes(client, monkeypatch):
+    renders = []
+    spool = app_module.spool_report_pdf
+    monkeypatch.setattr(app_module, "spool_report_pdf", lambda r: renders.append(r["folio"]) or spool(r))
+
+    form = bench_pdf.build_form()
+    assert client.post("/generar_pdf", data=form).status_code == 302
+    stored_key = database.get_draft_pdf_cache_key(form["folio"])
+    assert stored_key == key(form)
+
+    client.post("/generar_pdf", data=form)
+    assert renders == [form["folio"]]
+
+    client.post("/generar_pdf", data={**form, "observaciones": "Otra cosa"})
+    assert len(renders) == 2
+    assert database.get_draft_pdf_cache_key(form["folio"]) not in (None, stored_key)
+
+
+def test_editing_the_draft_invalidates_the_key(db):
+    form = bench_pdf.build_form()
+    database.save_draft_report(form["folio"], form)
+    assert pdf_queue.render_draft(form["folio"])
+    draft = database.get_draft_meta(form["folio"])
+    assert draft["pdf_cache_key"] == key(form)
+
+    # sin cambios el worker no vuelve a renderizar
+    assert pdf_queue.render_draft(form["folio"]) is None
+
+    database.apply_draft_patch(form["folio"], draft["version"], {"observaciones": "Otra cosa"})
+    assert database.get_draft_pdf_cache_key(form["folio"]) is None
+    assert pdf_queue.render_draft(form["folio"])
@@ -0,0 +1,56 @@
+# Modo overlay: valores sobre las hojas base de formatos/ (pdf_overlay.py)
+import io
+
+import pytest
+from PyPDF2 import PdfReader
+
+import bench_pdf
+import pdf_overlay
+import pdf_renderer
+from pdf_renderer import parse_report, render_report_pdf
+
+CORRECTIVO = dict(tipo_servicio="Correctivo", descripcion="Correctivo")
+
+
+def report(**case):
+    form = bench_pdf.build_form(**case)
+    r = parse_report(form)
+    r["folio"] = form["folio"]
+    return r
+
+
+def stamps_overlay(pdf):
+    page = PdfReader(io.BytesIO(pdf)).pages[0]
+    return pdf_overlay.OVERLAY_NAME in page["/Resources"]["/XObject"]
+
+
+@pytest.mark.parametrize("case", [dict(), CORRECTIVO])
+def test_report_that_fits_goes_on_the_base_sheet(image_cache, case):
+    pdf = pdf_overlay.render_overlay_pdf(report(**case))
+    reader = PdfReader(io.BytesIO(pdf))
+    assert len(reader.pages) == 1 and stamps_overlay(pdf)
+
+    # la hoja base en caché sigue sin la capa
+    base = pdf_overlay._base_page("preventivo" if not case else "correctivo")
+    assert pdf_overlay.OVERLAY_NAME not in base["/Resources"].get("/XObject", {})
+
+
+@pytest.mark.parametrize("case", [
+    dict(fotos=1),
+    dict(tipo_servicio="Bitácora", descripcion="Bitácora"),
+    dict(tipo_equipo=bench_pdf.SECADOR),
+    dict(obs_repeat=400),
+])
+def test_report_that_does_not_fit_is_none(image_cache, case):
+    out = io.BytesIO()
+    assert pdf_overlay.render_overlay_pdf(report(**case), out) is None
+    assert out.getvalue() == b""
+
+
+def test_overlay_mode_falls_back_to_canvas(image_cache, monkeypatch):
+    monkeypatch.setattr(pdf_renderer, "RENDER_MODE", "overlay")
+    assert stamps_overlay(render_report_pdf(report()))
+
+    pdf = render_report_pdf(report(fotos=1))
+    assert not stamps_overlay(pdf)
+    assert b"/FormXob." + pdf_renderer.PAGE_FURNITURE_FORM.encode() in pdf
@@ -0,0 +1,45 @@
+# PDF del borrador servido por pedazos (open_draft_pdf, /api/pdf_preview)
+import io
+
+import database
+
+PDF_A = b"%PDF-1.4 A" * 20000
+PDF_B = b"%PDF-1.4 B" * 30000
+
+
+def test_size_and_bytes_come_from_the_same_snapshot(db):
+    database.save_draft_report("F-0001", {}, pdf_preview=PDF_A)
+    size, chunks = database.open_draft_pdf("F-0001", chunk_size=4096)
+
+    # un worker guarda otro render mientras la respuesta va a medias
+    first = next(chunks)
+    database.update_draft_pdf("F-0001", io.BytesIO(PDF_B), "otra")
+    body = first + b"".join(chunks)
+    assert size == len(body) and body == PDF_A
+
+    size, chunks = database.open_draft_pdf("F-0001")
+    assert size == len(PDF_B) and b"".join(chunks) == PDF_B
+
+
+def test_no_pdf(db):
+    assert database.open_draft_pdf("F-0001") is None
+    database.save_draft_report("F-0001", {})
+    assert database.open_draft_pdf("F-0001") is None
+    assert database.get_draft_pdf("F-0001") is None
+
+
+def test_preview_route_streams_with_matching_length(client):
+    database.save_draft_report("F-0001", {"tipo_servicio": "Preventivo", "descripcion_servicio": "Compresión"},
+                               pdf_preview=PDF_A)
+    r = client.get("/api/pdf_preview/F-0001")
+    assert r.status_code == 200 and r.mimetype == "application/pdf"
+    assert r.content_length == len(r.data) and r.data == PDF_A
+    assert r.headers["Content-Disposition"].startswith("inline")
+
+    r = client.get("/api/pdf_preview/F-0001?download=true")
+    disposition = r.headers["Content-Disposition"]
+    assert disposition.startswith("attachment")
+    assert "filename=Preventivo_Compresion_F-0001.pdf" in disposition
+    assert "filename*=UTF-8''Preventivo_Compresi%C3%B3n_F-0001.pdf" in disposition
+
+    assert client.get("/api/pdf_preview/F-0002").status_code == 404
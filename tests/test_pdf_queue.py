@@ -0,0 +1,80 @@
+# Cola de PDFs (pdf_jobs y pdf_queue.py)
+import threading
+import time
+
+import bench_pdf
+import database
+import pdf_queue
+
+
+def test_enqueue_reuses_pending_job(db):
+    job_id = database.enqueue_pdf_job("F-0001")
+    assert database.enqueue_pdf_job("F-0001") == job_id
+    assert database.enqueue_pdf_job("F-0002") != job_id
+
+    # ya tomado por un worker: el siguiente cambio necesita otro render
+    assert database.claim_next_pdf_job()["id"] == job_id
+    assert database.get_pdf_job(job_id)["status"] == "running"
+    assert database.enqueue_pdf_job("F-0001") not in (job_id, None)
+
+
+def test_enqueue_waits_for_a_concurrent_enqueue(db):
+    ready, go, ids = threading.Event(), threading.Event(), []
+
+    def enqueue():
+        database.get_db()  # conexión del hilo ya abierta
+        ready.set()
+        go.wait()
+        ids.append(database.enqueue_pdf_job("F-0001"))
+
+    t = threading.Thread(target=enqueue)
+    t.start()
+    ready.wait()
+
+    # otra petición del mismo folio encoló y aún no confirma
+    other = database._connect()
+    other.execute("BEGIN IMMEDIATE")
+    other_id = other.execute("INSERT INTO pdf_jobs (folio) VALUES ('F-0001')").lastrowid
+    go.set()
+    time.sleep(0.2)
+    other.commit()
+    other.close()
+    t.join()
+
+    assert ids == [other_id]
+    with database.get_db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM pdf_jobs WHERE folio = 'F-0001'").fetchone()[0] == 1
+
+
+def test_worker_renders_and_finishes_job(db):
+    form = bench_pdf.build_form()
+    database.save_draft_report(form["folio"], form)
+    job_id = database.enqueue_pdf_job(form["folio"])
+
+    assert pdf_queue.run_next_job()
+    assert database.get_pdf_job(job_id)["status"] == "done"
+    assert database.get_draft_pdf(form["folio"]).startswith(b"%PDF")
+    assert database.get_report_by_folio(form["folio"])["cliente"] == form["cliente"]
+    assert not pdf_queue.run_next_job()
+
+
+def test_failed_render_marks_job_as_error(db):
+    job_id = database.enqueue_pdf_job("NO-EXISTE")
+    assert pdf_queue.run_next_job()
+    job = database.get_pdf_job(job_id)
+    assert job["status"] == "error" and "NO-EXISTE" in job["error"]
+
+
+def test_job_api(client):
+    form = bench_pdf.build_form()
+    r = client.post("/api/pdf_jobs", data=form)
+    assert r.status_code == 202 and r.json["status"] == "pending"
+    status_url = r.json["status_url"]
+    assert client.get(status_url).json["pdf_url"] is None
+
+    pdf_queue.run_next_job()
+    job = client.get(status_url).json
+    assert job["status"] == "done"
+    assert client.get(job["pdf_url"]).data.startswith(b"%PDF")
+
+    assert client.get("/api/pdf_jobs/999").status_code == 404
@@ -0,0 +1,155 @@
+# Render del reporte fuera de Flask (pdf_renderer.py)
+import io
+import random
+
+from PyPDF2 import PdfReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from werkzeug.datastructures import FileStorage
+
+import bench_pdf
+import pdf_renderer
+from pdf_renderer import parse_report, render_report_pdf, spool_report_pdf
+
+
+def report(**case):
+    form = bench_pdf.build_form(**case)
+    r = parse_report(form)
+    r["folio"] = form["folio"]
+    return r
+
+
+def test_render_without_request_context(image_cache):
+    pdf = render_report_pdf(report(fotos=1))
+    assert pdf.startswith(b"%PDF")
+    text = PdfReader(io.BytesIO(pdf)).pages[0].extract_text()
+    assert "BENCH-0001" in text and "Cliente de prueba SA de CV" in text
+
+
+def test_render_to_file_and_spool(image_cache):
+    r = report()
+    out = io.BytesIO()
+    assert render_report_pdf(r, out) is out
+    pages = len(PdfReader(out).pages)
+
+    with spool_report_pdf(r) as f:
+        assert f.tell() == 0
+        assert f.read(5) == b"%PDF-"
+        f.seek(0)
+        assert len(PdfReader(f).pages) == pages
+
+
+def test_parse_report_prefers_uploaded_file(image_cache):
+    form = bench_pdf.build_form(fotos=1)
+    upload = FileStorage(io.BytesIO(b"subida"), filename="foto.jpg")
+    r = parse_report(form, {"foto1": upload})
+    assert [f["data"] for f in r["fotos"]] == [b"subida"]
+
+    # sin archivo: el base64 del borrador
+    assert parse_report(form)["fotos"][0]["data"].startswith(b"\xff\xd8")
+
+
+def test_page_furniture_is_one_xobject_on_every_page(image_cache):
+    reader = PdfReader(io.BytesIO(render_report_pdf(report(obs_repeat=400))))
+    assert len(reader.pages) > 1
+
+    name = "/FormXob." + pdf_renderer.PAGE_FURNITURE_FORM
+    refs = {page["/Resources"]["/XObject"].raw_get(name).idnum for page in reader.pages}
+    assert len(refs) == 1
+    for page in reader.pages:
+        assert f"{name} Do".encode() in page.get_contents().get_data()
+
+
+def wrap_by_measuring(text, max_w, font, size):
+    """_wrap_text_force como era antes: stringWidth de cada candidato."""
+    if not text: return [""] if text == "" else []
+    lines, line = [], ""
+    w = lambda s: stringWidth(s, font, size)
+    for word in text.split(" "):
+        cand = (line + " " + word).strip()
+        if w(cand) <= max_w:
+            line = cand
+        else:
+            if line: lines.append(line); line = ""
+            buf = ""
+            for ch in word:
+                if w(buf + ch) <= max_w:
+                    buf += ch
+                else:
+                    lines.append(buf); buf = ch
+            line = buf
+    if line: lines.append(line)
+    return lines
+
+
+def test_wrap_matches_measuring_every_candidate():
+    rnd = random.Random(4)
+    alphabet = "aeioumwxyzáéíóúñÑ  ,.-\t\n" + "W" * 3
+    for _ in range(500):
+        text = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 120)))
+        text += " " + "M" * rnd.randint(0, 40)  # palabras más anchas que la línea
+        max_w = rnd.choice([20, 57.5, 120, 300])
+        font, size = rnd.choice([("Helvetica", 9), ("Helvetica-Bold", 7.6)])
+        assert pdf_renderer._wrap_text_force(text, max_w, font, size) == wrap_by_measuring(text, max_w, font, size)
+    assert pdf_renderer._wrap_text_force("", 50) == [""]
+    assert pdf_renderer._wrap_text_force(None, 50) == []
+
+
+def test_wrap_result_is_not_shared_between_callers():
+    lines = pdf_renderer._wrap_text_force("uno dos tres cuatro", 30)
+    lines.append("x")
+    assert "x" not in pdf_renderer._wrap_text_force("uno dos tres cuatro", 30)
+
+
+def test_ellipsize_keeps_longest_prefix_that_fits():
+    text = "Vista general del compresor con tablero abierto"
+    out = pdf_renderer._ellipsize(text, 80, "Helvetica", 8.2)
+    assert out.endswith("…") and text.startswith(out[:-1])
+    assert stringWidth(out, "Helvetica", 8.2) <= 80
+    assert stringWidth(text[:len(out)] + "…", "Helvetica", 8.2) > 80
+    assert pdf_renderer._ellipsize(text, 1000, "Helvetica", 8.2) == text
+    assert pdf_renderer._ellipsize("  ", 10) == "N/A"
+
+
+def rows(n, h=20):
+    return [(h, None)] * n
+
+
+def plan(*sections):
+    return [[(s["title"], i, j, cont) for s, i, j, cont, y, box_h in page]
+            for page in pdf_renderer._plan_pages(list(sections))]
+
+
+def test_plan_splits_long_section_without_widows_or_orphans():
+    avail = pdf_renderer.PAGE_TOP - pdf_renderer.PAGE_BOTTOM
+    per_page = int((avail - pdf_renderer.SECTION_HEAD - pdf_renderer.SECTION_PAD) // 20)
+
+    assert plan(pdf_renderer._section("A", rows(3))) == [[("A", 0, 3, False)]]
+
+    # una línea de más pasaría sola a la siguiente página: se lleva `keep`
+    pages = plan(pdf_renderer._section("A", rows(per_page + 1)))
+    assert pages == [[("A", 0, per_page - 1, False)], [("A", per_page - 1, per_page + 1, True)]]
+
+
+def test_plan_moves_section_whose_first_rows_do_not_fit():
+    avail = pdf_renderer.PAGE_TOP - pdf_renderer.PAGE_BOTTOM
+    filler = pdf_renderer._section("A", [(avail - 120, None)], keep=1)  # deja lugar para 2 renglones
+    pages = plan(filler, pdf_renderer._section("B", rows(5), keep=3))
+    assert pages == [[("A", 0, 1, False)], [("B", 0, 5, False)]]
+
+    # con keep=2 el título y dos renglones sí se quedan al pie
+    pages = plan(filler, pdf_renderer._section("B", rows(5), keep=2))
+    assert pages == [[("A", 0, 1, False), ("B", 0, 2, False)], [("B", 2, 5, True)]]
+
+
+def test_plan_places_row_taller_than_page_alone():
+    avail = pdf_renderer.PAGE_TOP - pdf_renderer.PAGE_BOTTOM
+    pages = plan(pdf_renderer._section("A", rows(1)), pdf_renderer._section("B", [(avail * 2, None)], keep=1))
+    assert pages == [[("A", 0, 1, False)], [("B", 0, 1, False)]]
+
+
+def test_long_report_pages_follow_the_plan(image_cache):
+    reader = PdfReader(io.BytesIO(render_report_pdf(report(obs_repeat=400))))
+    texts = [page.extract_text() for page in reader.pages]
+    assert len(texts) > 2
+    assert all("BENCH-0001" in t for t in texts)
+    assert any("(continuación)" in t for t in texts[1:])
@@ -0,0 +1,62 @@
+# Subidas por pedazos (/api/uploads)
+import hashlib
+
+import pytest
+
+import database
+
+DATA = bytes(range(256)) * 2048  # 512 KiB, dos pedazos de UPLOAD_CHUNK_BYTES
+
+
+@pytest.fixture
+def upload(client):
+    r = client.post("/api/uploads", json={
+        "folio": "F-0001", "slot": "foto1", "size": len(DATA), "sha256": hashlib.sha256(DATA).hexdigest()})
+    assert r.status_code == 200
+    return r.json
+
+
+def put(client, upload, offset, chunk):
+    return client.put(f"/api/uploads/{upload['upload_id']}?offset={offset}", data=chunk,
+                      content_type="application/octet-stream")
+
+
+def test_offset_mismatch_is_409_with_server_offset(client, upload):
+    size = upload["chunk_size"]
+    assert put(client, upload, 0, DATA[:size]).json == {"offset": size}
+
+    # el cliente cree que va en 0 (reintento) o se adelanta: el servidor dice dónde sigue
+    for offset in (0, size * 2, -1):
+        r = put(client, upload, offset, DATA[size:])
+        assert r.status_code == 409
+        assert r.json == {"error": "offset_mismatch", "offset": size}
+
+    # sin ?offset tampoco se escribe
+    r = client.put(f"/api/uploads/{upload['upload_id']}", data=DATA[size:])
+    assert r.status_code == 409
+
+    assert client.get(f"/api/uploads/{upload['upload_id']}").json["offset"] == size
+
+
+def test_resume_and_finalize(client, upload):
+    size = upload["chunk_size"]
+    put(client, upload, 0, DATA[:size])
+
+    # se reanuda con el mismo archivo: misma subida, mismo offset
+    again = client.post("/api/uploads", json={
+        "folio": "F-0001", "slot": "foto1", "size": len(DATA), "sha256": hashlib.sha256(DATA).hexdigest()}).json
+    assert again["upload_id"] == upload["upload_id"] and again["offset"] == size
+
+    assert put(client, upload, size, DATA[size:]).json == {"offset": len(DATA)}
+    r = client.post(f"/api/uploads/{upload['upload_id']}/finalize", json={})
+    assert r.status_code == 200
+    assert database.get_draft_image("F-0001", "foto1_data") == r.json["ref"]
+    assert client.get("/api/draft_image/F-0001/foto1").data == DATA
+
+    # cerrada: ni pedazos ni otro finalize
+    assert put(client, upload, len(DATA), b"x").status_code == 409
+    assert client.post(f"/api/uploads/{upload['upload_id']}/finalize", json={}).status_code == 409
+
+
+def test_chunk_past_declared_size_is_400(client, upload):
+    assert put(client, upload, 0, DATA + b"extra").status_code == 400